@@ -0,0 +1,327 @@
+import os
+import json
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import response_cache
+import tracing
+
+# --- AI MODEL CONFIGURATION ---
+# Set your desired AI model provider here: "gemini", "openai", "claude", "openrouter"
+AI_MODEL_PROVIDER = os.environ.get("AI_MODEL_PROVIDER", "gemini").lower()
+
+# Default sampling temperature. Use 0 for deterministic runs that replay from the response cache.
+AI_TEMPERATURE = float(os.environ.get("AI_TEMPERATURE", "0.7"))
+
+# API Keys (read from environment variables for security)
+# Ensure these environment variables are set before running the engine
+API_KEYS = {
+    "gemini": os.environ.get("GEMINI_API_KEY"),
+    "openai": os.environ.get("OPENAI_API_KEY"),
+    "claude": os.environ.get("CLAUDE_API_KEY"),
+    "openrouter": os.environ.get("OPENROUTER_API_KEY"),
+}
+
+# --- HTTP CLIENT CONFIGURATION ---
+# Timeouts are in seconds. The read timeout bounds the wait between bytes, so a
+# hung socket fails fast without capping how long a long completion may take.
+CONNECT_TIMEOUT = float(os.environ.get("AI_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("AI_READ_TIMEOUT", "120"))
+POOL_SIZE = int(os.environ.get("AI_POOL_SIZE", "10"))
+
+# --- PROVIDER TABLE ---
+# One entry per provider: endpoint, default model and the paths used to pull the
+# completion text out of the JSON response and out of each streamed SSE event.
+PROVIDERS = {
+    "gemini": {
+        "url": "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent",
+        "stream_url": "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent",
+        "default_model": "gemini-pro",
+        "text_path": ["candidates", 0, "content", "parts", 0, "text"],
+        "stream_text_path": ["candidates", 0, "content", "parts", 0, "text"],
+    },
+    "openai": {
+        "url": "https://api.openai.com/v1/chat/completions",
+        "default_model": "gpt-3.5-turbo",
+        "text_path": ["choices", 0, "message", "content"],
+        "stream_text_path": ["choices", 0, "delta", "content"],
+    },
+    "claude": {
+        # Anthropic (Claude) API
+        "url": "https://api.anthropic.com/v1/messages",
+        "default_model": "claude-3-opus-20240229",
+        "text_path": ["content", 0, "text"],
+        "stream_text_path": ["delta", "text"],
+    },
+    "openrouter": {
+        # OpenRouter API (can route to many models)
+        "url": "https://openrouter.ai/api/v1/chat/completions",
+        "default_model": "mistralai/mistral-7b-instruct", # Example OpenRouter model
+        "text_path": ["choices", 0, "message", "content"],
+        "stream_text_path": ["choices", 0, "delta", "content"],
+    },
+}
+
+# Send a provider's requests to another host while keeping the endpoint path, e.g.
+# AI_BASE_URL=http://127.0.0.1:8765 for the local mock in benchmarks/mock_provider.py.
+# AI_BASE_URL_<PROVIDER> (e.g. AI_BASE_URL_OPENAI) overrides it for one provider.
+BASE_URLS = {
+    provider: os.environ.get(f"AI_BASE_URL_{provider.upper()}") or os.environ.get("AI_BASE_URL")
+    for provider in PROVIDERS
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Returns the process-wide HTTP session, creating it on first use.
+
+    The session keeps TCP+TLS connections alive between calls, so only the first
+    request to each provider pays for the handshake.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(PROVIDERS), pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def close_session():
+    """Closes the shared HTTP session and its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def build_request(provider, prompt, model_name=None, temperature=AI_TEMPERATURE, stream=False):
+    """Builds the (url, headers, payload) triple for a provider request.
+
+    With `stream=True` the request targets the provider's server-sent events endpoint.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unsupported AI model provider: {provider}")
+
+    api_key = API_KEYS.get(provider)
+    if not api_key:
+        raise ValueError(f"API key for {provider} not found. Please set the corresponding environment variable.")
+
+    spec = PROVIDERS[provider]
+    model = model_name or spec["default_model"]
+    url = spec.get("stream_url", spec["url"]) if stream else spec["url"]
+    url = url.format(model=model)
+    if BASE_URLS.get(provider):
+        url = BASE_URLS[provider].rstrip("/") + urlsplit(url).path
+    headers = {
+        "Content-Type": "application/json",
+    }
+
+    if provider == "gemini":
+        # Gemini selects streaming by endpoint rather than by payload flag
+        url += f"?alt=sse&key={api_key}" if stream else f"?key={api_key}"
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": temperature
+            }
+        }
+    elif provider == "claude":
+        headers["x-api-key"] = api_key
+        headers["anthropic-version"] = "2023-06-01" # Required for Anthropic
+        payload = {
+            "model": model,
+            "max_tokens": 4000, # Claude requires max_tokens
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature
+        }
+    else:
+        # OpenAI and OpenRouter share the chat completions format
+        headers["Authorization"] = f"Bearer {api_key}"
+        if provider == "openrouter":
+            headers["HTTP-Referer"] = "https://your-app-url.com" # Replace with your app URL
+            headers["X-Title"] = "Your App Name" # Replace with your app name
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature
+        }
+
+    if stream and provider != "gemini":
+        payload["stream"] = True
+
+    return url, headers, payload
+
+def extract_text(response_json, text_extraction_path):
+    """Walks the provider-specific path to pull the completion text out of a response."""
+    text = response_json
+    for key in text_extraction_path:
+        if isinstance(text, list) and isinstance(key, int):
+            text = text[key]
+        elif isinstance(text, dict) and isinstance(key, str):
+            text = text.get(key)
+        else:
+            raise KeyError(f"Invalid path for text extraction: {key} in {text_extraction_path}")
+    return text
+
+def cache_key_for(provider, prompt, model_name, temperature):
+    """Returns the response cache key for a call, or None when the call bypasses the cache."""
+    if provider not in PROVIDERS or not response_cache.is_cacheable(temperature):
+        return None
+    model = model_name or PROVIDERS[provider]["default_model"]
+    return response_cache.make_cache_key(provider, model, temperature, prompt)
+
+def _cache_lookup(provider, prompt, model_name, temperature):
+    """Returns (cache_key, cached_text). The key is None when the call bypasses the cache."""
+    key = cache_key_for(provider, prompt, model_name, temperature)
+    if key is None:
+        return None, None
+    try:
+        cached = response_cache.get_cached_response(key)
+    except sqlite3.Error as e:
+        print(f"Response cache unavailable, calling {provider} directly: {e}")
+        return None, None
+    if cached is not None:
+        print(f"--- Response cache hit ({provider}/{model_name or PROVIDERS[provider]['default_model']}) ---")
+    return key, cached
+
+# Where each provider reports token usage: (field, input tokens key, output tokens key)
+USAGE_FIELDS = (
+    ("usage", "prompt_tokens", "completion_tokens"), # OpenAI, OpenRouter
+    ("usage", "input_tokens", "output_tokens"), # Claude
+    ("usageMetadata", "promptTokenCount", "candidatesTokenCount"), # Gemini
+)
+
+def usage_tokens(response_json):
+    """Returns the (input, output) token counts a response reports, or (None, None)."""
+    for field, input_key, output_key in USAGE_FIELDS:
+        usage = response_json.get(field) if isinstance(response_json, dict) else None
+        if isinstance(usage, dict) and input_key in usage:
+            return usage.get(input_key), usage.get(output_key)
+    return None, None
+
+def _cache_store(cache_key, text):
+    """Stores a completion under `cache_key`; cache failures never fail the call."""
+    if cache_key is None or not isinstance(text, str):
+        return
+    try:
+        response_cache.store_response(cache_key, text)
+    except sqlite3.Error as e:
+        print(f"Could not store response in cache: {e}")
+
+# --- GENERIC AI API CALLER ---
+def call_ai_api(provider, prompt, model_name=None, temperature=AI_TEMPERATURE, use_cache=True):
+    """Makes a generic API call to the specified AI provider.
+
+    Identical calls are answered from the on-disk response cache (see response_cache.py)
+    unless `use_cache` is False.
+    """
+    with tracing.span("ai.call_api", provider=provider) as span:
+        cache_key, cached = _cache_lookup(provider, prompt, model_name, temperature) if use_cache else (None, None)
+        span.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+        text = request_completion(provider, prompt, model_name, temperature)
+        _cache_store(cache_key, text)
+        return text
+
+@tracing.traced("ai.request")
+def request_completion(provider, prompt, model_name=None, temperature=AI_TEMPERATURE):
+    """Sends one completion request to a provider, bypassing the cache, and returns the text."""
+    url, headers, payload = build_request(provider, prompt, model_name, temperature)
+    response = None
+    response_json = None
+    data = json.dumps(payload)
+    span = tracing.current_span()
+
+    try:
+        response = get_session().post(
+            url,
+            headers=headers,
+            data=data,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+        span.set(status=response.status_code, bytes_in=len(data), bytes_out=len(response.content))
+        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+
+        response_json = response.json()
+        tokens_in, tokens_out = usage_tokens(response_json)
+        span.set(tokens_in=tokens_in, tokens_out=tokens_out)
+        return extract_text(response_json, PROVIDERS[provider]["text_path"])
+
+    except requests.exceptions.RequestException as e:
+        print(f"Network or HTTP error during API call to {provider}: {e}")
+        raise
+    except json.JSONDecodeError as e:
+        print(f"JSON decoding error from {provider} response: {e}")
+        print(f"Response content: {response.text}")
+        raise
+    except KeyError as e:
+        print(f"Could not extract text from {provider} response. Path error: {e}")
+        print(f"Response JSON: {response_json}")
+        raise
+    except Exception as e:
+        print(f"An unexpected error occurred during API call to {provider}: {e}")
+        raise
+
+def stream_ai_api(provider, prompt, model_name=None, temperature=AI_TEMPERATURE, use_cache=True):
+    """Streams a completion from the specified AI provider as a generator of text chunks.
+
+    Closing the generator early closes the underlying connection, which stops the
+    provider from generating (and billing) the rest of the completion. Only streams
+    read to the end are stored in the response cache.
+    """
+    cache_key, cached = _cache_lookup(provider, prompt, model_name, temperature) if use_cache else (None, None)
+    if cached is not None:
+        yield cached
+        return
+
+    url, headers, payload = build_request(provider, prompt, model_name, temperature, stream=True)
+    text_extraction_path = PROVIDERS[provider]["stream_text_path"]
+    received = []
+
+    try:
+        with get_session().post(
+            url,
+            headers=headers,
+            data=json.dumps(payload),
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            response.encoding = "utf-8"
+
+            for line in response.iter_lines(decode_unicode=True):
+                # SSE frames: "data: {...}"; "event:" lines and ": keep-alive" comments carry no text
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                event = json.loads(data)
+                if isinstance(event, dict) and event.get("error"):
+                    raise RuntimeError(f"{provider} reported an error mid-stream: {event['error']}")
+
+                # Role headers, usage frames and stop events have no text at this path
+                try:
+                    chunk = extract_text(event, text_extraction_path)
+                except (KeyError, IndexError):
+                    continue
+                if chunk:
+                    received.append(chunk)
+                    yield chunk
+
+        _cache_store(cache_key, "".join(received))
+
+    except requests.exceptions.RequestException as e:
+        print(f"Network or HTTP error during streaming API call to {provider}: {e}")
+        raise
+    except json.JSONDecodeError as e:
+        print(f"JSON decoding error in {provider} stream: {e}")
+        raise
@@ -0,0 +1,96 @@
+"""
+Seeded corpus of small buggy projects for the benchmarks.
+
+Each case is a project in the shape of the engine's sample project/: one to three
+modules of small functions plus a pytest file per module, with exactly one function
+broken the way project/main.py is (a wrong operator, an off-by-one, a wrong builtin).
+The same seed always yields the same cases. Every case also carries the scripted AI
+replies that fix it, for benchmarks/mock_provider.py: the correct SEARCH/REPLACE edit,
+preceded in some cases by a reply that misses, so the retry path is measured too.
+"""
+import os
+import random
+
+# --- CONFIGURATION ---
+MODULE_NAMES = ("main", "utils", "helpers")
+# Share of cases whose first AI reply does not apply and is rejected
+MISS_RATE = 0.25
+
+# (name, parameters, correct body, buggy body, [(test call, expected value)])
+FUNCTIONS = (
+    ("add", "a, b", "return a + b", "return a - b", [("add(2, 3)", "5"), ("add(-1, 1)", "0")]),
+    ("multiply", "a, b", "return a * b", "return a + b", [("multiply(3, 4)", "12"), ("multiply(0, 5)", "0")]),
+    ("sum_to", "n", "return sum(range(n + 1))", "return sum(range(n))", [("sum_to(4)", "10"), ("sum_to(0)", "0")]),
+    ("is_even", "n", "return n % 2 == 0", "return n % 2 == 1", [("is_even(4)", "True"), ("is_even(7)", "False")]),
+    ("clamp", "value, low, high", "return max(low, min(value, high))", "return min(low, max(value, high))",
+     [("clamp(5, 0, 3)", "3"), ("clamp(-1, 0, 3)", "0"), ("clamp(2, 0, 3)", "2")]),
+    ("last_item", "items", "return items[-1]", "return items[0]", [("last_item([1, 2, 3])", "3")]),
+    ("average", "values", "return sum(values) / len(values)", "return sum(values) // len(values)",
+     [("average([1, 2])", "1.5"), ("average([4])", "4")]),
+    ("count_vowels", "text", 'return sum(1 for ch in text.lower() if ch in "aeiou")',
+     'return sum(1 for ch in text if ch in "aeiou")', [('count_vowels("AEiou")', "5"), ('count_vowels("xyz")', "0")]),
+    ("reverse_words", "text", 'return " ".join(reversed(text.split()))', 'return " ".join(text.split())',
+     [('reverse_words("a b c")', '"c b a"')]),
+    ("max_of", "values", "return max(values)", "return min(values)", [("max_of([3, 9, 2])", "9")]),
+)
+
+def _module_source(functions, broken):
+    lines = ["# Generated benchmark module.\n"]
+    for name, parameters, correct, buggy, _ in functions:
+        lines.append(f"\ndef {name}({parameters}):\n    {buggy if name == broken else correct}\n")
+    return "".join(lines)
+
+def _test_source(module, functions):
+    names = ", ".join(name for name, *_ in functions)
+    lines = [f"from {module} import {names}\n"]
+    for name, _, _, _, cases in functions:
+        lines.append(f"\ndef test_{name}():\n")
+        lines.extend(f"    assert {call} == {expected}\n" for call, expected in cases)
+    return "".join(lines)
+
+def generate_case(seed, index):
+    """
+    Returns one case: {"id", "task", "files": {relative path: source}, "script": [reply
+    rules]}. The broken function is named in the task the way a bug report would.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    chosen = rng.sample(FUNCTIONS, rng.randint(3, 6))
+    module_count = min(len(chosen), rng.choice((1, 1, 2, 3)))
+    modules = {MODULE_NAMES[i]: [] for i in range(module_count)}
+    for position, function in enumerate(chosen):
+        modules[MODULE_NAMES[position % module_count]].append(function)
+    broken_module = rng.choice(sorted(modules))
+    broken = rng.choice(modules[broken_module])
+    name, _, correct, buggy, _ = broken
+
+    files = {"requirements.txt": "pytest\n"}
+    for module, functions in modules.items():
+        files[f"{module}.py"] = _module_source(functions, name)
+        files[f"test_{module}.py"] = _test_source(module, functions)
+
+    fix = (
+        f"project/{broken_module}.py\n<<<<<<< SEARCH\n    {buggy}\n=======\n    {correct}\n>>>>>>> REPLACE\n"
+    )
+    script = []
+    if rng.random() < MISS_RATE:
+        # SEARCH text that is not in the file: rejected without touching the disk
+        miss = f"project/{broken_module}.py\n<<<<<<< SEARCH\n    return None\n=======\n    {correct}\n>>>>>>> REPLACE\n"
+        script.append({"text": miss, "times": 1})
+    script.append({"text": fix})
+    return {
+        "id": f"case-{index:03d}-{name}",
+        "task": f"Fix the bug in the `{name}` function.",
+        "files": files,
+        "script": script,
+    }
+
+def generate_corpus(seed=0, count=8):
+    """Returns `count` cases for `seed`."""
+    return [generate_case(seed, index) for index in range(count)]
+
+def write_project(case, project_dir):
+    """Writes a case's files into `project_dir`."""
+    os.makedirs(project_dir, exist_ok=True)
+    for relative, source in case["files"].items():
+        with open(os.path.join(project_dir, relative), 'w', encoding='utf-8') as f:
+            f.write(source)
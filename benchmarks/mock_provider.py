@@ -0,0 +1,254 @@
+"""
+Local stand-in for the AI providers, for benchmarks and offline runs.
+
+Speaks the request and response formats ai_client.py uses for Gemini, OpenAI, Claude
+and OpenRouter, both plain and streamed (server-sent events). Point the engine at it
+with AI_BASE_URL=http://127.0.0.1:<port> and any API key.
+
+Replies come from a script: a list of rules, checked in order, each a dict with
+    "match"        substring the prompt must contain (omit to match any prompt)
+    "text"         the completion to return
+    "status"       HTTP status to answer with instead (e.g. 429 or 503)
+    "retry_after"  Retry-After header sent with an error status
+    "times"        how many requests the rule answers before it is used up (default: all)
+Prompts no rule matches get `default_text`.
+
+    python benchmarks/mock_provider.py [--port 8765] [--latency 0.2] [--script rules.json]
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURATION ---
+DEFAULT_PORT = 8765
+# Characters per streamed chunk, and a rough characters-per-token ratio for usage counts
+CHUNK_CHARS = 24
+CHARS_PER_TOKEN = 4
+
+def _provider_for(path):
+    """Returns (provider, streaming endpoint) for a request path, or (None, False)."""
+    if ":streamGenerateContent" in path:
+        return "gemini", True
+    if ":generateContent" in path:
+        return "gemini", False
+    if path.endswith("/messages"):
+        return "claude", False
+    if path.endswith("/chat/completions"):
+        return ("openrouter" if path.startswith("/api/") else "openai"), False
+    return None, False
+
+def _prompt_of(provider, payload):
+    """Pulls the prompt text out of a request payload."""
+    try:
+        if provider == "gemini":
+            return payload["contents"][-1]["parts"][0]["text"]
+        return payload["messages"][-1]["content"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+def _tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def completion_body(provider, text, prompt):
+    """The JSON body a provider returns for a finished completion."""
+    if provider == "gemini":
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": _tokens(prompt), "candidatesTokenCount": _tokens(text)},
+        }
+    if provider == "claude":
+        return {
+            "type": "message", "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+            "usage": {"input_tokens": _tokens(prompt), "output_tokens": _tokens(text)},
+        }
+    return {
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(text)},
+    }
+
+def stream_events(provider, text):
+    """Yields the SSE frames a provider sends while streaming `text`."""
+    pieces = [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)] or [""]
+    for piece in pieces:
+        if provider == "gemini":
+            event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+        elif provider == "claude":
+            yield "event: content_block_delta\n"
+            event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+        else:
+            event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+        yield f"data: {json.dumps(event)}\n\n"
+    if provider == "claude":
+        yield "event: message_stop\ndata: {\"type\": \"message_stop\"}\n\n"
+    elif provider != "gemini":
+        yield "data: [DONE]\n\n"
+
+class MockProviderServer(ThreadingHTTPServer):
+    """
+    The mock server. `latency` delays every response before its first byte, and
+    `chunk_delay` spaces out streamed chunks. Counters are read with `stats()`.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, chunk_delay=0.0, script=None, default_text=""):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.set_script(script or [], default_text)
+        self.reset_stats()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def set_script(self, rules, default_text=""):
+        """Replaces the reply rules; each rule's "times" budget starts over."""
+        with self.lock:
+            self.rules = [dict(rule) for rule in rules]
+            self.default_text = default_text
+
+    def next_reply(self, prompt):
+        """Returns the rule answering `prompt` and uses up one of its times."""
+        with self.lock:
+            for rule in self.rules:
+                if rule.get("match") and rule["match"] not in prompt:
+                    continue
+                if rule.get("times") is not None:
+                    if rule["times"] <= 0:
+                        continue
+                    rule["times"] -= 1
+                return rule
+        return {"text": self.default_text}
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters = {"requests": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0, "by_provider": {}}
+
+    def record(self, provider, bytes_in, bytes_out, error):
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["errors"] += int(error)
+            self.counters["bytes_in"] += bytes_in
+            self.counters["bytes_out"] += bytes_out
+            by_provider = self.counters["by_provider"]
+            by_provider[provider] = by_provider.get(provider, 0) + 1
+
+    def stats(self):
+        """Returns a copy of the counters: requests, errors, bytes in/out and requests per provider."""
+        with self.lock:
+            return dict(self.counters, by_provider=dict(self.counters["by_provider"]))
+
+    def start(self):
+        """Serves from a background thread and returns the base URL."""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-provider", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, json.dumps(self.server.stats()).encode(), [("Content-Type", "application/json")])
+        else:
+            self._send(404, b"")
+
+    def do_POST(self):
+        server = self.server
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.split("?", 1)[0]
+        provider, stream = _provider_for(path)
+        if provider is None:
+            self._send(404, b'{"error": "unknown endpoint"}')
+            server.record("unknown", len(raw), 0, True)
+            return
+        try:
+            payload = json.loads(raw or b"{}")
+        except ValueError:
+            self._send(400, b'{"error": "invalid JSON"}')
+            server.record(provider, len(raw), 0, True)
+            return
+        stream = stream or bool(payload.get("stream"))
+        prompt = _prompt_of(provider, payload)
+        reply = server.next_reply(prompt)
+        if server.latency:
+            time.sleep(server.latency)
+
+        status = reply.get("status", 200)
+        if status != 200:
+            headers = [("Retry-After", str(reply["retry_after"]))] if reply.get("retry_after") is not None else []
+            body = json.dumps({"error": {"code": status, "message": "scripted error"}}).encode()
+            self._send(status, body, headers)
+            server.record(provider, len(raw), len(body), True)
+            return
+
+        text = reply.get("text", "")
+        if not stream:
+            body = json.dumps(completion_body(provider, text, prompt)).encode()
+            self._send(200, body, [("Content-Type", "application/json")])
+            server.record(provider, len(raw), len(body), False)
+            return
+
+        # No Content-Length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        try:
+            for frame in stream_events(provider, text):
+                data = frame.encode()
+                self.wfile.write(data)
+                self.wfile.flush()
+                sent += len(data)
+                if server.chunk_delay and frame.startswith("data:"):
+                    time.sleep(server.chunk_delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client closed the stream early
+        server.record(provider, len(raw), sent, False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock AI provider endpoints.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--script", help="JSON file with a list of reply rules")
+    parser.add_argument("--default-text", default="", help="reply to prompts no rule matches")
+    options = parser.parse_args()
+
+    rules = []
+    if options.script:
+        with open(options.script, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+    server = MockProviderServer(options.port, options.latency, options.chunk_delay, rules, options.default_text)
+    print(f"Mock provider listening on {server.base_url} (set AI_BASE_URL to this). Stats at {server.base_url}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
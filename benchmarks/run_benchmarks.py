@@ -0,0 +1,306 @@
+"""
+Offline benchmarks for the self-healing loop.
+
+Generates a seeded corpus of buggy projects (corpus.py), starts the mock provider
+(mock_provider.py) and points the engine at it, then fixes every case in two ways:
+
+    loop      mcp.main_loop in this process, in a workspace per case
+    develop   `orchestrator.py develop` as a separate process, in a copy of the engine
+
+For each mode it reports p50/p95 wall time per case and, per fixed case, AI calls,
+pytest runs and bytes exchanged with the provider. Every run is appended to a history
+file together with the current git commit and compared with the previous run of the
+same configuration, so a commit that makes the loop slower or chattier shows up.
+
+    python benchmarks/run_benchmarks.py [--mode loop|develop|both] [--cases 8] [--seed 0]
+        [--repeat 1] [--provider openai] [--latency 0] [--stream] [--fail-on-regression]
+
+No API key is needed and nothing is sent to a real provider.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+ENGINE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_ROOT)
+
+import corpus
+from mock_provider import MockProviderServer
+
+# --- CONFIGURATION ---
+HISTORY_FILE = os.environ.get("RDE_BENCHMARK_HISTORY", os.path.join(ENGINE_ROOT, "persistency", "cache", "benchmarks.jsonl"))
+# Wall times may grow this much over the baseline before counting as a regression (timing noise)
+TIME_TOLERANCE = 0.20
+# ...and by at least this many seconds, so sub-second jitter on small corpora is not flagged
+TIME_FLOOR = 0.10
+# Counts (AI calls, pytest runs, bytes per fix) may grow this much
+COUNT_TOLERANCE = 0.05
+# What a `develop` run needs from the engine; everything else (caches, project/) is left behind
+ENGINE_DIRS = ("guidelines", "initializer", "user_input")
+ENGINE_FILES = ("system_prompt.md", os.path.join("persistency", "memory.md"), os.path.join("persistency", "task_list.md"))
+
+def configure_environment(base_url, provider, work_dir, stream):
+    """
+    Points the engine at the mock and keeps its caches inside `work_dir`. Must run before
+    the engine modules are imported, since they read their configuration at import time.
+    """
+    caches = os.path.join(work_dir, "cache")
+    os.environ.update({
+        "AI_BASE_URL": base_url,
+        "AI_MODEL_PROVIDER": provider,
+        f"{provider.upper()}_API_KEY": "mock",
+        "AI_FALLBACK_PROVIDERS": "",
+        "AI_CACHE_MODE": "off", # Every fix must reach the provider to be counted
+        "AI_RATE_LIMITS": f"{provider}=1000000",
+        "AI_HEDGE_PERCENTILE": "0",
+        "AI_STREAM": "1" if stream else "0",
+        "RDE_TRACE": "1",
+        "RDE_TRACE_FILE": os.path.join(work_dir, "trace.jsonl"),
+        "AI_CACHE_DB": os.path.join(caches, "responses.db"),
+        "RDE_CONTEXT_CACHE": os.path.join(caches, "context_sections.json"),
+        "RDE_SYMBOL_INDEX_DIR": os.path.join(caches, "symbols"),
+        "RDE_IMPACT_INDEX_DIR": os.path.join(caches, "impact"),
+        "RDE_SNAPSHOT_DIR": os.path.join(caches, "snapshots"),
+        "RDE_RAG_INDEX": os.path.join(caches, "rag_index.db"),
+        "RDE_RAG_DIR": os.path.join(ENGINE_ROOT, "persistency", "rag"),
+    })
+    os.environ.pop("RDE_CHROME_TRACE", None)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def count_pytest_runs(trace_file, trace_id=None, root_span=None):
+    """Counts the pytest runs in a trace, or below `root_span` in it."""
+    import tracing
+    spans = tracing.load_spans(trace_file, trace_id)
+    if root_span is not None:
+        children = {}
+        for span in spans:
+            children.setdefault(span["parent_id"], []).append(span)
+        spans, pending = [], [root_span]
+        while pending:
+            for child in children.get(pending.pop(), []):
+                spans.append(child)
+                pending.append(child["span_id"])
+    return sum(1 for span in spans if span["name"] == "mcp.pytest")
+
+# --- MODES ---
+def run_loop_case(case, work_dir, server):
+    """Fixes one case with mcp.main_loop in this process."""
+    import mcp
+    import tracing
+    import orchestrator
+    source = os.path.join(work_dir, "sources", case["id"])
+    corpus.write_project(case, source)
+    workspace = tempfile.mkdtemp(prefix=f"{case['id']}-", dir=os.path.join(work_dir, "loop"))
+    orchestrator.prepare_workspace({"project": source}, workspace)
+
+    server.set_script(case["script"])
+    server.reset_stats()
+    previous_dir = os.getcwd()
+    os.chdir(workspace) # mcp.py resolves project/, guidelines/ and its log relative to the working directory
+    try:
+        with tracing.span("benchmark.case", case=case["id"]) as span:
+            started = time.perf_counter()
+            result = mcp.main_loop(case["task"])
+            wall = time.perf_counter() - started
+    finally:
+        os.chdir(previous_dir)
+    stats = server.stats()
+    return {
+        "case": case["id"],
+        "success": result["success"],
+        "wall": wall,
+        "attempts": result["attempts"],
+        "ai_calls": stats["requests"],
+        "pytest_runs": count_pytest_runs(os.environ["RDE_TRACE_FILE"], root_span=span.span_id),
+        "bytes": stats["bytes_in"] + stats["bytes_out"],
+    }
+
+def copy_engine(destination):
+    """Copies the engine's code, guidelines and memory (not its caches or project) to `destination`."""
+    os.makedirs(os.path.join(destination, "persistency"), exist_ok=True)
+    for name in os.listdir(ENGINE_ROOT):
+        if name.endswith(".py"):
+            shutil.copy2(os.path.join(ENGINE_ROOT, name), destination)
+    for name in ENGINE_DIRS:
+        shutil.copytree(os.path.join(ENGINE_ROOT, name), os.path.join(destination, name))
+    for relative in ENGINE_FILES:
+        if os.path.exists(os.path.join(ENGINE_ROOT, relative)):
+            shutil.copy2(os.path.join(ENGINE_ROOT, relative), os.path.join(destination, relative))
+
+def run_develop_case(case, work_dir, server):
+    """Fixes one case with `orchestrator.py develop` in a fresh copy of the engine."""
+    engine = os.path.join(work_dir, "develop", case["id"])
+    if os.path.exists(engine):
+        shutil.rmtree(engine)
+    copy_engine(engine)
+    corpus.write_project(case, os.path.join(engine, "project"))
+    trace_id = f"bench-{case['id']}-{os.getpid()}-{time.time_ns()}"
+    env = dict(os.environ, RDE_TRACE_ID=trace_id)
+    env.pop("RDE_TRACE_PARENT", None)
+
+    server.set_script(case["script"])
+    server.reset_stats()
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, os.path.join(engine, "orchestrator.py"), "develop", os.path.join(engine, "export")],
+        cwd=engine, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    with open(os.path.join(engine, "develop.log"), 'w', encoding='utf-8') as f:
+        f.write(process.stdout + process.stderr)
+    stats = server.stats()
+    return {
+        "case": case["id"],
+        "success": process.returncode == 0,
+        "wall": wall,
+        "attempts": None,
+        "ai_calls": stats["requests"],
+        "pytest_runs": count_pytest_runs(os.environ["RDE_TRACE_FILE"], trace_id=trace_id),
+        "bytes": stats["bytes_in"] + stats["bytes_out"],
+    }
+
+MODES = {"loop": run_loop_case, "develop": run_develop_case}
+
+def summarize(results):
+    """Aggregates the results of one mode."""
+    fixed = [r for r in results if r["success"]]
+    per_fix = lambda key: round(sum(r[key] for r in fixed) / len(fixed), 2) if fixed else None
+    walls = [r["wall"] for r in results]
+    return {
+        "runs": len(results),
+        "fixed": len(fixed),
+        "wall_p50": round(percentile(walls, 0.50), 3),
+        "wall_p95": round(percentile(walls, 0.95), 3),
+        "ai_calls_per_fix": per_fix("ai_calls"),
+        "pytest_runs_per_fix": per_fix("pytest_runs"),
+        "bytes_per_fix": per_fix("bytes"),
+    }
+
+# --- HISTORY ---
+def git_commit():
+    """Returns (commit, dirty) for the engine checkout, or (None, None) outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ENGINE_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ENGINE_ROOT, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def load_history(history_file):
+    try:
+        with open(history_file, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return []
+
+def find_regressions(baseline, current):
+    """Returns a list of (mode, metric, baseline value, current value) that got worse."""
+    regressions = []
+    floors = {"wall_p50": TIME_FLOOR, "wall_p95": TIME_FLOOR}
+    for mode, summary in current.items():
+        before = baseline.get(mode)
+        if not before:
+            continue
+        if summary["fixed"] < before["fixed"]:
+            regressions.append((mode, "fixed", before["fixed"], summary["fixed"]))
+        for metric, tolerance in (
+            ("wall_p50", TIME_TOLERANCE), ("wall_p95", TIME_TOLERANCE),
+            ("ai_calls_per_fix", COUNT_TOLERANCE), ("pytest_runs_per_fix", COUNT_TOLERANCE), ("bytes_per_fix", COUNT_TOLERANCE),
+        ):
+            old, new = before.get(metric), summary.get(metric)
+            if old is not None and new is not None and new > old * (1 + tolerance) + 1e-9 and new - old > floors.get(metric, 0):
+                regressions.append((mode, metric, old, new))
+    return regressions
+
+def print_summary(summaries, baseline):
+    print(f"\n{'mode':<8} {'fixed':>7} {'p50 s':>8} {'p95 s':>8} {'AI calls/fix':>13} {'pytest/fix':>11} {'bytes/fix':>11}")
+    for mode, summary in summaries.items():
+        print(f"{mode:<8} {summary['fixed']:>3}/{summary['runs']:<3} {summary['wall_p50']:>8.3f} {summary['wall_p95']:>8.3f} "
+              f"{summary['ai_calls_per_fix'] or 0:>13} {summary['pytest_runs_per_fix'] or 0:>11} {summary['bytes_per_fix'] or 0:>11}")
+        before = (baseline or {}).get("summary", {}).get(mode)
+        if before:
+            print(f"{'  before':<8} {before['fixed']:>3}/{before['runs']:<3} {before['wall_p50']:>8.3f} {before['wall_p95']:>8.3f} "
+                  f"{before['ai_calls_per_fix'] or 0:>13} {before['pytest_runs_per_fix'] or 0:>11} {before['bytes_per_fix'] or 0:>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the self-healing loop against a mock provider.")
+    parser.add_argument("--mode", choices=("loop", "develop", "both"), default="both")
+    parser.add_argument("--cases", type=int, default=8, help="number of generated cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case")
+    parser.add_argument("--provider", choices=("gemini", "openai", "claude", "openrouter"), default="openai")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock seconds before each response")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="mock seconds between streamed chunks")
+    parser.add_argument("--stream", action="store_true", help="stream completions (AI_STREAM=1)")
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--keep", action="store_true", help="keep the workspaces")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    options = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="rde-bench-")
+    for mode in ("loop", "develop", "sources"):
+        os.makedirs(os.path.join(work_dir, mode))
+    server = MockProviderServer(latency=options.latency, chunk_delay=options.chunk_delay)
+    configure_environment(server.start(), options.provider, work_dir, options.stream)
+    import rag_index
+    rag_index.update_index(os.environ["RDE_RAG_DIR"], os.environ["RDE_RAG_INDEX"]) # Index once, outside the timings
+
+    cases = corpus.generate_corpus(options.seed, options.cases)
+    modes = ("loop", "develop") if options.mode == "both" else (options.mode,)
+    results = {}
+    try:
+        for mode in modes:
+            if mode == "loop":
+                # Warm-up: the first run in a process also starts the warm pytest worker
+                run_loop_case(dict(cases[0], id="warmup"), work_dir, server)
+            results[mode] = []
+            for repeat in range(options.repeat):
+                for case in cases:
+                    result = MODES[mode](case, work_dir, server)
+                    results[mode].append(result)
+                    print(f"[{mode}] {case['id']}: {'fixed' if result['success'] else 'NOT FIXED'} in {result['wall']:.3f}s, "
+                          f"{result['ai_calls']} AI call(s), {result['pytest_runs']} pytest run(s)", flush=True)
+    finally:
+        server.stop()
+        if not options.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summaries = {mode: summarize(mode_results) for mode, mode_results in results.items()}
+    config = {
+        "modes": list(modes), "cases": options.cases, "seed": options.seed, "repeat": options.repeat,
+        "provider": options.provider, "latency": options.latency, "chunk_delay": options.chunk_delay, "stream": options.stream,
+    }
+    commit, dirty = git_commit()
+    history = load_history(options.history)
+    baseline = next((entry for entry in reversed(history) if entry.get("config") == config), None)
+    print_summary(summaries, baseline)
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit, "dirty": dirty, "config": config, "summary": summaries, "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(options.history)), exist_ok=True)
+    with open(options.history, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+
+    regressions = find_regressions(baseline["summary"], summaries) if baseline else []
+    if baseline:
+        print(f"\nCompared with {baseline['commit'] and baseline['commit'][:10]}{' (dirty)' if baseline.get('dirty') else ''} from {baseline['timestamp']}.")
+    for mode, metric, old, new in regressions:
+        print(f"REGRESSION [{mode}] {metric}: {old} -> {new}")
+    if options.keep:
+        print(f"Workspaces kept in {work_dir}")
+    return 1 if regressions and options.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
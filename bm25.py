@@ -0,0 +1,79 @@
+import re
+import math
+from collections import Counter
+
+# --- CONFIGURATION ---
+# Standard Okapi BM25 parameters: term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+WORD = re.compile(r"[A-Za-z0-9]+")
+CAMEL_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOPWORDS = frozenset(
+    "a an and are as at be by do for from has have if in into is it its not of on or "
+    "that the their then there these this to was were what when where which will with you your "
+    "py md".split() # File extensions from tracebacks and paths
+)
+
+def tokenize(text):
+    """
+    Lowercases `text` into search terms. Identifiers are split on underscores and case
+    changes (`test_add`, `AssertionError`) so tracebacks match prose, and a plural `s`
+    is dropped so "tests" matches "test".
+    """
+    terms = []
+    for word in WORD.findall(text):
+        for part in (word,) if word.islower() else CAMEL_PART.findall(word):
+            part = part.lower()
+            if len(part) < 2 or part in STOPWORDS:
+                continue
+            if len(part) > 3 and part.endswith("s") and not part.endswith("ss"):
+                part = part[:-1]
+            terms.append(part)
+    return terms
+
+def idf(document_frequency, document_count):
+    """BM25 inverse document frequency, floored at zero for terms in most documents."""
+    return max(0.0, math.log((document_count - document_frequency + 0.5) / (document_frequency + 0.5) + 1.0))
+
+def term_score(term_frequency, document_length, average_length, term_idf):
+    """One term's BM25 contribution to one document's score."""
+    norm = K1 * (1 - B + B * document_length / (average_length or 1))
+    return term_idf * term_frequency * (K1 + 1) / (term_frequency + norm)
+
+class BM25Index:
+    """An in-memory BM25 index over a small list of documents."""
+
+    def __init__(self, documents):
+        self.term_counts = [Counter(tokenize(text)) for text in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        self.document_frequency = Counter()
+        for counts in self.term_counts:
+            self.document_frequency.update(counts.keys())
+
+    def scores(self, query):
+        """Returns the BM25 score of every document for `query`, in document order."""
+        # Repeated query terms weigh more, e.g. "test" in both the file and function name
+        query_counts = Counter(tokenize(query))
+        count = len(self.term_counts)
+        weights = {
+            term: repeats * idf(self.document_frequency[term], count)
+            for term, repeats in query_counts.items() if self.document_frequency[term]
+        }
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            results.append(sum(
+                term_score(counts[term], length, self.average_length, weight)
+                for term, weight in weights.items() if counts[term]
+            ))
+        return results
+
+    def search(self, query, top_k=None):
+        """Returns (index, score) pairs for documents that match `query`, best first."""
+        ranked = sorted(
+            ((i, score) for i, score in enumerate(self.scores(query)) if score > 0),
+            key=lambda pair: pair[1],
+            reverse=True,
+        )
+        return ranked[:top_k] if top_k else ranked
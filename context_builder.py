@@ -0,0 +1,100 @@
+import os
+import json
+import threading
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+CONTEXT_CACHE_FILE = os.environ.get(
+    "RDE_CONTEXT_CACHE", os.path.join(ENGINE_ROOT, "persistency", "cache", "context_sections.json")
+)
+SYSTEM_PROMPT_FILE = "system_prompt.md"
+CONTEXT_HEADER = "You are an autonomous AI software engineer. Your task is to fix a bug in the following project.\n"
+
+# Rendered sections keyed by absolute path: {"fingerprint": [mtime_ns, size], "label": ..., "text": ...}
+_sections = None
+_dirty = False
+_lock = threading.Lock()
+
+def _load_cache():
+    """Loads the rendered sections saved by a previous process, once per process."""
+    global _sections
+    if _sections is not None:
+        return
+    try:
+        with open(CONTEXT_CACHE_FILE, 'r', encoding='utf-8') as f:
+            _sections = json.load(f)
+    except (OSError, ValueError):
+        _sections = {}
+
+def _save_cache():
+    """Persists the rendered sections if any were re-read in this process."""
+    global _dirty
+    if not _dirty:
+        return
+    try:
+        os.makedirs(os.path.dirname(CONTEXT_CACHE_FILE), exist_ok=True)
+        temp_path = f"{CONTEXT_CACHE_FILE}.{os.getpid()}.tmp" # Batch jobs save concurrently
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(_sections, f)
+        os.replace(temp_path, CONTEXT_CACHE_FILE)
+        _dirty = False
+    except OSError as e:
+        print(f"Could not save context cache: {e}")
+
+def fingerprint(path):
+    """Returns the (mtime_ns, size) fingerprint used to detect changed files, or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def get_section(label, path):
+    """Returns the rendered `--- label ---` section for `path`, re-reading it only if it changed."""
+    global _dirty
+    path = os.path.abspath(path)
+    current = fingerprint(path)
+    cached = _sections.get(path)
+    if cached and current is not None and cached["fingerprint"] == current and cached["label"] == label:
+        return cached["text"]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = f"Error: File not found at {path}"
+
+    text = f"\n--- {label} ---\n{content}"
+    if current is not None:
+        _sections[path] = {"fingerprint": current, "label": label, "text": text}
+        _dirty = True
+    return text
+
+def build_context_sections(guidelines_dir, system_prompt_file=SYSTEM_PROMPT_FILE):
+    """
+    Returns the context as a list of (label, text) sections: the system prompt first,
+    then every guideline file in name order.
+    """
+    with _lock:
+        _load_cache()
+        sections = []
+        label = f"System Prompt: {os.path.basename(system_prompt_file)}"
+        sections.append((label, get_section(label, system_prompt_file)))
+
+        for guideline_file in sorted(os.listdir(guidelines_dir)):
+            # Ensure we don't try to load system_prompt.md again if it was somehow left in guidelines
+            if guideline_file == os.path.basename(system_prompt_file):
+                continue
+            path = os.path.join(guidelines_dir, guideline_file)
+            if not os.path.isfile(path):
+                continue
+            label = f"Guideline: {guideline_file}"
+            sections.append((label, get_section(label, path)))
+
+        _save_cache()
+        return sections
+
+def build_context(guidelines_dir, system_prompt_file=SYSTEM_PROMPT_FILE):
+    """Returns the full context string: the header followed by every rendered section."""
+    sections = build_context_sections(guidelines_dir, system_prompt_file)
+    return "".join([CONTEXT_HEADER] + [text for _, text in sections])
@@ -0,0 +1,176 @@
+import os
+import re
+import sys
+import hashlib
+from collections import OrderedDict
+import failure_log
+from prompt_packer import PYTEST_NOISE
+
+# --- CONFIGURATION ---
+# Frames closest to the raise that make up a traceback signature
+SIGNATURE_FRAMES = 3
+# Upper bound on clusters tracked while streaming the log (space-saving counting)
+MAX_CLUSTERS = 256
+# Upper bound on output hashes whose signature is remembered during one pass
+MAX_MEMOIZED_OUTPUTS = 4096
+EXAMPLE_CHARS = 8000
+
+# Tokens that differ between runs of the same failure
+VOLATILE_PATTERNS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?"), "<TIME>"),
+    (re.compile(r"\bin \d+(?:\.\d+)?s\b"), "in <DURATION>"),
+    (re.compile(r"\(\d+(?:\.\d+)?s\)"), "(<DURATION>)"),
+    (re.compile(r"\b\d+(?:\.\d+)?s (call|setup|teardown)\b"), r"<DURATION> \1"),
+    (re.compile(r"0x[0-9a-fA-F]+"), "0x<ADDR>"),
+    # Absolute paths (temp dirs, workspaces, site-packages) collapse to their file name
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\\/][^\s\\/:\"'<>()]+)+[\\/]([^\s\\/:\"'<>()]+)"), r"\1"),
+]
+
+FAILURE_HEADER = re.compile(r"^_{3,} (.+?) _{3,}$")
+PYTEST_LOCATION = re.compile(r"^(\S+?\.py):\d+:(?: in (\S+)| ((?:\w+\.)*\w+))?\s*$")
+PYTHON_FRAME = re.compile(r'^\s*File "([^"]+)", line \d+, in (\S+)')
+PYTEST_BLOCK_SEPARATOR = re.compile(r"^(_ )+_$")
+SOURCE_DEF = re.compile(r"^\s*>?\s*(?:async\s+)?def (\w+)\(")
+EXCEPTION_LINE = re.compile(r"^(?:E\s+)?((?:\w+\.)*\w*(?:Error|Exception|Exit|Interrupt|Failed|Warning))\b")
+
+def normalize_output(output):
+    """Strips volatile tokens (times, durations, addresses, absolute paths) and pytest preamble."""
+    lines = [line for line in output.splitlines() if not PYTEST_NOISE.match(line)]
+    text = "\n".join(lines)
+    for pattern, replacement in VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+def extract_signature(output):
+    """
+    Returns (exception_type, frames) for the first failure in a pytest or Python
+    traceback. Frames are "file:function" with line numbers dropped, so the same
+    failure still matches after unrelated edits move code around.
+    """
+    frames = []
+    exception = None
+    block_function = None # Long tracebacks name a frame's function only in its source listing
+    for line in output.splitlines():
+        stripped = line.strip()
+        if FAILURE_HEADER.match(stripped):
+            if exception or frames:
+                break # Only the first failure shapes the signature
+            block_function = None
+            continue
+        if PYTEST_BLOCK_SEPARATOR.match(stripped):
+            block_function = None
+            continue
+        match = SOURCE_DEF.match(line)
+        if match and block_function is None:
+            block_function = match.group(1)
+            continue
+        match = PYTHON_FRAME.match(line)
+        if match:
+            frames.append(f"{os.path.basename(match.group(1))}:{match.group(2)}")
+            continue
+        match = PYTEST_LOCATION.match(stripped)
+        if match:
+            name = os.path.basename(match.group(1))
+            function = match.group(2) or block_function
+            frames.append(f"{name}:{function}" if function else name)
+            if match.group(3):
+                exception = exception or match.group(3)
+                break
+            continue
+        if exception is None:
+            match = EXCEPTION_LINE.match(stripped)
+            if match:
+                exception = match.group(1)
+    return exception, frames[-SIGNATURE_FRAMES:]
+
+def signature_of(output):
+    """Returns (signature_hash, exception_type, frames) for one failure output."""
+    exception, frames = extract_signature(output)
+    if exception or frames:
+        material = "|".join([exception or "UnknownError"] + frames)
+    else:
+        # No traceback to go on; fall back to the normalized text itself
+        material = "text|" + normalize_output(output)[:2000]
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()[:16], exception, frames
+
+def error_query(output, max_lines=20):
+    """
+    Turns a failure output into a search query: exception type, signature frames and the
+    assertion or exception lines, which carry the words that describe what went wrong.
+    """
+    exception, frames = extract_signature(output)
+    error_lines = [
+        re.sub(r"^E\s+", "", line).strip() for line in output.splitlines()
+        if line.startswith("E ") or EXCEPTION_LINE.match(line.strip())
+    ]
+    return " ".join([exception or ""] + frames + error_lines[:max_lines])
+
+def cluster_failures(failures, read_output=None, max_clusters=MAX_CLUSTERS):
+    """
+    Groups failures by traceback signature in one pass with bounded memory and returns
+    the clusters ranked by count. `failures` yields dicts with either an `error_output`
+    or an `output_hash` that `read_output` resolves. Once `max_clusters` are tracked, a
+    new signature replaces the smallest cluster and inherits its count (space-saving
+    counting), so counts of rare signatures may be overestimated by `overcount`.
+    """
+    clusters = {}
+    memo = OrderedDict()
+
+    for failure in failures:
+        output_hash = failure.get("output_hash")
+        info = memo.get(output_hash) if output_hash else None
+        if info is None:
+            output = failure.get("error_output")
+            if output is None and read_output:
+                output = read_output(output_hash)
+            if output is None:
+                continue
+            signature, exception, frames = signature_of(output)
+            info = {"signature": signature, "exception": exception, "frames": frames, "example": output[:EXAMPLE_CHARS]}
+            if output_hash:
+                memo[output_hash] = info
+                if len(memo) > MAX_MEMOIZED_OUTPUTS:
+                    memo.popitem(last=False)
+        elif output_hash:
+            memo.move_to_end(output_hash)
+
+        cluster = clusters.get(info["signature"])
+        if cluster is None:
+            overcount = 0
+            if len(clusters) >= max_clusters:
+                smallest = min(clusters.values(), key=lambda c: c["count"])
+                del clusters[smallest["signature"]]
+                overcount = smallest["count"]
+            cluster = clusters[info["signature"]] = {
+                "signature": info["signature"],
+                "exception": info["exception"],
+                "frames": info["frames"],
+                "count": overcount,
+                "overcount": overcount,
+                "tasks": set(),
+                "example": normalize_output(info["example"]),
+                "raw_example": info["example"],
+            }
+        cluster["count"] += 1
+        if failure.get("task") and len(cluster["tasks"]) < 20:
+            cluster["tasks"].add(failure["task"])
+
+    return sorted(clusters.values(), key=lambda c: c["count"], reverse=True)
+
+def get_error_clusters(log_file_path, top_n=None):
+    """Streams the failure log and returns its error clusters ranked by count."""
+    if not os.path.exists(log_file_path):
+        return []
+    with failure_log.open_output_reader(log_file_path) as read_output:
+        clusters = cluster_failures(failure_log.iter_failures(log_file_path, with_output=False), read_output)
+    return clusters[:top_n] if top_n else clusters
+
+def describe_cluster(cluster):
+    """One-line summary of a cluster: count, exception type and signature frames."""
+    where = " <- ".join(reversed(cluster["frames"])) or "no traceback"
+    return f"{cluster['count']}x {cluster['exception'] or 'unknown error'} at {where}"
+
+if __name__ == "__main__":
+    log_path = sys.argv[1] if len(sys.argv) > 1 else failure_log.LOG_FILE
+    for rank, cluster in enumerate(get_error_clusters(log_path, top_n=10), start=1):
+        print(f"{rank}. {describe_cluster(cluster)} [{cluster['signature']}]")
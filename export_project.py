@@ -1,20 +1,154 @@
 import os
+import json
 import shutil
+import hashlib
 import subprocess
 import sys
+import tracing
+import project_import
 
 # --- CONFIGURATION ---
 PROJECT_SOURCE_DIR = "project"
+# Never exported: version control metadata (a project imported by git clone has its own
+# .git), caches and the engine's default sample project files
+VCS_DIRS = ('.git', '.hg', '.svn')
+EXPORT_IGNORE = VCS_DIRS + ('__pycache__', '*.pyc', '.gitkeep', 'main.py', 'requirements.txt', 'test_main.py')
+# The manifest of the last export lives inside the exported repository's .git folder,
+# so it is never committed and disappears with the repository
+MANIFEST_NAME = "rde-export-manifest.json"
+# How changed files are placed in the export: "auto" (reflink where supported, else copy),
+# "hardlink" or "copy". Hardlinks are opt-in: the export would share its files with project/.
+EXPORT_LINK_MODE = os.environ.get("RDE_EXPORT_LINK", "auto").lower()
 
-def export_project(destination_path, force_overwrite=False):
-    """Copies the project to a new directory and initializes a git repository."""
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def _in_vcs_dir(relative):
+    """True for paths inside a version control directory, which the export must never touch."""
+    return relative.replace(os.sep, "/").split("/", 1)[0] in VCS_DIRS
+
+def _manifest_path(destination_path):
+    return os.path.join(destination_path, ".git", MANIFEST_NAME)
+
+def load_manifest(destination_path):
+    """Returns the file entries of the destination's last export, or None if it has no manifest."""
+    try:
+        with open(_manifest_path(destination_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest.get("files") if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict) else None
+
+def save_manifest(destination_path, entries):
+    path = _manifest_path(destination_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": 1, "source": os.path.abspath(PROJECT_SOURCE_DIR), "files": entries}, f)
+    os.replace(temp_path, path)
+
+def scan_source():
+    """Returns {relative path: [size, mtime_ns]} for every exportable file in the project."""
+    compiled = project_import.compile_ignore(EXPORT_IGNORE)
+    found = {}
+    for root, dir_names, file_names in os.walk(PROJECT_SOURCE_DIR):
+        relative_root = os.path.relpath(root, PROJECT_SOURCE_DIR)
+        relative_root = "" if relative_root == "." else relative_root
+        dir_names[:] = [name for name in dir_names if not project_import.is_ignored(os.path.join(relative_root, name), name, compiled)]
+        for name in file_names:
+            relative = os.path.join(relative_root, name)
+            if not project_import.is_ignored(relative, name, compiled):
+                found[relative] = _stat(os.path.join(root, name))
+    return found
+
+def sync_files(destination_path, previous):
+    """
+    Brings the destination in line with the project, given the manifest entries of the
+    previous export ({} for a new one). A file is hashed only when its size or mtime
+    changed, and copied only when its content changed or its exported copy was touched.
+    Files exported before and since removed from the project are deleted. Nothing under
+    the destination's version control directories is ever written or deleted.
+    Returns (entries, copied, removed, bytes copied).
+    """
+    current = {relative: stat for relative, stat in scan_source().items() if not _in_vcs_dir(relative)}
+    # Manifests of older exports may list files from a synced-over .git
+    previous = {relative: entry for relative, entry in previous.items() if not _in_vcs_dir(relative)}
+    entries, copied = {}, []
+    for relative, stat in current.items():
+        entry = previous.get(relative)
+        if entry and [entry["size"], entry["mtime_ns"]] == stat:
+            digest = entry["hash"]
+        else:
+            digest = _file_hash(os.path.join(PROJECT_SOURCE_DIR, relative))
+        dest_stat = _stat(os.path.join(destination_path, relative))
+        if not entry or entry["hash"] != digest or dest_stat is None or entry.get("dest") != dest_stat:
+            copied.append(relative)
+        entries[relative] = {"hash": digest, "size": stat[0], "mtime_ns": stat[1], "dest": dest_stat}
+
+    removed = [relative for relative in previous if relative not in current]
+    for relative in removed:
+        path = os.path.join(destination_path, relative)
+        if os.path.lexists(path):
+            os.remove(path)
+        # Drop directories the removal left empty
+        parent = os.path.dirname(path)
+        while os.path.abspath(parent) != os.path.abspath(destination_path) and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    for relative in copied:
+        path = os.path.join(destination_path, relative)
+        os.makedirs(os.path.dirname(path) or destination_path, exist_ok=True)
+        if os.path.lexists(path):
+            os.remove(path) # Never write through an existing file, it may be a link
+    _, copied_bytes = project_import.copy_files(PROJECT_SOURCE_DIR, destination_path, copied, EXPORT_LINK_MODE)
+    for relative in copied:
+        entries[relative]["dest"] = _stat(os.path.join(destination_path, relative))
+    return entries, copied, removed, copied_bytes
+
+def commit_export(destination_path, message):
+    """Stages everything and commits if anything changed. Returns True if a commit was made."""
+    subprocess.run(["git", "add", "-A"], cwd=destination_path, check=True, capture_output=True)
+    staged = subprocess.run(["git", "diff", "--cached", "--quiet"], cwd=destination_path, capture_output=True)
+    if staged.returncode == 0:
+        return False
+    subprocess.run(["git", "commit", "-m", message], cwd=destination_path, check=True, capture_output=True)
+    return True
+
+@tracing.traced("export", record=("success", "mode", "git_initialized", "reason"))
+def export_project(destination_path, force_overwrite=False, full=False):
+    """
+    Exports the project to a directory with its own git repository. A destination that
+    holds a previous export is updated incrementally: only changed files are copied,
+    removed ones are deleted, and the changes become a new commit on its history. Any
+    other existing destination is replaced (after confirmation unless `force_overwrite`),
+    as is every destination when `full` is set.
+    Returns a result dict: "success" (the files are in place), "destination", "mode"
+    ("full" or "incremental"), "git_initialized", "committed", "copied", "removed" and
+    "reason" when the export did not happen.
+    """
+    result = {"success": False, "destination": os.path.abspath(destination_path), "mode": "full",
+              "git_initialized": False, "committed": False, "copied": 0, "removed": 0, "reason": None}
     # 1. Validate the source directory exists
     if not os.path.isdir(PROJECT_SOURCE_DIR):
         print(f"Error: Source directory '{PROJECT_SOURCE_DIR}' not found.")
-        return
+        return dict(result, reason="no_source")
 
     # 2. Handle the destination directory
-    if os.path.exists(destination_path):
+    previous = None if full else load_manifest(destination_path)
+    if previous is not None:
+        result["mode"] = "incremental"
+    elif os.path.exists(destination_path):
         if force_overwrite:
             print(f"Warning: Destination '{destination_path}' already exists. Forcing overwrite.")
             shutil.rmtree(destination_path)
@@ -22,56 +156,58 @@ def export_project(destination_path, force_overwrite=False):
             response = input(f"Warning: Destination '{destination_path}' already exists. Overwrite? (y/n): ").lower()
             if response != 'y':
                 print("Export cancelled.")
-                return
+                return dict(result, reason="cancelled")
             shutil.rmtree(destination_path)
-    
-    print(f"\n> Exporting project to {destination_path}...")
-    
-    # 3. Copy the project files, ignoring common temporary files
-    # Define patterns for files to ignore during copy
-    ignore_patterns = shutil.ignore_patterns(
-        '__pycache__', '*.pyc',
-        '.gitkeep', 'main.py', 'requirements.txt', 'test_main.py' # Add default project files to ignore
-    )
-    shutil.copytree(PROJECT_SOURCE_DIR, destination_path, ignore=ignore_patterns)
-
-    print("> Project files copied successfully.")
-
-    # 4. Initialize a new Git repository in the destination
+
+    print(f"\n> Exporting project to {destination_path} ({result['mode']})...")
+
+    # 3. Copy new and changed project files, delete removed ones
+    os.makedirs(destination_path, exist_ok=True)
+    entries, copied, removed, copied_bytes = sync_files(destination_path, previous or {})
+    print(f"> {len(copied)} file(s) copied, {len(removed)} removed, {len(entries) - len(copied)} unchanged.")
+    result.update(success=True, copied=len(copied), removed=len(removed))
+    tracing.annotate(files=len(copied), removed=len(removed), bytes_out=copied_bytes)
+
+    # 4. Commit the export, on top of the previous export's history if there is one
     try:
-        print(f"> Initializing new Git repository in {destination_path}...")
-        subprocess.run(["git", "init"], cwd=destination_path, check=True, capture_output=True)
-        
-        # 5. Create the initial commit
-        print("> Creating initial commit...")
+        if previous is None:
+            print(f"> Initializing new Git repository in {destination_path}...")
+            subprocess.run(["git", "init"], cwd=destination_path, check=True, capture_output=True)
+            message = "Initial commit: Project exported from engine."
+        else:
+            message = f"Update from engine export: {len(copied)} changed, {len(removed)} removed."
+        result["git_initialized"] = True
         # It's important to configure user.name and user.email for this to work
-        # We will stage all files and commit them
-        subprocess.run(["git", "add", "."], cwd=destination_path, check=True, capture_output=True)
-        commit_message = "Initial commit: Project exported from engine."
-        subprocess.run(["git", "commit", "-m", commit_message], cwd=destination_path, check=True, capture_output=True)
-
+        result["committed"] = commit_export(destination_path, message)
+        print("> Changes committed." if result["committed"] else "> Nothing new to commit.")
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print("\n--- Git Initialization Failed ---")
-        print("Could not initialize git. Please ensure git is installed and in your PATH.")
+        print("\n--- Git Commit Failed ---")
+        print("Could not commit the export. Please ensure git is installed and in your PATH.")
         print(f"Error: {e}")
         print("The project files were copied, but you will need to handle git manually.")
-        return
+        result["reason"] = "git_failed"
+    if os.path.isdir(os.path.join(destination_path, ".git")):
+        save_manifest(destination_path, entries)
+    if result["reason"]:
+        return result
 
     print("\n--- Export Complete! ---")
     print(f"Your clean project is ready at: {destination_path}")
-    print("\nNext steps:")
-    print(f"  1. cd {destination_path}")
-    print("  2. git remote add origin <your-client-repo-url>")
-    print("  3. git push -u origin master")
+    if previous is None:
+        print("\nNext steps:")
+        print(f"  1. cd {destination_path}")
+        print("  2. git remote add origin <your-client-repo-url>")
+        print("  3. git push -u origin master")
+    return result
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        print("Usage: python export_project.py <path_to_clean_project_directory> [--force]")
+    args = sys.argv[1:]
+    force = "--force" in args
+    full = "--full" in args
+    args = [arg for arg in args if arg not in ("--force", "--full")]
+    if len(args) != 1:
+        print("Usage: python export_project.py <path_to_clean_project_directory> [--force] [--full]")
         sys.exit(1)
-    
-    destination = sys.argv[1]
-    force = False
-    if len(sys.argv) == 3 and sys.argv[2] == "--force":
-        force = True
-    
-    export_project(destination, force_overwrite=force)
+
+    result = export_project(args[0], force_overwrite=force, full=full)
+    sys.exit(0 if result["success"] else 1)
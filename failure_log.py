@@ -0,0 +1,150 @@
+import os
+import atexit
+import sqlite3
+import contextlib
+import hashlib
+import threading
+from datetime import datetime
+
+# --- CONFIGURATION ---
+LOG_FILE = "engine_log.db"
+# Buffered rows are written in one transaction once this many have accumulated
+BATCH_SIZE = 20
+
+_buffers = {}
+_buffer_lock = threading.Lock()
+
+def _connect(log_file):
+    """Opens the log database in WAL mode, creating the schema on first use."""
+    conn = sqlite3.connect(log_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS failures ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, task TEXT NOT NULL, "
+        "attempt INTEGER NOT NULL, duration REAL, tokens_in INTEGER, tokens_out INTEGER, "
+        "exit_code INTEGER, output_hash TEXT NOT NULL, snapshot_id TEXT)"
+    )
+    # Logs written before failures were tied to project snapshots (see snapshot_store.py)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(failures)")}
+    if "snapshot_id" not in columns:
+        conn.execute("ALTER TABLE failures ADD COLUMN snapshot_id TEXT")
+    # Large outputs are stored once and referenced by content hash
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS outputs ("
+        "hash TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS failures_output_hash ON failures (output_hash)")
+    return conn
+
+def log_failure(task, attempt, error_output, duration=None, tokens_in=None, tokens_out=None,
+                exit_code=None, snapshot_id=None, log_file=LOG_FILE):
+    """
+    Buffers a verification failure; rows reach the database in batches. `snapshot_id`
+    names the project snapshot the failing run verified.
+    """
+    output_hash = hashlib.sha256(error_output.encode("utf-8")).hexdigest()
+    row = (datetime.now().isoformat(), task, attempt, duration, tokens_in, tokens_out, exit_code, output_hash, snapshot_id)
+    with _buffer_lock:
+        buffer = _buffers.setdefault(log_file, {"rows": [], "outputs": {}})
+        buffer["rows"].append(row)
+        buffer["outputs"][output_hash] = error_output
+        pending = len(buffer["rows"])
+    if pending >= BATCH_SIZE:
+        flush(log_file)
+
+def flush(log_file=None):
+    """
+    Writes buffered rows for one log file (or all of them) in a single transaction each.
+    If a write fails (e.g. the database stays locked), its rows go back into the buffer.
+    """
+    with _buffer_lock:
+        paths = [log_file] if log_file else list(_buffers)
+        batches = [(path, _buffers.pop(path)) for path in paths if path in _buffers]
+
+    for path, buffer in batches:
+        try:
+            conn = _connect(path)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO outputs (hash, content, size) VALUES (?, ?, ?)",
+                        [(h, content, len(content)) for h, content in buffer["outputs"].items()],
+                    )
+                    conn.executemany(
+                        "INSERT INTO failures (timestamp, task, attempt, duration, tokens_in, "
+                        "tokens_out, exit_code, output_hash, snapshot_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        buffer["rows"],
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Keep the rows buffered (ahead of any logged since) for the next flush
+            print(f"Error writing failure log {path}, keeping {len(buffer['rows'])} row(s) for the next flush: {e}")
+            with _buffer_lock:
+                pending = _buffers.get(path)
+                if pending is not None:
+                    buffer["rows"].extend(pending["rows"])
+                    buffer["outputs"].update(pending["outputs"])
+                _buffers[path] = buffer
+
+atexit.register(flush)
+
+def iter_failures(log_file=LOG_FILE, with_output=True):
+    """Streams logged failures as dicts, oldest first, without loading the whole log."""
+    if not os.path.exists(log_file):
+        return
+    conn = _connect(log_file)
+    conn.row_factory = sqlite3.Row
+    try:
+        if with_output:
+            query = (
+                "SELECT f.*, o.content AS error_output FROM failures f "
+                "JOIN outputs o ON o.hash = f.output_hash ORDER BY f.id"
+            )
+        else:
+            query = "SELECT * FROM failures ORDER BY id"
+        for row in conn.execute(query):
+            yield dict(row)
+    finally:
+        conn.close()
+
+@contextlib.contextmanager
+def open_output_reader(log_file=LOG_FILE):
+    """Yields a function that looks up stored outputs by content hash over one connection."""
+    conn = _connect(log_file)
+
+    def read(output_hash):
+        row = conn.execute("SELECT content FROM outputs WHERE hash = ?", (output_hash,)).fetchone()
+        return row[0] if row else None
+
+    try:
+        yield read
+    finally:
+        conn.close()
+
+def get_output(output_hash, log_file=LOG_FILE):
+    """Returns the stored output for a content hash, or None."""
+    with open_output_reader(log_file) as read:
+        return read(output_hash)
+
+def has_failures(log_file=LOG_FILE):
+    """Checks whether the log exists and holds at least one failure."""
+    if not os.path.exists(log_file):
+        return False
+    try:
+        conn = _connect(log_file)
+        try:
+            return conn.execute("SELECT 1 FROM failures LIMIT 1").fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+def clear_log(log_file=LOG_FILE):
+    """Deletes the log database along with its WAL and shared-memory files."""
+    with _buffer_lock:
+        _buffers.pop(log_file, None)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(log_file + suffix):
+            os.remove(log_file + suffix)
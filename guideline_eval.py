@@ -0,0 +1,179 @@
+"""
+A/B evaluation of guideline sets by replaying logged failures.
+
+A case is a task from the failure log together with the project snapshot it first
+failed on (see snapshot_store.py). Every case is replayed once per guideline set: a
+scratch workspace gets the snapshot as project/, the guideline set and the system
+prompt, and `mcp.py <task>` runs in it as its own process. All runs go in parallel.
+Per set, the evaluation measures the fix rate, attempts per fix, tokens and wall time.
+`compare` promotes the candidate set only if it does measurably better.
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import failure_log
+import snapshot_store
+import guideline_store
+import rag_index
+import tracing
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+MCP_SCRIPT = os.path.join(ENGINE_ROOT, "mcp.py")
+SYSTEM_PROMPT_FILE = "system_prompt.md"
+# Logged failures replayed per guideline set, and how many replays run at once
+EVAL_CASES = int(os.environ.get("RDE_EVAL_CASES", "3"))
+EVAL_WORKERS = int(os.environ.get("RDE_EVAL_WORKERS", "4"))
+# Replays per case and guideline set; repeats average out sampling noise
+EVAL_REPEATS = max(1, int(os.environ.get("RDE_EVAL_REPEATS", "1")))
+# A replay that runs longer than this counts as not fixed
+EVAL_TIMEOUT = float(os.environ.get("RDE_EVAL_TIMEOUT", "900"))
+# Runs per guideline set needed before tokens or wall time alone can promote a rewrite;
+# below that their differences are within run-to-run noise
+MIN_COST_RUNS = int(os.environ.get("RDE_EVAL_MIN_COST_RUNS", "10"))
+# Improvement required on tokens or wall time when fix rate and attempts are equal, and
+# how much the other of the two may get worse at the same time
+TOKEN_GAIN = 0.05
+WALL_GAIN = 0.10
+WALL_SLACK = 0.25
+TOKEN_SLACK = 0.05
+
+def select_cases(log_file, project_dir, count=EVAL_CASES):
+    """
+    Picks up to `count` replayable cases from the failure log, newest first: distinct
+    tasks with the snapshot of their first failing attempt, if that snapshot still exists.
+    """
+    store = snapshot_store.SnapshotStore(project_dir)
+    rows = [row for row in failure_log.iter_failures(log_file, with_output=False) if row["attempt"] == 0 and row.get("snapshot_id")]
+    cases, seen = [], set()
+    for row in reversed(rows):
+        key = (row["task"], row["snapshot_id"])
+        if key in seen or store.load(row["snapshot_id"]) is None:
+            continue
+        seen.add(key)
+        cases.append({"task": row["task"], "snapshot_id": row["snapshot_id"]})
+        if len(cases) == count:
+            break
+    return cases
+
+def prepare_workspace(case, guideline_files, workspace, store):
+    """Fills a scratch workspace with the case's project snapshot, a guideline set and the system prompt."""
+    store.materialize(case["snapshot_id"], os.path.join(workspace, "project"))
+    guideline_store.write_set(guideline_files, workspace)
+    if os.path.exists(SYSTEM_PROMPT_FILE):
+        shutil.copy2(SYSTEM_PROMPT_FILE, os.path.join(workspace, SYSTEM_PROMPT_FILE))
+
+def replay(case, arm, guideline_files, workspace, store):
+    """Runs mcp.py on one case with one guideline set. Returns the run's measurements."""
+    prepare_workspace(case, guideline_files, workspace, store)
+    trace_file = os.path.join(workspace, "trace.jsonl")
+    trace_id = uuid.uuid4().hex[:16]
+    env = dict(os.environ)
+    env.update({
+        "RDE_TRACE": "1", "RDE_TRACE_FILE": trace_file, tracing.TRACE_ID_ENV: trace_id,
+        "RDE_SNAPSHOT_DIR": os.path.join(workspace, "snapshots"),
+        # Cached replies would replay the original run instead of asking the model again
+        "AI_CACHE_MODE": "off",
+        # The workspace has no knowledge base of its own; both arms get production's references
+        "RDE_RAG_DIR": rag_index.RAG_DIR,
+    })
+    # All replays of one evaluation share a rate budget, like batch jobs
+    env.setdefault("AI_RATE_BUDGET_DB", os.path.join(os.path.dirname(workspace), "rate_budget.db"))
+    env.pop(tracing.PARENT_SPAN_ENV, None)
+    env.pop("RDE_CHROME_TRACE", None)
+
+    started = time.monotonic()
+    try:
+        process = subprocess.run(
+            [sys.executable, MCP_SCRIPT, case["task"]], cwd=workspace, env=env,
+            capture_output=True, text=True, timeout=EVAL_TIMEOUT,
+        )
+        success, output = process.returncode == 0, process.stdout + process.stderr
+    except subprocess.TimeoutExpired:
+        success, output = False, f"Timed out after {EVAL_TIMEOUT}s\n"
+    wall = time.monotonic() - started
+    with open(os.path.join(workspace, "mcp.log"), 'w', encoding='utf-8') as f:
+        f.write(output)
+
+    loop = next((s for s in tracing.load_spans(trace_file, trace_id) if s["name"] == "mcp.main_loop"), None)
+    attributes = loop["attributes"] if loop else {}
+    return {
+        "arm": arm,
+        "task": case["task"],
+        "snapshot_id": case["snapshot_id"],
+        "success": success,
+        "attempts": attributes.get("attempts"),
+        "tokens": (attributes.get("tokens_in") or 0) + (attributes.get("tokens_out") or 0),
+        "wall": round(wall, 3),
+    }
+
+def summarize(runs):
+    """Aggregates the runs of one guideline set."""
+    fixed = [run for run in runs if run["success"]]
+    mean = lambda values: round(sum(values) / len(values), 3) if values else None
+    return {
+        "cases": len({(run["task"], run["snapshot_id"]) for run in runs}),
+        "runs": len(runs),
+        "fixed": len(fixed),
+        "fix_rate": round(len(fixed) / len(runs), 3) if runs else 0.0,
+        "attempts_per_fix": mean([run["attempts"] or 0 for run in fixed]),
+        "tokens": mean([run["tokens"] for run in runs]),
+        "wall": mean([run["wall"] for run in runs]),
+    }
+
+@tracing.traced("meta.evaluate")
+def evaluate(base_files, candidate_files, cases, project_dir="project", workers=EVAL_WORKERS, repeats=EVAL_REPEATS):
+    """
+    Replays `cases` `repeats` times each with the base and the candidate guideline set,
+    all in parallel. Returns {"base": summary, "candidate": summary, "runs": [...]}.
+    """
+    store = snapshot_store.SnapshotStore(project_dir)
+    eval_dir = tempfile.mkdtemp(prefix="rde-eval-")
+    arms = {"base": base_files, "candidate": candidate_files}
+    jobs = [(case, arm) for case in cases for _ in range(repeats) for arm in arms]
+    print(f"\n> Replaying {len(cases)} logged failure(s) with the current and the rewritten guidelines ({len(jobs)} runs)")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+            futures = [
+                executor.submit(tracing.in_context(replay), case, arm, arms[arm], os.path.join(eval_dir, f"{arm}-{number}"), store)
+                for number, (case, arm) in enumerate(jobs)
+            ]
+            runs = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(eval_dir, ignore_errors=True)
+    for run in runs:
+        print(f"  [{run['arm']}] {'fixed' if run['success'] else 'not fixed'} in {run['attempts']} attempt(s), "
+              f"{run['tokens']} tokens, {run['wall']:.1f}s: {run['task'][:60]}")
+    evaluation = {name: summarize([run for run in runs if run["arm"] == name]) for name in arms}
+    tracing.annotate(cases=len(cases), base_fixed=evaluation["base"]["fixed"], candidate_fixed=evaluation["candidate"]["fixed"])
+    return dict(evaluation, runs=runs)
+
+def compare(base, candidate):
+    """
+    Decides whether the candidate set is better. Returns (promote, reason). In order: fix
+    rate, then attempts per fix, then tokens or wall time, each only if nothing earlier
+    got worse. Tokens and wall time only count with at least MIN_COST_RUNS runs per set.
+    """
+    if candidate["fix_rate"] != base["fix_rate"]:
+        better = candidate["fix_rate"] > base["fix_rate"]
+        return better, f"fix rate {base['fix_rate']:.0%} -> {candidate['fix_rate']:.0%}"
+    if not candidate["fixed"]:
+        return False, "neither guideline set fixed any replayed failure"
+    if candidate["attempts_per_fix"] != base["attempts_per_fix"]:
+        better = candidate["attempts_per_fix"] < base["attempts_per_fix"]
+        return better, f"attempts per fix {base['attempts_per_fix']} -> {candidate['attempts_per_fix']}"
+    runs = min(base.get("runs", base["cases"]), candidate.get("runs", candidate["cases"]))
+    if runs < MIN_COST_RUNS:
+        return False, f"same fix rate and attempts; {runs} run(s) per set are too few to promote on tokens or wall time (need {MIN_COST_RUNS})"
+    tokens_old, tokens_new = base["tokens"] or 0, candidate["tokens"] or 0
+    wall_old, wall_new = base["wall"] or 0, candidate["wall"] or 0
+    if tokens_new < tokens_old * (1 - TOKEN_GAIN) and wall_new <= wall_old * (1 + WALL_SLACK):
+        return True, f"tokens {tokens_old} -> {tokens_new}"
+    if wall_new < wall_old * (1 - WALL_GAIN) and tokens_new <= tokens_old * (1 + TOKEN_SLACK):
+        return True, f"wall time {wall_old}s -> {wall_new}s"
+    return False, "no measurable improvement in fix rate, attempts, tokens or wall time"
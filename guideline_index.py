@@ -0,0 +1,95 @@
+import os
+import re
+import glob
+from bm25 import BM25Index
+
+# --- CONFIGURATION ---
+GUIDELINES_DIR = "guidelines"
+MEMORY_FILE = os.path.join("persistency", "memory.md")
+HEADING = re.compile(r"^#{1,6}\s+\S", re.MULTILINE)
+
+def split_sections(text):
+    """
+    Splits markdown into sections at its headings. Returns dicts with the heading line,
+    the section text (heading included) and its [start, end) offsets in `text`, so a
+    section can be replaced in place. Text before the first heading is its own section.
+    """
+    starts = [match.start() for match in HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        body = text[start:end]
+        first_line = body.split("\n", 1)[0]
+        sections.append({
+            "heading": first_line.strip() if HEADING.match(first_line) else "",
+            "text": body,
+            "start": start,
+            "end": end,
+        })
+    return sections
+
+def _has_content(section):
+    """True if a section has more than its heading, so it is worth retrieving."""
+    body = section["text"]
+    if section["heading"]:
+        body = body.split("\n", 1)[1] if "\n" in body else ""
+    return bool(re.sub(r"[\s\-*#]", "", body))
+
+def load_sections(guidelines_dir=GUIDELINES_DIR, memory_file=MEMORY_FILE):
+    """Reads the guideline files and the memory file and returns their non-empty sections."""
+    paths = sorted(glob.glob(os.path.join(guidelines_dir, "*.md")))
+    if memory_file and os.path.exists(memory_file):
+        paths.append(memory_file)
+    sections = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Could not read {path}: {e}")
+            continue
+        title = ""
+        for section in split_sections(text):
+            if section["heading"].startswith("# "):
+                title = section["heading"]
+            if not _has_content(section):
+                continue
+            section["path"] = path
+            section["title"] = title
+            sections.append(section)
+    return sections
+
+def find_relevant_sections(query, top_k=2, guidelines_dir=GUIDELINES_DIR, memory_file=MEMORY_FILE):
+    """
+    Ranks guideline and memory sections against `query` with BM25 and returns the best
+    `top_k`, each with its `score`. The file title is indexed with every section so a
+    query can match a file's subject as well as the section's own words.
+    """
+    sections = load_sections(guidelines_dir, memory_file)
+    if not sections:
+        return []
+    index = BM25Index([
+        f"{section['title']}\n{os.path.basename(section['path'])}\n{section['text']}" for section in sections
+    ])
+    results = []
+    for position, score in index.search(query, top_k):
+        section = dict(sections[position], score=score)
+        results.append(section)
+    return results
+
+def apply_replacements(text, replacements):
+    """
+    Returns `text` with new text for some of its sections. `replacements` is a list of
+    (section, new_text) pairs for sections returned by `find_relevant_sections`.
+    Returns None if `text` is not the text the sections were read from.
+    """
+    for section, _ in replacements:
+        if text[section["start"]:section["end"]] != section["text"]:
+            return None
+
+    # Later sections first, so earlier offsets stay valid
+    for section, new_text in sorted(replacements, key=lambda pair: pair[0]["start"], reverse=True):
+        trailing = section["text"][len(section["text"].rstrip("\n")):]
+        text = text[:section["start"]] + new_text.rstrip("\n") + (trailing or "\n") + text[section["end"]:]
+    return text
@@ -0,0 +1,148 @@
+"""
+Versions of the guideline set: guidelines/*.md and persistency/memory.md.
+
+meta_mcp.py records the live guideline set and every rewrite the Meta-AI proposes as
+a version: the full text of each file, its parent version, a status ("live",
+"candidate", "promoted" or "rejected") and the evaluation that decided it. Version ids
+are derived from the content. HEAD names the version in use.
+
+    python guideline_store.py list              versions, newest first
+    python guideline_store.py show <id>         a version's evaluation and changed files
+    python guideline_store.py checkout <id>     write a version back to the guidelines
+"""
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import guideline_index
+
+# --- CONFIGURATION ---
+# Relative to the working directory, like the guidelines, so batch workspaces keep their own
+VERSIONS_DIR = os.environ.get("RDE_GUIDELINE_VERSIONS", os.path.join("persistency", "guideline_versions"))
+GUIDELINES_DIR = guideline_index.GUIDELINES_DIR
+MEMORY_FILE = guideline_index.MEMORY_FILE
+
+def read_set(guidelines_dir=GUIDELINES_DIR, memory_file=MEMORY_FILE):
+    """Returns the live guideline set as {path: text}."""
+    paths = sorted(glob.glob(os.path.join(guidelines_dir, "*.md")))
+    if memory_file and os.path.exists(memory_file):
+        paths.append(memory_file)
+    files = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            files[path.replace(os.sep, "/")] = f.read()
+    return files
+
+def write_set(files, root="."):
+    """Writes a guideline set under `root`, one atomic replace per file."""
+    for path, text in files.items():
+        target = os.path.join(root, *path.split("/"))
+        os.makedirs(os.path.dirname(target) or root, exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, target)
+
+def version_id(files):
+    return hashlib.sha256(json.dumps(sorted(files.items())).encode("utf-8")).hexdigest()[:12]
+
+def _version_path(version):
+    return os.path.join(VERSIONS_DIR, f"{version}.json")
+
+def _save(record):
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    path = _version_path(record["id"])
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=1)
+    os.replace(temp_path, path)
+
+def load_version(version):
+    try:
+        with open(_version_path(version), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_version(files, parent=None, status="candidate", note=""):
+    """
+    Records a guideline set and returns its id. A set that was recorded before keeps
+    its status, parent and evaluation.
+    """
+    version = version_id(files)
+    if load_version(version) is None:
+        _save({
+            "id": version, "parent": parent, "created": time.time(), "status": status,
+            "note": note, "evaluation": None, "files": files,
+        })
+    return version
+
+def set_status(version, status, evaluation=None):
+    record = load_version(version)
+    if record is not None:
+        record["status"] = status
+        record["decided"] = time.time()
+        if evaluation is not None:
+            record["evaluation"] = evaluation
+        _save(record)
+
+def head():
+    try:
+        with open(os.path.join(VERSIONS_DIR, "HEAD"), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def set_head(version):
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    with open(os.path.join(VERSIONS_DIR, "HEAD"), 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+
+def list_versions():
+    """Returns all versions without their file texts, newest first."""
+    versions = []
+    for path in glob.glob(os.path.join(VERSIONS_DIR, "*.json")):
+        record = load_version(os.path.basename(path)[:-5])
+        if record:
+            record["files"] = sorted(record["files"])
+            versions.append(record)
+    return sorted(versions, key=lambda record: record["created"], reverse=True)
+
+def changed_files(record):
+    """Returns the paths a version changes relative to its parent."""
+    parent = load_version(record["parent"]) if record.get("parent") else None
+    if parent is None:
+        return sorted(record["files"])
+    paths = set(record["files"]) | set(parent["files"])
+    return sorted(path for path in paths if record["files"].get(path) != parent["files"].get(path))
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "list":
+        current = head()
+        for record in list_versions():
+            marker = "*" if record["id"] == current else " "
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record["created"]))
+            print(f"{marker} {record['id']}  {created}  {record['status']:<9} parent {record['parent'] or '-':<12}  {record['note']}")
+    elif command == "show" and len(sys.argv) == 3:
+        record = load_version(sys.argv[2])
+        if record is None:
+            print(f"Unknown version {sys.argv[2]}")
+            sys.exit(1)
+        print(f"Version {record['id']} ({record['status']}), parent {record['parent'] or '-'}: {record['note']}")
+        print("Changed files: " + ", ".join(changed_files(record)))
+        if record.get("evaluation"):
+            print(json.dumps(record["evaluation"], indent=2))
+    elif command == "checkout" and len(sys.argv) == 3:
+        record = load_version(sys.argv[2])
+        if record is None:
+            print(f"Unknown version {sys.argv[2]}")
+            sys.exit(1)
+        write_set(record["files"])
+        set_head(record["id"])
+        print(f"Guidelines set to version {record['id']}.")
+    else:
+        print("Usage: python guideline_store.py list | show <id> | checkout <id>")
+        sys.exit(1)
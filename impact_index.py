@@ -0,0 +1,250 @@
+"""
+Test impact index: which tests execute which project files and functions.
+
+Loaded into pytest with `-p impact_index --impact-index=<path>`, the plugin records,
+per test, every function in the project that the test calls, plus which tests failed.
+`select_tests` uses the index to pick the tests affected by an edit.
+
+Recording profiles every call, so it is done only where the index is stale: the index
+keeps the size and mtime of each project Python file, and a test is profiled again only
+if it has no record yet or one of the files it executes changed since. A run of an
+unchanged project records nothing but the failing tests.
+"""
+import os
+import sys
+import ast
+import json
+import hashlib
+import pytest
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+IMPACT_INDEX_DIR = os.environ.get("RDE_IMPACT_INDEX_DIR", os.path.join(ENGINE_ROOT, "persistency", "cache", "impact"))
+TEST_FILE_PREFIX = "test_"
+TEST_FILE_SUFFIX = "_test.py"
+
+def index_path_for(project_dir):
+    """Returns the index file for a project directory."""
+    project_dir = os.path.abspath(project_dir)
+    digest = hashlib.sha256(project_dir.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(IMPACT_INDEX_DIR, f"{digest}.json")
+
+def load_index(path):
+    """Loads an index, returning an empty one if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"project_dir": None, "tests": {}, "failing": [], "files": {}}
+
+def _save_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, path)
+
+def _test_key(item):
+    """Identifies a test by absolute file path plus the part of its node id after the file."""
+    suffix = item.nodeid.split("::", 1)[1] if "::" in item.nodeid else ""
+    return f"{os.path.abspath(str(item.path))}::{suffix}"
+
+def scan_files(project_root):
+    """Returns {absolute path: [size, mtime_ns]} for the Python files under a project directory."""
+    files = {}
+    for root, dir_names, file_names in os.walk(project_root):
+        dir_names[:] = [name for name in dir_names if not name.startswith(".") and name != "__pycache__"]
+        for name in file_names:
+            if name.endswith(".py"):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns]
+    return files
+
+def is_test_file(path):
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith(TEST_FILE_PREFIX) or name.endswith(TEST_FILE_SUFFIX))
+
+# --- PYTEST PLUGIN ---
+def pytest_addoption(parser):
+    parser.addoption("--impact-index", default=None, help="Record per-test project calls into this index file.")
+    parser.addoption("--impact-root", default=None, help="Only calls into files under this directory are recorded.")
+
+def pytest_configure(config):
+    path = config.getoption("--impact-index")
+    if path:
+        root = config.getoption("--impact-root") or str(config.rootpath)
+        config.pluginmanager.register(ImpactRecorder(path, root), "impact-recorder")
+
+class ImpactRecorder:
+    """Records the project functions each test calls and the tests that failed."""
+
+    def __init__(self, index_path, project_root):
+        self.index_path = index_path
+        self.project_root = os.path.abspath(project_root)
+        self.calls = {}
+        self.failed = set()
+        self.ran = set()
+        self._inside = {}
+        index = load_index(index_path)
+        self.recorded = index.get("tests", {})
+        self.current = scan_files(self.project_root)
+        known = index.get("files", {})
+        # Files changed, added or removed since their dependents were last profiled
+        self.stale = {path for path in set(self.current) | set(known) if self.current.get(path) != known.get(path)}
+
+    def needs_recording(self, key):
+        """True if a test has no record yet or executes a file that changed since it was recorded."""
+        dependencies = self.recorded.get(key)
+        return dependencies is None or not self.stale.isdisjoint(dependencies)
+
+    def _profiler(self, hits):
+        prefix = self.project_root + os.sep
+        inside = self._inside
+
+        def profile(frame, event, arg):
+            if event != "call":
+                return
+            code = frame.f_code
+            filename = code.co_filename
+            known = inside.get(filename)
+            if known is None:
+                known = inside[filename] = os.path.abspath(filename).startswith(prefix)
+            if known:
+                hits.add((filename, getattr(code, "co_qualname", code.co_name)))
+        return profile
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        key = _test_key(item)
+        self.ran.add(key)
+        if not self.needs_recording(key):
+            yield
+            return
+        hits = set()
+        previous = sys.getprofile()
+        sys.setprofile(self._profiler(hits))
+        try:
+            yield
+        finally:
+            sys.setprofile(previous)
+        dependencies = set()
+        for filename, function in hits:
+            path = os.path.abspath(filename)
+            dependencies.add(path)
+            dependencies.add(f"{path}::{function}")
+        self.calls[key] = sorted(dependencies)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        if outcome.get_result().failed:
+            self.failed.add(_test_key(item))
+
+    def pytest_sessionfinish(self, session):
+        index = load_index(self.index_path)
+        index["project_dir"] = self.project_root
+        index["tests"].update(self.calls)
+        # Forget tests whose file is gone; keep entries for tests this run did not select
+        index["tests"] = {
+            key: deps for key, deps in index["tests"].items()
+            if os.path.exists(key.split("::", 1)[0])
+        }
+        failing = set(index.get("failing", [])) - self.ran
+        index["failing"] = sorted(failing | self.failed)
+        # A changed file counts as recorded once every test that executes it was profiled
+        # again; after a partial run (impact tests, -x) the rest stay stale
+        files = index.get("files", {})
+        for path in self.stale:
+            if path not in self.current:
+                files.pop(path, None)
+            elif all(key in self.calls for key, deps in index["tests"].items() if path in deps):
+                files[path] = self.current[path]
+        index["files"] = files
+        try:
+            _save_index(self.index_path, index)
+        except OSError as e:
+            print(f"Could not save test impact index: {e}", file=sys.stderr)
+
+# --- SELECTION ---
+def changed_functions(old_source, new_source):
+    """
+    Returns the qualified names of functions whose definition changed between two
+    versions of a module, or None if module-level code changed and every test that
+    touches the file is affected.
+    """
+    try:
+        old_tree, new_tree = ast.parse(old_source), ast.parse(new_source)
+    except (SyntaxError, ValueError):
+        return None
+
+    def collect(tree):
+        functions = {}
+        module_level = []
+
+        def visit(body, prefix, top_level):
+            for node in body:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    functions[prefix + node.name] = ast.dump(node)
+                elif isinstance(node, ast.ClassDef):
+                    visit(node.body, f"{prefix}{node.name}.", False)
+                    # Bases, decorators and class attributes count as module-level changes
+                    module_level.append([prefix + node.name] + [
+                        ast.dump(n) for n in node.bases + node.keywords + node.decorator_list + [
+                            n for n in node.body if not isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+                        ]
+                    ])
+                elif top_level:
+                    module_level.append(ast.dump(node))
+        visit(tree.body, "", True)
+        return functions, module_level
+
+    old_functions, old_module = collect(old_tree)
+    new_functions, new_module = collect(new_tree)
+    if old_module != new_module:
+        return None
+    names = set(old_functions) | set(new_functions)
+    return {name for name in names if old_functions.get(name) != new_functions.get(name)}
+
+def _node_arg(key):
+    """Turns an index key back into a pytest command-line node id relative to the cwd."""
+    path, suffix = key.split("::", 1)
+    path = os.path.relpath(path)
+    return f"{path}::{suffix}" if suffix else path
+
+def select_tests(project_dir, changed_files, changed_symbols=None):
+    """
+    Returns pytest arguments for the tests affected by the changed files plus the tests
+    that failed last time, or None when the index cannot tell and everything should run.
+    `changed_symbols` maps a changed file to the set of functions that changed in it.
+    """
+    index = load_index(index_path_for(project_dir))
+    tests = index.get("tests", {})
+    if not tests:
+        return None
+
+    selected = set(index.get("failing", []))
+    extra_paths = set()
+    for changed in changed_files:
+        path = os.path.abspath(changed)
+        if os.path.basename(path) == "conftest.py":
+            return None
+        if is_test_file(path):
+            in_file = [key for key in tests if key.split("::", 1)[0] == path]
+            selected.update(in_file)
+            if not in_file:
+                extra_paths.add(path) # A new test file runs whole
+            continue
+
+        functions = (changed_symbols or {}).get(changed)
+        if functions is None:
+            targets = {path}
+        else:
+            targets = {f"{path}::{name}" for name in functions}
+        selected.update(key for key, deps in tests.items() if targets.intersection(deps))
+
+    selected = {key for key in selected if os.path.exists(key.split("::", 1)[0])}
+    return sorted(_node_arg(key) for key in selected) + sorted(os.path.relpath(p) for p in extra_paths)
@@ -1,122 +1,65 @@
 import os
-import subprocess
 import sys
-import csv
-from datetime import datetime
-import requests # Added for API calls
-import json # Added for JSON handling
+import json
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import impact_index
+import failure_log
+import rag_index
+import error_clusters
+import symbol_index
+import patch_apply
+import snapshot_store
+import verification_worker
+import verification_gate
+from ai_client import AI_MODEL_PROVIDER
+import provider_router
+from context_builder import CONTEXT_HEADER, build_context_sections
+import prompt_packer
+import tracing
 
 # --- CONFIGURATION ---
 MAX_RETRIES = 3
 PROJECT_DIR = "project"
 GUIDELINES_DIR = "guidelines"
-LOG_FILE = "engine_log.csv"
-
-# --- AI MODEL CONFIGURATION ---
-# Set your desired AI model provider here: "gemini", "openai", "claude", "openrouter"
-AI_MODEL_PROVIDER = os.environ.get("AI_MODEL_PROVIDER", "gemini").lower()
-
-# API Keys (read from environment variables for security)
-# Ensure these environment variables are set before running the engine
-API_KEYS = {
-    "gemini": os.environ.get("GEMINI_API_KEY"),
-    "openai": os.environ.get("OPENAI_API_KEY"),
-    "claude": os.environ.get("CLAUDE_API_KEY"),
-    "openrouter": os.environ.get("OPENROUTER_API_KEY"),
-}
-
-# --- GENERIC AI API CALLER ---
-def call_ai_api(provider, prompt, model_name=None, temperature=0.7):
-    """Makes a generic API call to the specified AI provider."""
-    api_key = API_KEYS.get(provider)
-    if not api_key:
-        raise ValueError(f"API key for {provider} not found. Please set the corresponding environment variable.")
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-    payload = {}
-    url = ""
-    text_extraction_path = [] # Path to extract text from JSON response
-
-    if provider == "gemini":
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name or 'gemini-pro'}:generateContent?key={api_key}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": temperature
-            }
-        }
-        text_extraction_path = ["candidates", 0, "content", "parts", 0, "text"]
-    elif provider == "openai":
-        url = "https://api.openai.com/v1/chat/completions"
-        headers["Authorization"] = f"Bearer {api_key}"
-        payload = {
-            "model": model_name or "gpt-3.5-turbo",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature
-        }
-        text_extraction_path = ["choices", 0, "message", "content"]
-    elif provider == "claude":
-        # Anthropic (Claude) API
-        url = "https://api.anthropic.com/v1/messages"
-        headers["x-api-key"] = api_key
-        headers["anthropic-version"] = "2023-06-01" # Required for Anthropic
-        headers["Content-Type"] = "application/json"
-        payload = {
-            "model": model_name or "claude-3-opus-20240229",
-            "max_tokens": 4000, # Claude requires max_tokens
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature
-        }
-        text_extraction_path = ["content", 0, "text"]
-    elif provider == "openrouter":
-        # OpenRouter API (can route to many models)
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers["Authorization"] = f"Bearer {api_key}"
-        headers["HTTP-Referer"] = "https://your-app-url.com" # Replace with your app URL
-        headers["X-Title"] = "Your App Name" # Replace with your app name
-        payload = {
-            "model": model_name or "mistralai/mistral-7b-instruct", # Example OpenRouter model
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature
-        }
-        text_extraction_path = ["choices", 0, "message", "content"]
-    else:
-        raise ValueError(f"Unsupported AI model provider: {provider}")
+LOG_FILE = failure_log.LOG_FILE
+RAG_DIR = rag_index.RAG_DIR
+# Knowledge-base chunks from persistency/rag/ added to each fix prompt (0 disables retrieval)
+RAG_TOP_K = int(os.environ.get("RDE_RAG_TOP_K", "3"))
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-        
-        response_json = response.json()
-        
-        # Extract text based on provider-specific path
-        text = response_json
-        for key in text_extraction_path:
-            if isinstance(text, list) and isinstance(key, int):
-                text = text[key]
-            elif isinstance(text, dict) and isinstance(key, str):
-                text = text.get(key)
-            else:
-                raise KeyError(f"Invalid path for text extraction: {key} in {text_extraction_path}")
-        
-        return text
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
 
-    except requests.exceptions.RequestException as e:
-        print(f"Network or HTTP error during API call to {provider}: {e}")
-        raise
-    except json.JSONDecodeError as e:
-        print(f"JSON decoding error from {provider} response: {e}")
-        print(f"Response content: {response.text}")
-        raise
-    except KeyError as e:
-        print(f"Could not extract text from {provider} response. Path error: {e}")
-        print(f"Response JSON: {response_json}")
-        raise
-    except Exception as e:
-        print(f"An unexpected error occurred during API call to {provider}: {e}")
-        raise
+# "warm" runs pytest in a forked, pre-imported worker; "cold" starts a new interpreter per run
+VERIFY_MODE = os.environ.get("RDE_VERIFY_MODE", "warm").lower()
+# Run the tests affected by an edit before the full suite (see impact_index.py)
+TEST_IMPACT = os.environ.get("RDE_TEST_IMPACT", "1").lower() not in ("0", "false", "no")
+
+# Completions requested per attempt. Above 1, candidates are verified concurrently in
+# scratch copies of the project and the first one that passes wins.
+FIX_CANDIDATES = max(1, int(os.environ.get("RDE_FIX_CANDIDATES", "1")))
+
+# How the AI returns fixes: "blocks" asks for SEARCH/REPLACE edits to the files the
+# failing traceback points at; "whole" asks for the complete first file, which can be
+# streamed straight to disk.
+EDIT_FORMAT = os.environ.get("RDE_EDIT_FORMAT", "blocks").lower()
+# Project files shown to the AI per attempt, picked with the symbol index
+MAX_EDIT_FILES = max(1, int(os.environ.get("RDE_MAX_EDIT_FILES", "3")))
+
+# Stream completions token by token (set AI_STREAM=1). Streamed code is written to a
+# temp file as it arrives and syntax-checked every SYNTAX_CHECK_INTERVAL lines.
+STREAM_RESPONSES = os.environ.get("AI_STREAM", "").lower() in ("1", "true", "yes")
+SYNTAX_CHECK_INTERVAL = 20
+
+# SyntaxError messages that only mean the streamed code is not finished yet
+INCOMPLETE_CODE_MARKERS = (
+    "was never closed",
+    "unexpected EOF",
+    "unterminated triple-quoted string",
+    "expected an indented block",
+)
 
 def get_file_content(filepath):
     """Helper function to read file content."""
@@ -126,111 +69,659 @@ def get_file_content(filepath):
     except FileNotFoundError:
         return f"Error: File not found at {filepath}"
 
-def log_failure(task, attempt, error_output):
-    """Logs a verification failure to the CSV log file."""
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(["timestamp", "task", "attempt", "error_output"])
-    
-    with open(LOG_FILE, 'a', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([datetime.now().isoformat(), task, attempt, error_output])
+def log_failure(task, attempt, error_output, **details):
+    """
+    Logs a verification failure to the structured failure log (see failure_log.py).
+    `details` may carry duration, tokens_in, tokens_out and exit_code.
+    """
+    failure_log.log_failure(task, attempt, error_output, log_file=LOG_FILE, **details)
 
-def call_ai(prompt):
+def call_ai(prompt, use_cache=True):
     """
-    Calls the configured AI model to generate a response.
+    Calls the configured AI model (with failover, see provider_router.py) and returns the
+    response, or None if no provider could answer.
     """
     print(f"--- Calling AI ({AI_MODEL_PROVIDER}) ---")
     print(f"Prompt (truncated): {prompt[:500]}...")
     try:
-        # You can specify model_name and temperature here if needed,
-        # otherwise, defaults from call_ai_api will be used.
-        response_text = call_ai_api(AI_MODEL_PROVIDER, prompt)
+        response_text = provider_router.call(prompt, use_cache=use_cache)
         print("--- AI Response Received ---")
         return response_text
     except Exception as e:
         print(f"Error in call_ai: {e}")
-        # Return a default error message or re-raise, depending on desired behavior
-        return "Error: AI model call failed. Check logs for details."
+        return None
 
+def call_ai_stream(prompt):
+    """
+    Streams a response from the configured AI model as a generator of text chunks.
+    """
+    print(f"--- Streaming AI ({AI_MODEL_PROVIDER}) ---")
+    print(f"Prompt (truncated): {prompt[:500]}...")
+    first_chunk = True
+    try:
+        for chunk in provider_router.stream(prompt):
+            if first_chunk:
+                print("--- AI Stream Started ---")
+                first_chunk = False
+            yield chunk
+        print("--- AI Stream Complete ---")
+    except Exception as e:
+        print(f"Error in call_ai_stream: {e}")
+        raise
 
-def run_verification():
+def iter_code_lines(chunks):
     """
-    Runs the verification command (pytest) and returns the result.
+    Re-splits text chunks into lines of code, dropping the Markdown code fence.
+    When the response opens with a fence, everything from the closing fence on is
+    commentary, so the rest of the stream is not read.
     """
-    command = [sys.executable, "-m", "pytest", PROJECT_DIR]
-    print(f"\n> Running verification: {' '.join(command)}")
-    result = subprocess.run(command, capture_output=True, text=True)
-    return result
+    buffer = ""
+    fenced = None # Unknown until the first non-blank line arrives
+    blank_lines = []
 
-def main_loop(task_description):
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            stripped = line.strip()
+            if fenced is None:
+                if not stripped:
+                    continue
+                fenced = stripped.startswith("```")
+                if fenced:
+                    continue
+            elif fenced and stripped.startswith("```"):
+                return
+            # Hold blank lines back so trailing whitespace never reaches the file
+            if not stripped:
+                blank_lines.append(line + "\n")
+                continue
+            yield from blank_lines
+            blank_lines = []
+            yield line + "\n"
+
+    tail = buffer.rstrip()
+    if fenced and tail.endswith("```"):
+        tail = tail[:-3].rstrip()
+    if tail.strip() and not (fenced is None and tail.strip().startswith("```")):
+        yield from blank_lines
+        yield tail + "\n"
+
+def find_early_syntax_error(partial_code):
     """
-    The main self-healing loop.
+    Returns the SyntaxError in partially streamed code that more tokens cannot fix,
+    or None if the code so far could still turn out valid.
     """
-    SYSTEM_PROMPT_FILE = "system_prompt.md"
+    try:
+        compile(partial_code, "<streamed code>", "exec")
+    except SyntaxError as e:
+        complete_lines = partial_code.count("\n")
+        if e.lineno is None or e.lineno >= complete_lines - 1:
+            return None
+        if any(marker in str(e.msg) for marker in INCOMPLETE_CODE_MARKERS):
+            return None
+        return e
+    except ValueError:
+        return None
+    return None
 
-    context = "You are an autonomous AI software engineer. Your task is to fix a bug in the following project.\n"
+def write_code_atomically(chunks, file_path):
+    """
+    Writes code chunks to a temp file next to `file_path` as they arrive, then swaps
+    it in with an atomic rename. Returns the code written, or None if the completion
+    was aborted early because it cannot be valid Python; the file is untouched then.
+    """
+    directory = os.path.dirname(file_path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".rde-", suffix=".tmp")
+    check_syntax = file_path.endswith(".py")
+    written = []
+    lines_checked = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for line in iter_code_lines(chunks):
+                f.write(line)
+                written.append(line)
+                if check_syntax and len(written) - lines_checked >= SYNTAX_CHECK_INTERVAL:
+                    lines_checked = len(written)
+                    error = find_early_syntax_error("".join(written))
+                    if error:
+                        print(f"> Aborting completion: line {error.lineno}: {error.msg}")
+                        return None
+        if check_syntax:
+            try:
+                compile("".join(written), file_path, "exec")
+            except (SyntaxError, ValueError) as e:
+                print(f"> Discarding completion: it does not parse ({e}).")
+                return None
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+        return "".join(written)
+    finally:
+        # Closing the source stops a streamed completion we no longer want
+        if hasattr(chunks, "close"):
+            chunks.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
-    # Load the system prompt first
-    system_prompt_path = os.path.join(os.getcwd(), SYSTEM_PROMPT_FILE)
-    context += f"\n--- System Prompt: {SYSTEM_PROMPT_FILE} ---\n"
-    context += get_file_content(system_prompt_path)
+@tracing.traced("mcp.retrieve")
+def retrieve_references(task_description, error_output):
+    """Returns the knowledge-base chunks most relevant to the task and the current error."""
+    if RAG_TOP_K <= 0:
+        return []
+    query = f"{task_description}\n{error_clusters.error_query(error_output)}"
+    references = rag_index.retrieve(query, RAG_TOP_K, RAG_DIR)
+    tracing.annotate(chunks=len(references))
+    return references
 
-    # Then load other guidelines
-    for guideline_file in os.listdir(GUIDELINES_DIR):
-        # Ensure we don't try to load system_prompt.md again if it was somehow left in guidelines
-        if guideline_file == SYSTEM_PROMPT_FILE:
-            continue
-        context += f"\n--- Guideline: {guideline_file} ---\n"
-        context += get_file_content(os.path.join(GUIDELINES_DIR, guideline_file))
-    
-    file_to_fix_path = os.path.join(PROJECT_DIR, "main.py")
-    code_to_fix = get_file_content(file_to_fix_path)
-
-    initial_verification = run_verification()
-    error_output = initial_verification.stdout + "\n" + initial_verification.stderr
-    if initial_verification.returncode != 0:
-        log_failure(task_description, 0, error_output)
-
-    for i in range(MAX_RETRIES):
-        verification_result = run_verification()
-        if verification_result.returncode == 0:
-            print("\n--- Verification Succeeded! ---")
-            print("The code has been successfully fixed by the AI.")
-            return
-
-        print(f"\n--- Attempt {i + 1} of {MAX_RETRIES} ---")
-        
-        prompt = (
-            f"{context}\n"
-            f"The task is: {task_description}\n\n"
-            f"The file `{file_to_fix_path}` currently contains this code:\n"
-            f"```python\n{code_to_fix}\n```\n\n"
-            f"When I run the tests, I get this error:\n"
-            f"```\n{error_output}\n```\n\n"
-            "Please analyze the error and provide the complete, corrected code for the file. "
+@tracing.traced("mcp.build_prompt")
+def build_fix_prompt(context_sections, task_description, file_contents, error_output, references=(), rejection=None):
+    """
+    Packs the fix prompt into the provider's token budget. Task, the first file and the
+    instructions are always sent in full; the test output is compacted and capped, and
+    further files, retrieved references, then guidelines are dropped last-first when the
+    budget runs out. `file_contents` maps the files to show to their code, most relevant
+    first. `rejection` tells the AI what became of its previous reply (rejected, or
+    rolled back). Returns (prompt, packing report).
+    """
+    sections = [prompt_packer.make_section("header", CONTEXT_HEADER, prompt_packer.PRIORITY_TASK, required=True)]
+    for label, text in context_sections:
+        sections.append(prompt_packer.make_section(
+            label, text, prompt_packer.PRIORITY_GUIDELINES,
+            trimmable=label.startswith("System Prompt"),
+        ))
+    for reference in references:
+        label = f"Reference: {reference['path']}" + (f" > {reference['heading']}" if reference["heading"] else "")
+        sections.append(prompt_packer.make_section(
+            label, f"\n--- {label} ---\n{reference['text']}\n", prompt_packer.PRIORITY_REFERENCE, trimmable=False,
+        ))
+    sections.append(prompt_packer.make_section(
+        "task", f"\nThe task is: {task_description}\n\n",
+        prompt_packer.PRIORITY_TASK, required=True,
+    ))
+    for position, (path, code) in enumerate(file_contents.items()):
+        language = "python" if path.endswith(".py") else ""
+        # Edits must match the code exactly, so files are shown whole or not at all
+        sections.append(prompt_packer.make_section(
+            f"code: {path}", f"The file `{path}` currently contains this code:\n```{language}\n{code}\n```\n\n",
+            prompt_packer.PRIORITY_CODE, required=(position == 0), trimmable=False,
+        ))
+    sections.append(prompt_packer.make_section(
+        "test output",
+        f"When I run the tests, I get this error:\n```\n{prompt_packer.compact_test_output(error_output)}\n```\n\n",
+        prompt_packer.PRIORITY_TEST_OUTPUT, max_share=0.4,
+    ))
+    if rejection:
+        sections.append(prompt_packer.make_section(
+            "rejected edit",
+            f"{rejection}\n\n",
+            prompt_packer.PRIORITY_TEST_OUTPUT, max_share=0.1,
+        ))
+    if EDIT_FORMAT == "whole":
+        instructions = (
+            f"Please analyze the error and provide the complete, corrected code for `{next(iter(file_contents))}`. "
             "Do not add any commentary or apologies, just the full code."
         )
+    else:
+        instructions = (
+            "Please analyze the error and fix it with SEARCH/REPLACE edit blocks. Write the file's path on its "
+            f"own line, then:\n{patch_apply.SEARCH_MARKER}\n(exact lines from the current file)\n"
+            f"{patch_apply.DIVIDER_MARKER}\n(the lines that replace them)\n{patch_apply.REPLACE_MARKER}\n"
+            "The SEARCH lines must match the file exactly, including indentation, and be just long enough to be "
+            "unique. Use one block per change; blocks may edit any of the files above, and an empty SEARCH "
+            "creates a new file. A unified diff is accepted too. Do not add any commentary or apologies, "
+            "just the edits."
+        )
+    sections.append(prompt_packer.make_section("instructions", instructions, prompt_packer.PRIORITY_TASK, required=True))
+    return prompt_packer.pack_prompt(AI_MODEL_PROVIDER, sections)
+
+@tracing.traced("mcp.select_files")
+def select_files(task_description, error_output):
+    """Returns the project files to show the AI, most relevant first (see symbol_index.py)."""
+    index = symbol_index.build_index(PROJECT_DIR)
+    relevant = symbol_index.relevant_files(PROJECT_DIR, error_output, task_description, index, MAX_EDIT_FILES)
+    return [os.path.join(PROJECT_DIR, relative) for relative in relevant]
+
+def resolve_edit_path(path, shown_files):
+    """Maps a file name from an edit block to a path inside PROJECT_DIR, or raises PatchError."""
+    normalized = os.path.normpath(path)
+    for shown in shown_files:
+        if shown == normalized or shown.endswith(os.sep + normalized):
+            return shown
+    if not normalized.startswith(PROJECT_DIR + os.sep):
+        normalized = os.path.join(PROJECT_DIR, normalized)
+    if not os.path.abspath(normalized).startswith(os.path.abspath(PROJECT_DIR) + os.sep):
+        raise patch_apply.PatchError(f"{path} is outside {PROJECT_DIR}/.")
+    return normalized
+
+def edits_from_response(response, shown_files, file_contents):
+    """
+    Turns a completion into {path: new content}. SEARCH/REPLACE blocks or a unified diff
+    are applied to the current code; a reply without either is taken as the complete new
+    content of the first shown file. Every edited Python file must parse. Raises
+    PatchError if the reply cannot be used; nothing is written either way.
+    """
+    if response is None:
+        raise patch_apply.PatchError("The AI call failed.")
+
+    def read_file(path):
+        if path in file_contents:
+            return file_contents[path]
+        return get_file_content(path) if os.path.exists(path) else None
+
+    edits = patch_apply.apply_edits(response, read_file, lambda path: resolve_edit_path(path, shown_files))
+    if not edits:
+        code = "".join(iter_code_lines([response]))
+        if not code.strip():
+            raise patch_apply.PatchError("The reply contains no code.")
+        edits = {shown_files[0]: code}
+    edits = {path: content for path, content in edits.items() if content != read_file(path)}
+    if not edits:
+        raise patch_apply.PatchError("The edits change nothing.")
+    patch_apply.validate(edits)
+    return edits
+
+def pytest_args(targets):
+    """Builds the pytest arguments for `targets`, recording the test impact index when enabled."""
+    args = list(targets)
+    if TEST_IMPACT:
+        args += [
+            "-p", "impact_index",
+            f"--impact-index={impact_index.index_path_for(PROJECT_DIR)}",
+            f"--impact-root={os.path.abspath(PROJECT_DIR)}",
+        ]
+    return args
+
+@tracing.traced("mcp.pytest")
+def run_pytest(args, isolated=False, stage="full"):
+    """
+    Runs pytest with `args` under the stage's timeout and the resource limits, and
+    returns the CompletedProcess. Uses the warm worker unless `isolated` is set or warm
+    mode is unavailable.
+    """
+    command = [sys.executable, "-m", "pytest"] + list(args)
+    timeout = verification_gate.STAGE_TIMEOUTS[stage]
+    if not isolated and VERIFY_MODE == "warm" and verification_worker.is_supported():
+        print(f"\n> Running verification (warm worker): {' '.join(command)}")
+        try:
+            return verification_worker.run_in_worker(args, PROJECT_DIR, timeout=timeout, stage=stage)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Warm verification failed ({e}). Falling back to a cold run.")
+
+    print(f"\n> Running verification: {' '.join(command)}")
+    # The engine root must be importable for the impact_index plugin
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ENGINE_ROOT, env.get("PYTHONPATH")]))
+    return verification_gate.run_limited(verification_gate.limited_command("pytest", args), stage, env=env, timeout=timeout)
+
+@tracing.traced("mcp.import_check")
+def run_import_check(entries, isolated=False):
+    """Imports the changed modules in a child process under the import stage's timeout. Returns the CompletedProcess."""
+    timeout = verification_gate.STAGE_TIMEOUTS["import"]
+    if not isolated and VERIFY_MODE == "warm" and verification_worker.is_supported():
+        try:
+            return verification_worker.run_in_worker(entries, PROJECT_DIR, timeout=timeout, kind="import", stage="import")
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Warm import check failed ({e}). Falling back to a cold run.")
+    command = verification_gate.limited_command("import", [json.dumps(entries)])
+    return verification_gate.run_limited(command, "import", timeout=timeout)
+
+@tracing.traced("mcp.verify")
+def run_verification(isolated=False, changed_files=None, changed_symbols=None):
+    """
+    Runs the verification stages and returns a verification_gate.VerificationResult,
+    which reads like the CompletedProcess of the stage that decided it.
+    Given the files an edit changed, cheap stages come first and the first failure is
+    returned right away: the changed files are compiled, the changed modules imported,
+    then the affected and previously failing tests run with -x. The full suite only runs
+    once they pass. `changed_symbols` maps each changed file to its changed functions
+    (None: whole file).
+    """
+    span = tracing.current_span()
+    span.set(mode=VERIFY_MODE, impact_tests=0)
+    stages = []
+
+    def record(stage, result, started):
+        stages.append(verification_gate.stage_record(stage, result, time.perf_counter() - started))
+
+    def finish(stage, result, started):
+        record(stage, result, started)
+        outcome = verification_gate.VerificationResult(result, stages)
+        print(f"> Verification stages: {verification_gate.describe(stages)}")
+        span.set(stage=stage, returncode=result.returncode, bytes_out=len(result.stdout) + len(result.stderr),
+                 stages=",".join(f"{s['stage']}:{s['status']}" for s in stages))
+        if result.returncode != 0:
+            span.outcome = "failed"
+        return outcome
+
+    if changed_files:
+        python_files = [path for path in changed_files if path.endswith(".py")]
+        started = time.perf_counter()
+        result = verification_gate.compile_files(python_files)
+        if result.returncode != 0:
+            return finish("compile", result, started)
+        record("compile", result, started)
+
+        entries = verification_gate.import_entries(python_files) if verification_gate.IMPORT_CHECK else []
+        if entries:
+            started = time.perf_counter()
+            result = run_import_check(entries, isolated)
+            if result.returncode != 0:
+                return finish("import", result, started)
+            record("import", result, started)
+
+    if TEST_IMPACT and changed_files:
+        selected = impact_index.select_tests(PROJECT_DIR, changed_files, changed_symbols)
+        if selected:
+            print(f"\n> Test impact: {len(selected)} affected or previously failing test(s) run first.")
+            span.set(impact_tests=len(selected))
+            started = time.perf_counter()
+            result = run_pytest(pytest_args(selected) + ["-x"], isolated, stage="impact")
+            # 1: tests failed, 2: collection errors, negative or 124: killed or timed out.
+            # Usage errors (e.g. a renamed test) fall through to the full suite.
+            if result.returncode in (1, 2, verification_gate.TIMEOUT_RETURNCODE) or result.returncode < 0:
+                return finish("impact", result, started)
+            record("impact", result, started)
+
+    started = time.perf_counter()
+    result = run_pytest(pytest_args([PROJECT_DIR]), isolated)
+    return finish("full", result, started)
+
+def count_passed(result):
+    """Returns how many tests passed according to pytest's summary line."""
+    return snapshot_store.summary_counts(result.stdout).get("passed", 0)
+
+@tracing.traced("mcp.pytest")
+def run_pytest_cancellable(args, cwd, cancel_event):
+    """
+    Runs pytest in a new interpreter in `cwd` under the full suite's timeout and the
+    resource limits. Returns the CompletedProcess, or None if `cancel_event` was set
+    first, in which case the run is killed.
+    """
+    return verification_gate.run_limited(
+        verification_gate.limited_command("pytest", args), "full", cwd=cwd,
+        timeout=verification_gate.STAGE_TIMEOUTS["full"], cancel_event=cancel_event,
+    )
+
+@tracing.traced("mcp.candidate")
+def try_candidate(index, prompt, shown_files, file_contents, cancel_event):
+    """
+    Requests one candidate fix and verifies it in a scratch copy of the project.
+    Returns {"index", "edits", "result"}, or None if the candidate was cancelled.
+    """
+    tracing.annotate(index=index)
+    # Only the first candidate may come from the response cache; the others need fresh samples
+    response = call_ai(prompt, use_cache=(index == 0))
+    if cancel_event.is_set():
+        return None
+    edits = edits_from_response(response, shown_files, file_contents)
+
+    scratch_dir = tempfile.mkdtemp(prefix=f"rde-candidate-{index}-")
+    try:
+        shutil.copytree(
+            PROJECT_DIR, os.path.join(scratch_dir, PROJECT_DIR),
+            ignore=shutil.ignore_patterns("__pycache__", ".pytest_cache"),
+        )
+        for path, content in edits.items():
+            scratch_path = os.path.join(scratch_dir, path)
+            os.makedirs(os.path.dirname(scratch_path), exist_ok=True)
+            with open(scratch_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        print(f"> Verifying candidate {index + 1} in {scratch_dir}")
+        # The edits already compiled in patch_apply.validate; a module that fails to import
+        # rules the candidate out before its tests run
+        entries = verification_gate.import_entries([os.path.join(scratch_dir, path) for path in edits])
+        result = None
+        stages = []
+        if entries and verification_gate.IMPORT_CHECK:
+            started = time.perf_counter()
+            command = verification_gate.limited_command("import", [json.dumps(entries)])
+            result = verification_gate.run_limited(command, "import", cwd=scratch_dir, timeout=verification_gate.STAGE_TIMEOUTS["import"])
+            stages.append(verification_gate.stage_record("import", result, time.perf_counter() - started))
+        if result is None or result.returncode == 0:
+            started = time.perf_counter()
+            result = run_pytest_cancellable([PROJECT_DIR], scratch_dir, cancel_event)
+            if result is not None:
+                stages.append(verification_gate.stage_record("full", result, time.perf_counter() - started))
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    if result is None:
+        return None
+    return {"index": index, "edits": edits, "result": verification_gate.VerificationResult(result, stages)}
+
+def fix_with_candidates(prompt, shown_files, file_contents, count):
+    """
+    Requests `count` candidate fixes concurrently and verifies each one as soon as it
+    arrives. The first passing candidate wins and the rest are cancelled; if none pass,
+    the one with the most passing tests is chosen. Returns (edits, verification result),
+    or (None, None) if no candidate could be verified.
+    """
+    print(f"\n> Requesting {count} candidate fixes concurrently")
+    cancel_event = threading.Event()
+    best = None
+    pool = ThreadPoolExecutor(max_workers=count)
+    futures = [
+        pool.submit(tracing.in_context(try_candidate), i, prompt, shown_files, file_contents, cancel_event) for i in range(count)
+    ]
+    try:
+        for future in as_completed(futures):
+            try:
+                candidate = future.result()
+            except Exception as e:
+                print(f"Candidate failed: {e}")
+                continue
+            if candidate is None:
+                continue
+            if candidate["result"].returncode == 0:
+                print(f"> Candidate {candidate['index'] + 1} passes. Cancelling the others.")
+                best = candidate
+                break
+            if best is None or count_passed(candidate["result"]) > count_passed(best["result"]):
+                best = candidate
+    finally:
+        cancel_event.set()
+        pool.shutdown(wait=False, cancel_futures=True)
 
-        corrected_code = call_ai(prompt)
-        
-        print(f"\n> AI provided a fix. Writing to {file_to_fix_path}")
-        with open(file_to_fix_path, 'w', encoding='utf-8') as f:
-            if corrected_code.strip().startswith("```python"):
-                corrected_code = corrected_code.strip()[9:-3].strip()
-            f.write(corrected_code)
+    if best is None:
+        return None, None
+    return best["edits"], best["result"]
 
+def take_snapshot(store, label, verification_result):
+    """
+    Checkpoints the project as `verification_result` found it and records its score.
+    Returns (snapshot id, score), or (None, None) when snapshots are off or failed. The
+    score is None when an early verification stage decided the result.
+    """
+    if store is None:
+        return None, None
+    with tracing.span("mcp.snapshot", label=label) as span:
+        try:
+            snapshot_id = store.checkpoint(label)
+        except OSError as e:
+            print(f"Could not snapshot the project: {e}")
+            span.outcome = "error"
+            return None, None
+        score = snapshot_store.score_result(verification_result)
+        span.set(snapshot_id=snapshot_id)
+        if score is not None:
+            store.set_score(snapshot_id, score)
+            span.set(passed=score["passed"], failed=score["failed"])
+    return snapshot_id, score
+
+@tracing.traced("mcp.rollback")
+def roll_back(store, snapshot_id):
+    """Restores the project to a snapshot. Returns the restored files, or None if the restore failed."""
+    try:
+        changed = store.restore(snapshot_id)
+    except (OSError, KeyError) as e:
+        print(f"Could not roll back to snapshot {snapshot_id}: {e}")
+        tracing.current_span().outcome = "error"
+        return None
+    tracing.annotate(snapshot_id=snapshot_id, files=len(changed))
+    print(f"> Rolled back to snapshot {snapshot_id} ({len(changed)} file(s) restored).")
+    return changed
+
+@tracing.traced("mcp.main_loop", record=("reason", "attempts", "returncode"))
+def main_loop(task_description):
+    """
+    The main self-healing loop. Returns a result dict: "success" (the tests pass),
+    "reason" ("fixed", "already_passing", "max_retries" or "no_files"), "attempts",
+    "returncode" of the last verification, the "files_changed" on disk and the
+    "snapshot_id" of the final state.
+
+    Every verified state is snapshotted (see snapshot_store.py). When a fix leaves the
+    full suite worse than the best state so far, the project is rolled back to that state
+    before the next attempt, and to the best state when the retries run out. A state an
+    early verification stage rejected is not ranked, so it is not rolled back mid-loop.
+    """
+    # System prompt first, then the guidelines; only files changed since the last run are re-read
+    with tracing.span("mcp.context") as span:
+        context_sections = build_context_sections(GUIDELINES_DIR)
+        span.set(sections=len(context_sections), bytes_out=sum(len(text) for _, text in context_sections))
+    loop_span = tracing.current_span()
+
+    # Every verification describes the code currently on disk; its output feeds both the
+    # next prompt and the failure log, so each write is verified exactly once.
+    attempt_started = time.perf_counter()
+    verification_result = run_verification()
+    store = snapshot_store.SnapshotStore(PROJECT_DIR) if snapshot_store.SNAPSHOTS_ENABLED else None
+    snapshot_id, score = take_snapshot(store, "before fixing", verification_result)
+    best = {"id": snapshot_id, "score": score, "result": verification_result}
+    attempt = 0
+    tokens_in = tokens_out = None
+    previous_rejection = None
+    files_changed = set()
+
+    def result(reason):
+        failure_log.flush(LOG_FILE)
+        return {
+            "success": verification_result.returncode == 0,
+            "reason": reason,
+            "attempts": attempt,
+            "returncode": verification_result.returncode,
+            "files_changed": sorted(files_changed),
+            "snapshot_id": snapshot_id,
+        }
+
+    def restore_best():
+        """Rolls back to the best snapshot if the current state is worse. Returns True if it did."""
+        if store is None or score is None or best["id"] in (None, snapshot_id) or not snapshot_store.is_better(best["score"], score):
+            return False
+        return roll_back(store, best["id"]) is not None
+
+    while verification_result.returncode != 0:
+        if attempt == MAX_RETRIES and score is None and best["id"] is not None:
+            # The last fix was judged on a subset of the tests; rank it on the full suite
+            # so the project ends at its best state
+            verification_result = run_verification()
+            snapshot_id, score = take_snapshot(store, f"attempt {attempt}", verification_result)
+            if verification_result.returncode == 0:
+                continue
         error_output = verification_result.stdout + "\n" + verification_result.stderr
-        log_failure(task_description, i + 1, error_output)
-        code_to_fix = corrected_code
+        log_failure(
+            task_description, attempt, error_output,
+            duration=round(time.perf_counter() - attempt_started, 3),
+            tokens_in=tokens_in, tokens_out=tokens_out,
+            exit_code=verification_result.returncode, snapshot_id=snapshot_id,
+        )
+        if restore_best():
+            worse = f"{score['passed']} passed and {score['failed']} failed"
+            previous_rejection = (
+                f"Your previous fix was applied, but it made the tests worse ({worse}), so it was "
+                "rolled back. The code below is the best version so far; try a different fix."
+            )
+            snapshot_id, score, verification_result = best["id"], best["score"], best["result"]
+            error_output = verification_result.stdout + "\n" + verification_result.stderr
+        if attempt == MAX_RETRIES:
+            print(f"\n--- Max Retries Reached ({MAX_RETRIES}) ---")
+            print("The AI was unable to fix the code within the maximum number of attempts.")
+            if store:
+                store.prune()
+            return result("max_retries")
+
+        attempt += 1
+        attempt_started = time.perf_counter()
+        print(f"\n--- Attempt {attempt} of {MAX_RETRIES} ---")
+
+        # The traceback decides which files the AI sees, so this can change between attempts
+        shown_files = select_files(task_description, error_output)
+        if not shown_files:
+            print(f"No Python files found in {PROJECT_DIR}/. Nothing to fix.")
+            return result("no_files")
+        print(f"> Files shown to the AI: {', '.join(shown_files)}")
+        file_contents = {path: get_file_content(path) for path in shown_files}
+
+        references = retrieve_references(task_description, error_output)
+        prompt, packing_report = build_fix_prompt(
+            context_sections, task_description, file_contents, error_output, references, previous_rejection
+        )
+        print(prompt_packer.format_report(packing_report, AI_MODEL_PROVIDER))
+        tokens_in = sum(entry["packed_tokens"] for entry in packing_report)
+        tokens_out = None
+        loop_span.add("tokens_in", tokens_in)
 
-    print(f"\n--- Max Retries Reached ({MAX_RETRIES}) ---")
-    print("The AI was unable to fix the code within the maximum number of attempts.")
+        candidate_result = None
+        written = None
+        rejection = None
+        try:
+            if EDIT_FORMAT == "whole" and STREAM_RESPONSES and FIX_CANDIDATES == 1:
+                print(f"\n> Streaming the AI's fix into {shown_files[0]}")
+                code = write_code_atomically(call_ai_stream(prompt), shown_files[0])
+                if code is not None:
+                    written = {shown_files[0]: code}
+                    tokens_out = prompt_packer.estimate_tokens(code, AI_MODEL_PROVIDER)
+            else:
+                if FIX_CANDIDATES > 1:
+                    edits, candidate_result = fix_with_candidates(prompt, shown_files, file_contents, FIX_CANDIDATES)
+                else:
+                    response = "".join(call_ai_stream(prompt)) if STREAM_RESPONSES else call_ai(prompt)
+                    tokens_out = prompt_packer.estimate_tokens(response or "", AI_MODEL_PROVIDER)
+                    edits = edits_from_response(response, shown_files, file_contents)
+                if edits:
+                    print(f"\n> Writing the AI's fix to {', '.join(edits)}")
+                    patch_apply.write_files_atomically(edits)
+                written = edits
+        except patch_apply.PatchError as e:
+            print(f"> The AI's edit was rejected: {e}")
+            rejection = f"Your previous reply was rejected without being applied: {e}"
+        except Exception as e:
+            print(f"Error while writing the AI's fix: {e}")
+        if tokens_out is not None:
+            loop_span.add("tokens_out", tokens_out)
+        if not written:
+            # Nothing changed on disk, so the last verification result still applies
+            print("> Fix discarded. The project keeps its previous contents.")
+            previous_rejection = rejection
+            continue
+        previous_rejection = None
+        files_changed.update(written)
+
+        changed_symbols = {
+            path: impact_index.changed_functions(file_contents.get(path, ""), content)
+            for path, content in written.items()
+        }
+        if candidate_result is not None:
+            # Already verified in a scratch copy that differs from the project only in these files
+            verification_result = candidate_result
+        else:
+            verification_result = run_verification(changed_files=list(written), changed_symbols=changed_symbols)
+        snapshot_id, score = take_snapshot(store, f"attempt {attempt}", verification_result)
+        if snapshot_id and score is not None and snapshot_store.is_better(score, best["score"]):
+            best = {"id": snapshot_id, "score": score, "result": verification_result}
+
+    if store:
+        store.prune()
+    print("\n--- Verification Succeeded! ---")
+    if attempt:
+        print("The code has been successfully fixed by the AI.")
+    else:
+        print("The tests already pass. Nothing to fix.")
+    return result("fixed" if attempt else "already_passing")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         task = sys.argv[1]
     else:
         task = "Fix the bug in the `add` function in `project/main.py`." # Default task
-    main_loop(task)
\ No newline at end of file
+    sys.exit(0 if main_loop(task)["success"] else 1)
\ No newline at end of file
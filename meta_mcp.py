@@ -1,212 +1,187 @@
 
 import os
-import csv
-import requests # Added for API calls
-import json # Added for JSON handling
-
-# --- AI MODEL CONFIGURATION ---
-# Set your desired AI model provider here: "gemini", "openai", "claude", "openrouter"
-AI_MODEL_PROVIDER = os.environ.get("AI_MODEL_PROVIDER", "gemini").lower()
-
-# API Keys (read from environment variables for security)
-# Ensure these environment variables are set before running the engine
-API_KEYS = {
-    "gemini": os.environ.get("GEMINI_API_KEY"),
-    "openai": os.environ.get("OPENAI_API_KEY"),
-    "claude": os.environ.get("CLAUDE_API_KEY"),
-    "openrouter": os.environ.get("OPENROUTER_API_KEY"),
-}
-
-# --- GENERIC AI API CALLER ---
-def call_ai_api(provider, prompt, model_name=None, temperature=0.7):
-    """Makes a generic API call to the specified AI provider."""
-    api_key = API_KEYS.get(provider)
-    if not api_key:
-        raise ValueError(f"API key for {provider} not found. Please set the corresponding environment variable.")
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-    payload = {}
-    url = ""
-    text_extraction_path = [] # Path to extract text from JSON response
-
-    if provider == "gemini":
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name or 'gemini-pro'}:generateContent?key={api_key}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": temperature
-            }
-        }
-        text_extraction_path = ["candidates", 0, "content", "parts", 0, "text"]
-    elif provider == "openai":
-        url = "https://api.openai.com/v1/chat/completions"
-        headers["Authorization"] = f"Bearer {api_key}"
-        payload = {
-            "model": model_name or "gpt-3.5-turbo",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature
-        }
-        text_extraction_path = ["choices", 0, "message", "content"]
-    elif provider == "claude":
-        # Anthropic (Claude) API
-        url = "https://api.anthropic.com/v1/messages"
-        headers["x-api-key"] = api_key
-        headers["anthropic-version"] = "2023-06-01" # Required for Anthropic
-        headers["Content-Type"] = "application/json"
-        payload = {
-            "model": model_name or "claude-3-opus-20240229",
-            "max_tokens": 4000, # Claude requires max_tokens
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature
-        }
-        text_extraction_path = ["content", 0, "text"]
-    elif provider == "openrouter":
-        # OpenRouter API (can route to many models)
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers["Authorization"] = f"Bearer {api_key}"
-        headers["HTTP-Referer"] = "https://your-app-url.com" # Replace with your app URL
-        headers["X-Title"] = "Your App Name" # Replace with your app name
-        payload = {
-            "model": model_name or "mistralai/mistral-7b-instruct", # Example OpenRouter model
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature
-        }
-        text_extraction_path = ["choices", 0, "message", "content"]
-    else:
-        raise ValueError(f"Unsupported AI model provider: {provider}")
+import re
+import failure_log
+import error_clusters
+import guideline_index
+import guideline_store
+import guideline_eval
+from ai_client import AI_MODEL_PROVIDER
+import provider_router
+import tracing
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-        
-        response_json = response.json()
-        
-        # Extract text based on provider-specific path
-        text = response_json
-        for key in text_extraction_path:
-            if isinstance(text, list) and isinstance(key, int):
-                text = text[key]
-            elif isinstance(text, dict) and isinstance(key, str):
-                text = text.get(key)
-            else:
-                raise KeyError(f"Invalid path for text extraction: {key} in {text_extraction_path}")
-        
-        return text
-
-    except requests.exceptions.RequestException as e:
-        print(f"Network or HTTP error during API call to {provider}: {e}")
-        raise
-    except json.JSONDecodeError as e:
-        print(f"JSON decoding error from {provider} response: {e}")
-        print(f"Response content: {response.text}")
-        raise
-    except KeyError as e:
-        print(f"Could not extract text from {provider} response. Path error: {e}")
-        print(f"Response JSON: {response_json}")
-        raise
-    except Exception as e:
-        print(f"An unexpected error occurred during API call to {provider}: {e}")
-        raise
-
-def get_most_common_error(log_file_path):
-    """Reads the log file and returns the most common error_output."""
-    errors = []
-    if not os.path.exists(log_file_path):
-        return "No log file found."
-    try:
-        with open(log_file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if 'error_output' in row:
-                    errors.append(row['error_output'])
-        
-        if not errors:
-            return "No errors recorded in log file."
-        
-        # Count occurrences of each error
-        from collections import Counter
-        error_counts = Counter(errors)
-        
-        # Return the most common error
-        return error_counts.most_common(1)[0][0]
-    except Exception as e:
-        return f"Error reading log file: {e}"
 
 # --- CONFIGURATION ---
-LOG_FILE = "engine_log.csv"
+LOG_FILE = failure_log.LOG_FILE
 GUIDELINES_DIR = "guidelines"
-
-def get_file_content(filepath):
-    """Helper function to read file content."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return f"Error: File not found at {filepath}"
+MEMORY_FILE = guideline_index.MEMORY_FILE
+PROJECT_DIR = "project"
+# Replay logged failures with the old and the rewritten guidelines and keep the rewrite
+# only if it does better (see guideline_eval.py). 0 applies every usable rewrite.
+EVALUATE_REWRITES = os.environ.get("RDE_META_EVALUATE", "1").lower() not in ("0", "false", "no")
+# Number of guideline sections the Meta-AI rewrites per run
+SECTIONS_TO_IMPROVE = int(os.environ.get("RDE_META_SECTIONS", 2))
+SECTION_MARKER = re.compile(r"^=== SECTION (\d+)[^\n]*===\n(.*?)^=== END SECTION \1 ===", re.MULTILINE | re.DOTALL)
 
 def call_ai_for_meta_task(prompt):
     """
     Calls the configured AI model for meta-tasks (e.g., improving guidelines).
+    Returns None if no provider could answer.
     """
     print(f"--- Calling Meta-AI ({AI_MODEL_PROVIDER}) ---")
     print(f"Prompt (truncated): {prompt[:500]}...")
     try:
-        # You can specify model_name and temperature here if needed,
-        # otherwise, defaults from call_ai_api will be used.
-        response_text = call_ai_api(AI_MODEL_PROVIDER, prompt)
+        response_text = provider_router.call(prompt)
         print("--- Meta-AI Response Received ---")
         return response_text
     except Exception as e:
         print(f"Error in call_ai_for_meta_task: {e}")
-        # Return a default error message or re-raise, depending on desired behavior
-        return "Error: Meta-AI model call failed. Check logs for details."
+        return None
 
+def section_label(section):
+    """Names a section for prompts and output, e.g. `guidelines/security.md > ## Top Priorities`."""
+    return f"{section['path']} > {section['heading'] or section['title'] or '(preamble)'}"
 
+def parse_sections(response, sections):
+    """
+    Pairs each section with its rewritten text from the Meta-AI response. Sections that
+    are missing or empty in the response are left out, and an error reply yields nothing.
+    """
+    if not response:
+        return []
+    improved = []
+    for match in SECTION_MARKER.finditer(response):
+        number = int(match.group(1))
+        if not 1 <= number <= len(sections):
+            continue
+        section = sections[number - 1]
+        new_text = match.group(2).strip("\n")
+        if not new_text.strip():
+            continue
+        if section["heading"] and not new_text.lstrip().startswith(section["heading"]):
+            new_text = f"{section['heading']}\n\n{new_text}"
+        improved.append((section, new_text + "\n"))
+    return improved
+
+@tracing.traced("meta.analyze_and_improve", record=("improved", "reason", "cluster"))
 def analyze_and_improve():
-    """Analyzes the log file and triggers a guideline improvement task."""
+    """
+    Analyzes the log file and triggers a guideline improvement task. The rewrite is
+    recorded as a guideline version and, unless RDE_META_EVALUATE=0, replayed against
+    logged failures next to the current guidelines; it only goes live if it does better.
+    Returns a result dict: "improved" (the rewrite went live), "reason", "cluster" (a
+    description of the error cluster addressed), "updated" ({path: number of sections
+    replaced}), "version" (the rewrite's guideline version) and "evaluation".
+    """
+    result = {"improved": False, "reason": None, "cluster": None, "updated": {}, "version": None, "evaluation": None}
     if not os.path.exists(LOG_FILE):
         print(f"Error: Log file {LOG_FILE} not found. Run mcp.py first to generate logs.")
-        return
+        return dict(result, reason="no_log")
+
+    # 1. Read and analyze the log file: group failures by traceback signature
+    clusters = error_clusters.get_error_clusters(LOG_FILE, top_n=3)
+    if not clusters:
+        print("No errors recorded in log file. Nothing to improve.")
+        return dict(result, reason="no_failures")
+    top_cluster = clusters[0]
+    result["cluster"] = error_clusters.describe_cluster(top_cluster)
+    most_common_error = top_cluster["example"]
 
-    # 1. Read and analyze the log file to find the most common error
-    # 1. Read and analyze the log file to find the most common error
-    most_common_error = get_most_common_error(LOG_FILE)
-    
     print(f"--- Analysis Complete ---")
     print("Found a recurring failure pattern.")
+    for rank, cluster in enumerate(clusters, start=1):
+        print(f"  {rank}. {error_clusters.describe_cluster(cluster)}")
 
-    # 2. Identify the relevant guideline to improve.
-    # This is a simplified heuristic. A real system would need more complex logic.
-    guideline_to_improve_path = os.path.join(GUIDELINES_DIR, "development_standards.md")
-    print(f"Identified `{guideline_to_improve_path}` as the guideline to improve.")
-    original_guideline = get_file_content(guideline_to_improve_path)
-
-    # 3. Construct the meta-prompt
+    # 2. Find the guideline sections most relevant to the top error signature
+    sections = guideline_index.find_relevant_sections(
+        error_clusters.error_query(top_cluster["example"]), SECTIONS_TO_IMPROVE, GUIDELINES_DIR, MEMORY_FILE
+    )
+    if not sections:
+        print(f"No guideline sections found in {GUIDELINES_DIR} or {MEMORY_FILE}. Nothing to improve.")
+        return dict(result, reason="no_sections")
+    print("Identified the guideline sections to improve:")
+    for section in sections:
+        print(f"  - {section_label(section)} (score {section['score']:.2f})")
+
+    # 3. Construct the meta-prompt from those sections only
+    blocks = "".join(
+        f"=== SECTION {number}: {section_label(section)} ===\n{section['text'].rstrip()}\n=== END SECTION {number} ===\n\n"
+        for number, section in enumerate(sections, start=1)
+    )
     prompt = (
         "You are a Meta-AI responsible for improving the performance of a developer AI. "
-        "The developer AI is repeatedly failing on a task. Here is the most common error it produces:\n"
+        "The developer AI is repeatedly failing on a task. Here is the most common error it produces "
+        f"({error_clusters.describe_cluster(top_cluster)}):\n"
         f"```\n{most_common_error}\n```\n\n"
-        f"This error seems related to the following guideline file: `{guideline_to_improve_path}`. "
-        "Here is the current content of that guideline:\n"
-        f"```markdown\n{original_guideline}\n```\n\n"
-        "Please analyze the error and the guideline. Rewrite and provide the complete, improved guideline file. "
-        "Your goal is to make the guideline clearer and more effective to prevent this error in the future. "
-        "Do not add any commentary, just the full, updated markdown for the file."
+        "These are the guideline sections most related to this error:\n\n"
+        f"{blocks}"
+        "Please analyze the error and the sections. Rewrite each section to make it clearer and more effective "
+        "at preventing this error in the future. Keep each section's heading line unchanged. "
+        "Return every section between the same `=== SECTION n ... ===` and `=== END SECTION n ===` lines, "
+        "with no commentary outside them."
     )
 
-    # 4. Call the AI to get the improved guideline
-    improved_guideline = call_ai_for_meta_task(prompt)
-
-    # 5. Save the improved guideline
-    print(f"\n> Meta-AI provided an improved guideline. Writing to {guideline_to_improve_path}")
-    with open(guideline_to_improve_path, 'w', encoding='utf-8') as f:
-        f.write(improved_guideline)
-    
+    # 4. Call the AI to get the improved sections
+    response = call_ai_for_meta_task(prompt)
+    improved = parse_sections(response, sections)
+    if not improved:
+        print("\n> Meta-AI response contained no usable sections. Guidelines left unchanged.")
+        return dict(result, reason="no_response" if response is None else "unusable_response")
+
+    # 5. Record the current guidelines and the rewrite as versions
+    base_files = guideline_store.read_set(GUIDELINES_DIR, MEMORY_FILE)
+    candidate_files = dict(base_files)
+    replaced = {}
+    by_path = {}
+    for section, new_text in improved:
+        by_path.setdefault(section["path"].replace(os.sep, "/"), []).append((section, new_text))
+    for path, replacements in by_path.items():
+        new_text = guideline_index.apply_replacements(base_files.get(path, ""), replacements)
+        if new_text is None:
+            print(f"\n> {path} changed during analysis; skipped.")
+            continue
+        candidate_files[path] = new_text
+        replaced[path] = len(replacements)
+    if candidate_files == base_files:
+        return dict(result, reason="files_changed")
+    base_version = guideline_store.save_version(base_files, parent=guideline_store.head(), status="live")
+    if guideline_store.head() != base_version:
+        guideline_store.set_head(base_version)
+    result["version"] = guideline_store.save_version(candidate_files, parent=base_version, note=result["cluster"])
+
+    # 6. Replay logged failures with both versions; keep the rewrite only if it does better
+    if EVALUATE_REWRITES:
+        cases = guideline_eval.select_cases(LOG_FILE, PROJECT_DIR)
+        if not cases:
+            print("\n> No logged failure with a project snapshot to replay. The rewrite is not applied.")
+            guideline_store.set_status(result["version"], "rejected", {"reason": "no cases to replay"})
+            return dict(result, reason="no_eval_cases")
+        evaluation = guideline_eval.evaluate(base_files, candidate_files, cases, PROJECT_DIR)
+        promote, why = guideline_eval.compare(evaluation["base"], evaluation["candidate"])
+        evaluation["decision"] = why
+        result["evaluation"] = evaluation
+        guideline_store.set_status(result["version"], "promoted" if promote else "rejected", evaluation)
+        print(f"\n> Guideline version {result['version']} {'promoted' if promote else 'rejected'}: {why}")
+        if not promote:
+            return dict(result, reason="not_better")
+
+    # 7. Write the rewritten files, unless they changed while the rewrite was evaluated
+    current_files = guideline_store.read_set(GUIDELINES_DIR, MEMORY_FILE)
+    for path, count in replaced.items():
+        if current_files.get(path) != base_files.get(path):
+            print(f"\n> {path} changed during evaluation; skipped.")
+            continue
+        guideline_store.write_set({path: candidate_files[path]})
+        print(f"\n> Updated {count} section(s) in {path}")
+        result["updated"][path] = count
+
+    if not result["updated"]:
+        return dict(result, reason="files_changed")
+    if len(result["updated"]) == len(replaced):
+        guideline_store.set_head(result["version"])
     print("\n--- Self-Improvement Complete ---")
-    print(f"The guideline at {guideline_to_improve_path} has been updated.")
-    print("Future runs of mcp.py will now use this improved rule.")
+    print("Future runs of mcp.py will now use the improved rules.")
+    return dict(result, improved=True, reason="improved")
 
 if __name__ == "__main__":
     analyze_and_improve()
@@ -1,22 +1,30 @@
 import subprocess
 import sys
 import os
+import re
+import json
 import time
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import failure_log
+import tracing
+import project_import
+import snapshot_store
+import mcp
+import meta_mcp
+from export_project import export_project
 
 def clear_project_folder():
-    """Clears the contents of the PROJECT_DIR."""
+    """
+    Clears the contents of the PROJECT_DIR. The folder is swapped for an empty one at
+    once and the old contents are deleted in the background (see snapshot_store.py).
+    """
     project_path = os.path.join(PROJECT_ROOT, PROJECT_DIR)
     if os.path.exists(project_path):
         print(f"\n--- Clearing project folder: {project_path} ---")
         try:
-            # Remove all contents but keep the folder itself
-            for item in os.listdir(project_path):
-                item_path = os.path.join(project_path, item)
-                if os.path.isfile(item_path):
-                    os.remove(item_path)
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
+            snapshot_store.clear_directory(project_path, keep_files=(".gitkeep",))
             # Recreate .gitkeep if it was removed
             gitkeep_path = os.path.join(project_path, ".gitkeep")
             if not os.path.exists(gitkeep_path):
@@ -30,92 +38,164 @@ def clear_project_folder():
 
 
 def has_log_data(log_file_path):
-    """Checks if the log file exists and contains data (more than just headers)."""
-    if not os.path.exists(log_file_path):
-        return False
-    try:
-        with open(log_file_path, 'r', encoding='utf-8') as f:
-            # Read header line
-            header = f.readline()
-            # Check if there's a second line (data)
-            if f.readline():
-                return True
-            else:
-                return False # Only header or empty file
-    except Exception:
-        return False # Handle potential file reading errors
+    """Checks if the failure log exists and contains at least one recorded failure."""
+    return failure_log.has_failures(log_file_path)
 
 # --- CONFIGURATION ---
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = "project"
+GUIDELINES_DIR = "guidelines"
 MCP_SCRIPT = os.path.join(PROJECT_ROOT, "mcp.py")
 META_MCP_SCRIPT = os.path.join(PROJECT_ROOT, "meta_mcp.py")
 EXPORT_SCRIPT = os.path.join(PROJECT_ROOT, "export_project.py")
-LOG_FILE = os.path.join(PROJECT_ROOT, "engine_log.csv")
+LOG_FILE = os.path.join(PROJECT_ROOT, failure_log.LOG_FILE)
+MAX_MCP_ATTEMPTS = 5 # Max attempts for mcp.py to succeed
+DEFAULT_TASK = "Fix the bug in the `add` function in `project/main.py`."
+# Lines of a script's output kept in memory for its caller; the rest is only streamed
+OUTPUT_TAIL_LINES = 200
+
+# Batch mode: every job runs in its own workspace under BATCH_ROOT/<batch id>/<job id>/
+BATCH_ROOT = os.environ.get("RDE_BATCH_ROOT", os.path.join(PROJECT_ROOT, "persistency", "batches"))
+BATCH_WORKERS = int(os.environ.get("RDE_BATCH_WORKERS", "4"))
+# Files copied into each workspace so a job's guidelines and memory evolve on their own
+WORKSPACE_FILES = ("system_prompt.md", os.path.join("persistency", "memory.md"), os.path.join("persistency", "task_list.md"))
 
-def run_script(script_path, args=None, description=""):
-    """Helper to run a Python script and capture its output."""
-    command = [sys.executable, script_path]
+def run_script(script_path, args=None, description="", cwd=PROJECT_ROOT, env=None, out=None):
+    """
+    Helper to run a Python script in a subprocess. Its output (stdout and stderr merged)
+    is streamed line by line to `out` (stdout by default, or a batch job's log) while it
+    runs; only the last OUTPUT_TAIL_LINES lines are kept and returned.
+    """
+    out = out or sys.stdout
+    command = [sys.executable, "-u", script_path]
     if args:
         command.extend(args)
     
-    print(f"\n--- Running {description}: {' '.join(command)} ---")
-    process = subprocess.run(command, capture_output=True, text=True, cwd=PROJECT_ROOT)
-    
-    print(f"Stdout:\n{process.stdout}")
-    print(f"Stderr:\n{process.stderr}")
+    print(f"\n--- Running {description}: {' '.join(command)} ---", file=out)
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    with tracing.span("script", script=os.path.basename(script_path), description=description) as span:
+        # The child's own spans join this trace as children of this one
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                              encoding="utf-8", errors="replace", cwd=cwd, env=tracing.child_env(env)) as process:
+            output_bytes = 0
+            for line in process.stdout:
+                out.write(line)
+                out.flush()
+                tail.append(line)
+                output_bytes += len(line)
+        span.set(returncode=process.returncode, bytes_out=output_bytes)
+        if process.returncode != 0:
+            span.outcome = "failed"
     
     if process.returncode != 0:
-        print(f"Error: {description} failed with exit code {process.returncode}")
-        return False, process.stdout + process.stderr
-    print(f"{description} completed successfully.")
-    return True, process.stdout + process.stderr
+        print(f"Error: {description} failed with exit code {process.returncode}", file=out)
+        return False, "".join(tail)
+    print(f"{description} completed successfully.", file=out)
+    return True, "".join(tail)
 
-def import_project_to_engine(source_path):
-    """Imports an existing project into the PROJECT_DIR."""
+@tracing.traced("import", record=("method", "files", "bytes"))
+def import_project_to_engine(source_path, depth=project_import.CLONE_DEPTH, sparse_paths=(), branch=None):
+    """
+    Imports an existing project into the PROJECT_DIR: a shallow, partial clone for Git
+    sources, a parallel reflink-or-copy for local directories (see project_import.py).
+    The current project is replaced only once the import has succeeded.
+    """
     project_path = os.path.join(PROJECT_ROOT, PROJECT_DIR)
-    
-    # Clear existing project folder first to ensure a clean import
-    clear_project_folder() # Reuse the clear function
-
     print(f"\n--- Importing project from {source_path} to {project_path} ---")
-    
-    if source_path.startswith("http://") or source_path.startswith("https://") or source_path.endswith(".git"):
-        # Assume it's a Git repository
-        try:
-            print(f"Cloning Git repository: {source_path}")
-            subprocess.run(["git", "clone", source_path, project_path], check=True, capture_output=True)
-            print("Git clone successful.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error cloning Git repository: {e.stderr.decode()}")
-            return
-    elif os.path.isdir(source_path):
-        # Assume it's a local directory
-        try:
-            print(f"Copying local directory: {source_path}")
-            # Copy contents, not the folder itself
-            for item in os.path.listdir(source_path):
-                s = os.path.join(source_path, item)
-                d = os.path.join(project_path, item)
-                if os.path.isfile(s):
-                    shutil.copy2(s, d)
-                elif os.path.isdir(s):
-                    shutil.copytree(s, d)
-            print("Local directory copied successfully.")
-        except Exception as e:
-            print(f"Error copying local directory: {e}")
-            return
-    else:
-        print(f"Error: Source path '{source_path}' is not a valid Git URL or local directory.")
-        return
+    try:
+        result = project_import.import_project(source_path, project_path, depth, sparse_paths, branch)
+    except (project_import.ProjectImportError, OSError) as e:
+        print(f"Error importing project: {e}")
+        return {"success": False, "reason": str(e)}
 
-    print("Project import complete.")
+    # Keep the placeholder the engine's own project/ ships with
+    gitkeep_path = os.path.join(project_path, ".gitkeep")
+    if not os.path.exists(gitkeep_path):
+        with open(gitkeep_path, 'w') as f:
+            f.write("")
+    if result["method"] == "clone":
+        print(f"Git clone successful (depth {depth or 'full'}{', sparse: ' + ' '.join(sparse_paths) if sparse_paths else ''}).")
+    else:
+        methods = ", ".join(f"{count} by {method}" for method, count in sorted(result["by_method"].items()))
+        print(f"Copied {result['files']} files ({result['bytes']} bytes{'; ' + methods if methods else ''}), skipped {result['skipped']} ignored paths.")
+    print(f"Project import complete in {result['seconds']:.2f}s.")
     print("You can now use the engine to analyze or improve this project.")
+    return dict(result, success=True)
+
+def run_mcp_phase(task, in_process, cwd=PROJECT_ROOT, env=None, out=None):
+    """Runs mcp.py's main loop, in this process or as a script. Returns True if the tests pass."""
+    if not in_process:
+        success, _ = run_script(MCP_SCRIPT, args=[task], description="MCP (Main Control Program)", cwd=cwd, env=env, out=out)
+        return success
+    print("\n--- Running MCP (Main Control Program) in-process ---")
+    try:
+        result = mcp.main_loop(task)
+    except Exception as e:
+        print(f"Error: MCP raised {type(e).__name__}: {e}")
+        return False
+    print(f"MCP finished: {result['reason']} after {result['attempts']} attempt(s).")
+    return result["success"]
+
+def run_meta_mcp_phase(in_process, cwd=PROJECT_ROOT, env=None, out=None):
+    """Runs meta_mcp.py's guideline improvement, in this process or as a script. Returns True if it ran."""
+    if not in_process:
+        success, _ = run_script(META_MCP_SCRIPT, description="Meta-MCP (Guideline Improvement)", cwd=cwd, env=env, out=out)
+        return success
+    print("\n--- Running Meta-MCP (Guideline Improvement) in-process ---")
+    try:
+        result = meta_mcp.analyze_and_improve()
+    except Exception as e:
+        print(f"Error: Meta-MCP raised {type(e).__name__}: {e}")
+        return False
+    print(f"Meta-MCP finished: {result['reason']}.")
+    return True
+
+def run_mcp_until_success(task, cwd=PROJECT_ROOT, env=None, out=None, in_process=False):
+    """
+    Runs mcp.py on `task` until it succeeds or MAX_MCP_ATTEMPTS runs have failed. After a
+    failed run with logged failures, meta_mcp.py improves the guidelines before the next
+    run. As subprocesses, both scripts run in `cwd` with `env` and report to `out`; in
+    process, they use the current directory and stdout. Returns (success, attempts).
+    """
+    out = out or sys.stdout
+    log_file = os.path.join(cwd, failure_log.LOG_FILE)
+    mcp_attempts = 0
+
+    while mcp_attempts < MAX_MCP_ATTEMPTS:
+        mcp_attempts += 1
+        print(f"\nAttempt {mcp_attempts} to run mcp.py...", file=out)
+        success = run_mcp_phase(task, in_process, cwd, env, out)
+        
+        if success:
+            print("MCP completed successfully. Project should be ready.", file=out)
+            return True, mcp_attempts
 
-def orchestrate_development(prd_path, export_destination):
-    """Orchestrates the full development process."""
+        print("MCP failed. Checking logs for self-improvement opportunity.", file=out)
+        # Phase 2: Reflexion & Self-Improvement
+        if has_log_data(log_file):
+            print("\n--- Phase 2: Triggering Meta-MCP for Self-Improvement ---", file=out)
+            meta_mcp_success = run_meta_mcp_phase(in_process, cwd, env, out)
+            if meta_mcp_success:
+                print("Meta-MCP ran successfully. Retrying MCP.", file=out)
+            else:
+                print("Meta-MCP failed. Continuing to retry MCP without guideline improvement.", file=out)
+        else:
+            print("No logs found for Meta-MCP. Retrying MCP directly.", file=out)
+    return False, mcp_attempts
+
+@tracing.traced("orchestrate.develop")
+def orchestrate_development(prd_path, export_destination, in_process=True):
+    """
+    Orchestrates the full development process. By default the phases run as function
+    calls in this process; `in_process=False` runs each one as a separate script.
+    """
     print(f"--- Starting Reflexive Development Engine Orchestration ---")
     print(f"PRD Path: {prd_path}")
     print(f"Export Destination: {export_destination}")
+    tracing.annotate(in_process=in_process)
+    if in_process:
+        # The phases resolve project/, guidelines/ and the failure log relative to the engine
+        os.chdir(PROJECT_ROOT)
 
     # Phase 1: Initialization (AI generates PRP and initial code)
     # This part is implicitly handled by mcp.py's initial prompt if it's designed to take a PRD.
@@ -127,45 +207,23 @@ def orchestrate_development(prd_path, export_destination):
     # In a real scenario, mcp.py would be prompted with the PRD to start building.
     
     # Clear previous logs for a fresh run
-    if os.path.exists(LOG_FILE):
-        os.remove(LOG_FILE)
+    failure_log.clear_log(LOG_FILE)
 
-    mcp_success = False
-    mcp_attempts = 0
-    MAX_MCP_ATTEMPTS = 5 # Max attempts for mcp.py to succeed
-
-    while not mcp_success and mcp_attempts < MAX_MCP_ATTEMPTS:
-        mcp_attempts += 1
-        print(f"\nAttempt {mcp_attempts} to run mcp.py...")
-        # mcp.py currently has a hardcoded task. In a real system, this would be dynamic.
-        task_to_perform = "Fix the bug in the `add` function in `project/main.py`." # This could be dynamic based on PRP
-        success, output = run_script(MCP_SCRIPT, args=[task_to_perform], description="MCP (Main Control Program)")
-        
-        if success:
-            mcp_success = True
-            print("MCP completed successfully. Project should be ready.")
-        else:
-            print("MCP failed. Checking logs for self-improvement opportunity.")
-            # Phase 2: Reflexion & Self-Improvement
-            if has_log_data(LOG_FILE):
-                print("\n--- Phase 2: Triggering Meta-MCP for Self-Improvement ---")
-                meta_mcp_success, meta_mcp_output = run_script(META_MCP_SCRIPT, description="Meta-MCP (Guideline Improvement)")
-                if meta_mcp_success:
-                    print("Meta-MCP ran successfully. Retrying MCP.")
-                else:
-                    print("Meta-MCP failed. Continuing to retry MCP without guideline improvement.")
-            else:
-                print("No logs found for Meta-MCP. Retrying MCP directly.")
-        
-        time.sleep(2) # Small delay before retrying
+    # mcp.py currently has a hardcoded task. In a real system, this would be dynamic.
+    mcp_success, mcp_attempts = run_mcp_until_success(DEFAULT_TASK, in_process=in_process)
+    tracing.annotate(attempts=mcp_attempts)
 
     if not mcp_success:
         print("\n--- Orchestration Failed: MCP could not complete successfully after multiple attempts. ---")
+        tracing.current_span().outcome = "failed"
         return False
 
     # Phase 3: Finalization (Export Project)
     print("\n--- Phase 3: Exporting Final Project ---")
-    export_success, export_output = run_script(EXPORT_SCRIPT, args=[export_destination, "--force"], description="Project Export")
+    if in_process:
+        export_success = export_project(export_destination, force_overwrite=True)["success"]
+    else:
+        export_success, _ = run_script(EXPORT_SCRIPT, args=[export_destination, "--force"], description="Project Export")
     
     if export_success:
         print("\n--- Reflexive Development Engine Orchestration Completed Successfully! ---")
@@ -173,41 +231,211 @@ def orchestrate_development(prd_path, export_destination):
         return True
     else:
         print("\n--- Orchestration Failed: Project export failed. ---")
+        tracing.current_span().outcome = "failed"
         return False
 
+# --- BATCH MODE ---
+def load_jobs(queue_path):
+    """
+    Reads a batch queue. A JSONL file holds one job per line: {"task": ...} plus optional
+    "id", "prd" (a PRD file), "project" (a local directory or Git URL to start from;
+    default: the engine's project/ folder) and "export" (where to export on success).
+    A directory of PRD files (.md, .txt) makes one job per file, with the PRD as its task.
+    """
+    jobs = []
+    if os.path.isdir(queue_path):
+        for name in sorted(os.listdir(queue_path)):
+            path = os.path.join(queue_path, name)
+            if os.path.isfile(path) and name.lower().endswith((".md", ".txt")):
+                with open(path, 'r', encoding='utf-8') as f:
+                    jobs.append({"id": os.path.splitext(name)[0], "task": f.read(), "prd": path})
+    else:
+        with open(queue_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    job = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{queue_path}:{line_number}: invalid job: {e}")
+                if not job.get("task") and not job.get("prd"):
+                    raise ValueError(f"{queue_path}:{line_number}: a job needs a task or a prd.")
+                if not job.get("task"):
+                    with open(job["prd"], 'r', encoding='utf-8') as prd:
+                        job["task"] = prd.read()
+                jobs.append(job)
+
+    seen = set()
+    for number, job in enumerate(jobs, 1):
+        job_id = re.sub(r"[^\w.-]+", "-", str(job.get("id") or f"job-{number}")).strip("-.") or f"job-{number}"
+        while job_id in seen:
+            job_id = f"{job_id}-{number}"
+        seen.add(job_id)
+        job["id"] = job_id
+    return jobs
+
+def prepare_workspace(job, workspace):
+    """
+    Creates a job's workspace: its own copy of the project, a snapshot of the guidelines,
+    system prompt and memory, and (later) its own failure log. mcp.py and meta_mcp.py
+    use relative paths, so running them inside the workspace keeps jobs apart.
+    """
+    project_path = os.path.join(workspace, PROJECT_DIR)
+    source = job.get("project") or os.path.join(PROJECT_ROOT, PROJECT_DIR)
+    os.makedirs(workspace, exist_ok=True)
+    project_import.import_project(source, project_path)
+
+    shutil.copytree(os.path.join(PROJECT_ROOT, GUIDELINES_DIR), os.path.join(workspace, GUIDELINES_DIR))
+    for relative in WORKSPACE_FILES:
+        source_file = os.path.join(PROJECT_ROOT, relative)
+        if os.path.exists(source_file):
+            os.makedirs(os.path.dirname(os.path.join(workspace, relative)) or workspace, exist_ok=True)
+            shutil.copy2(source_file, os.path.join(workspace, relative))
+    if job.get("prd"):
+        os.makedirs(os.path.join(workspace, "user_input"), exist_ok=True)
+        shutil.copy2(job["prd"], os.path.join(workspace, "user_input", "prd_template.md"))
+
+@tracing.traced("batch.job", record=("id", "status", "attempts"))
+def run_job(job, workspace, env):
+    """Runs one batch job in its workspace and returns its summary entry. Never raises."""
+    started = time.monotonic()
+    result = {"id": job["id"], "status": "error", "attempts": 0, "workspace": workspace, "error": None}
+    os.makedirs(workspace, exist_ok=True)
+    with open(os.path.join(workspace, "job.log"), 'w', encoding='utf-8') as out:
+        try:
+            prepare_workspace(job, workspace)
+            success, attempts = run_mcp_until_success(job["task"], cwd=workspace, env=env, out=out)
+            result["attempts"] = attempts
+            result["status"] = "succeeded" if success else "failed"
+            if success and job.get("export"):
+                exported, _ = run_script(
+                    EXPORT_SCRIPT, args=[os.path.abspath(job["export"]), "--force"],
+                    description="Project Export", cwd=workspace, env=env, out=out,
+                )
+                result["export"] = os.path.abspath(job["export"])
+                if not exported:
+                    result["status"] = "export_failed"
+        except Exception as e:
+            print(f"Job failed with an exception: {e}", file=out)
+            result["error"] = str(e)
+    log_file = os.path.join(workspace, failure_log.LOG_FILE)
+    result["logged_failures"] = sum(1 for _ in failure_log.iter_failures(log_file, with_output=False)) if os.path.exists(log_file) else 0
+    result["duration"] = round(time.monotonic() - started, 2)
+    return result
+
+@tracing.traced("orchestrate.batch", record=("batch_id", "counts"))
+def run_batch(queue_path, workers=BATCH_WORKERS):
+    """
+    Runs every job in a queue concurrently on a pool of `workers` threads, each driving
+    its job's mcp.py/meta_mcp.py processes. All jobs draw on one AI rate budget (see
+    AI_RATE_BUDGET_DB in provider_router.py). Writes summary.json to the batch folder
+    and returns the summary.
+    """
+    jobs = load_jobs(queue_path)
+    batch_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    batch_dir = os.path.join(BATCH_ROOT, batch_id)
+    os.makedirs(batch_dir, exist_ok=True)
+
+    env = dict(os.environ)
+    env.setdefault("AI_RATE_BUDGET_DB", os.path.join(batch_dir, "rate_budget.db"))
+    # The knowledge base and its index stay shared; only project state is per job
+    env.setdefault("RDE_RAG_DIR", os.path.join(PROJECT_ROOT, "persistency", "rag"))
+
+    print(f"--- Batch {batch_id}: {len(jobs)} jobs, {workers} workers ---")
+    print(f"Workspaces: {batch_dir}")
+    started = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(tracing.in_context(run_job), job, os.path.join(batch_dir, job["id"]), env): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(jobs)}] {result['id']}: {result['status']} "
+                  f"after {result['attempts']} attempt(s), {result['duration']}s")
+
+    order = {job["id"]: number for number, job in enumerate(jobs)}
+    results.sort(key=lambda result: order[result["id"]])
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    summary = {
+        "batch_id": batch_id,
+        "queue": os.path.abspath(queue_path),
+        "workers": workers,
+        "duration": round(time.monotonic() - started, 2),
+        "counts": counts,
+        "jobs": results,
+    }
+    summary_path = os.path.join(batch_dir, "summary.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    print(f"\n--- Batch complete: {counts} in {summary['duration']}s ---")
+    print(f"Summary written to {summary_path}")
+    return summary
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python orchestrator.py <command> [args...]")
         print("Commands:")
-        print("  develop <path_to_prd.md> <export_destination_path>")
+        print("  develop <path_to_prd.md> <export_destination_path> [--subprocess]")
+        print("  batch <jobs.jsonl | prd_directory> [--workers N]")
         print("  clear")
         sys.exit(1)
 
     command = sys.argv[1]
 
     if command == "develop":
-        if len(sys.argv) != 3: # Changed from 4 to 3
-            print("Usage: python orchestrator.py develop <export_destination_path>") # Removed <path_to_prd.md>
+        # --subprocess runs each phase as its own script, as earlier versions did
+        in_process = "--subprocess" not in sys.argv
+        args = [arg for arg in sys.argv if arg != "--subprocess"]
+        if len(args) != 3: # Changed from 4 to 3
+            print("Usage: python orchestrator.py develop <export_destination_path> [--subprocess]") # Removed <path_to_prd.md>
             sys.exit(1)
         
         # Hardcode prd_template.md as the PRD file
         prd_file = os.path.join(PROJECT_ROOT, "user_input", "prd_template.md")
         
-        export_dest = sys.argv[2] # Changed from sys.argv[3] to sys.argv[2]
+        export_dest = args[2] # Changed from sys.argv[3] to sys.argv[2]
         
         if not os.path.exists(prd_file):
             print(f"Error: Default PRD file not found at {prd_file}") # Changed error message
             sys.exit(1)
-        orchestrate_development(prd_file, export_dest)
+        sys.exit(0 if orchestrate_development(prd_file, export_dest, in_process) else 1)
+    elif command == "batch":
+        args = sys.argv[2:]
+        workers = BATCH_WORKERS
+        if "--workers" in args:
+            position = args.index("--workers")
+            workers = int(args[position + 1])
+            del args[position:position + 2]
+        if len(args) != 1:
+            print("Usage: python orchestrator.py batch <jobs.jsonl | prd_directory> [--workers N]")
+            sys.exit(1)
+        summary = run_batch(args[0], workers)
+        sys.exit(0 if summary["counts"].get("succeeded", 0) == len(summary["jobs"]) else 1)
     elif command == "clear":
         clear_project_folder()
     elif command == "import":
-        if len(sys.argv) != 3:
-            print("Usage: python orchestrator.py import <source_path>")
-            print("  <source_path> can be a Git repository URL or a local directory path.")
+        args = sys.argv[2:]
+        options = {"depth": project_import.CLONE_DEPTH, "branch": None, "sparse_paths": []}
+        try:
+            while "--depth" in args or "--branch" in args:
+                flag = "--depth" if "--depth" in args else "--branch"
+                position = args.index(flag)
+                options[flag[2:]] = int(args[position + 1]) if flag == "--depth" else args[position + 1]
+                del args[position:position + 2]
+            if "--sparse" in args:
+                position = args.index("--sparse")
+                options["sparse_paths"] = args[position + 1:]
+                del args[position:]
+        except (IndexError, ValueError):
+            args = []
+        if len(args) != 1:
+            print("Usage: python orchestrator.py import <source_path> [--depth N] [--branch REF] [--sparse PATH ...]")
+            print("  <source_path> can be a Git repository URL, a .git repository or a local directory path.")
             sys.exit(1)
-        source_path = sys.argv[2]
-        import_project_to_engine(source_path)
+        result = import_project_to_engine(args[0], **options)
+        sys.exit(0 if result["success"] else 1)
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
@@ -0,0 +1,331 @@
+"""
+Applies edits that the AI returns as SEARCH/REPLACE blocks:
+
+    project/main.py
+    <<<<<<< SEARCH
+    exact lines from the current file
+    =======
+    replacement lines
+    >>>>>>> REPLACE
+
+or as a unified diff (`--- a/path`, `+++ b/path`, `@@ ... @@` hunks). Each block names
+its file on the line before it. The SEARCH text must occur exactly once in that file;
+an empty SEARCH creates a new file. Hunks are located at their stated line first and
+searched for nearby if the file has shifted.
+
+Edits are applied in memory and every resulting Python file must parse before anything
+is written, so a malformed reply never reaches the disk or the test run.
+"""
+import os
+import re
+import tempfile
+
+# --- CONFIGURATION ---
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER_MARKER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DIFF_OLD_FILE = re.compile(r"^--- (\S+)")
+DIFF_NEW_FILE = re.compile(r"^\+\+\+ (\S+)")
+# How far (in lines) from its stated position a hunk is searched for before the whole file
+HUNK_SEARCH_WINDOW = 200
+
+class PatchError(ValueError):
+    """Raised when an AI edit cannot be parsed or does not apply cleanly."""
+
+def _clean_path(line):
+    """Strips the decoration models put around file names (bullets, backticks, bold, colons)."""
+    return line.strip().strip("`*#:- ").strip()
+
+def parse_edit_blocks(text):
+    """
+    Returns the SEARCH/REPLACE blocks in `text` as (path, search, replace) tuples, in
+    order. A block without a file name reuses the previous block's file.
+    """
+    blocks = []
+    lines = text.splitlines()
+    path = None
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != SEARCH_MARKER:
+            i += 1
+            continue
+        for previous in reversed(lines[:i]):
+            if previous.strip() and not previous.strip().startswith("```"):
+                candidate = _clean_path(previous)
+                if candidate and candidate != REPLACE_MARKER and " " not in candidate:
+                    path = candidate
+                break
+        if path is None:
+            raise PatchError("Edit block without a file name.")
+
+        search, replace = [], []
+        i += 1
+        while i < len(lines) and lines[i].strip() != DIVIDER_MARKER:
+            search.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and lines[i].strip() != REPLACE_MARKER:
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise PatchError(f"Unterminated edit block for {path}.")
+        i += 1
+        blocks.append((
+            path,
+            "".join(line + "\n" for line in search),
+            "".join(line + "\n" for line in replace),
+        ))
+    return blocks
+
+def _find_lines(lines, needle, start_hint=0, compare=None):
+    """
+    Returns the line indexes where `needle` (a list of lines) occurs in `lines`, checking
+    positions near `start_hint` first. `compare` normalizes lines before comparing.
+    """
+    compare = compare or (lambda line: line)
+    wanted = [compare(line) for line in needle]
+    found = []
+    for position in range(0, len(lines) - len(needle) + 1):
+        if all(compare(lines[position + k]) == wanted[k] for k in range(len(needle))):
+            found.append(position)
+    return sorted(found, key=lambda position: abs(position - start_hint))
+
+def _indentation(line):
+    return line[:len(line) - len(line.lstrip())]
+
+def apply_block(content, search, replace, path):
+    """
+    Applies one block to a file's content and returns the new content. An exact match
+    is used when there is one; otherwise lines are compared ignoring trailing whitespace,
+    then ignoring indentation, in which case the replacement is re-indented to match.
+    """
+    if not search.strip():
+        if content.strip():
+            raise PatchError(f"Empty SEARCH block for existing file {path}.")
+        return replace
+    occurrences = content.count(search)
+    if occurrences == 1:
+        return content.replace(search, replace, 1)
+    if occurrences > 1:
+        raise PatchError(f"SEARCH block matches {occurrences} places in {path}; it must be unique:\n{search}")
+
+    lines = content.splitlines(keepends=True)
+    needle = search.splitlines()
+    for compare in (str.rstrip, str.strip):
+        matches = _find_lines(lines, needle, compare=compare)
+        if len(matches) > 1:
+            raise PatchError(f"SEARCH block matches {len(matches)} places in {path}; it must be unique:\n{search}")
+        if matches:
+            position = matches[0]
+            replacement = replace.splitlines(keepends=True)
+            if compare is str.strip:
+                replacement = _reindent(replacement, needle, lines[position:position + len(needle)])
+            if replacement and not replacement[-1].endswith("\n") and position + len(needle) < len(lines):
+                replacement[-1] += "\n"
+            return "".join(lines[:position] + replacement + lines[position + len(needle):])
+    raise PatchError(f"SEARCH block not found in {path}:\n{search}")
+
+def _reindent(replacement, search_lines, file_lines):
+    """Shifts replacement lines by the indentation difference between the SEARCH text and the file."""
+    search_first = next((line for line in search_lines if line.strip()), "")
+    file_first = next((line for line in file_lines if line.strip()), "")
+    have, want = _indentation(search_first), _indentation(file_first)
+    if have == want:
+        return replacement
+    shifted = []
+    for line in replacement:
+        if line.strip() and line.startswith(have):
+            line = want + line[len(have):]
+        shifted.append(line)
+    return shifted
+
+def parse_unified_diff(text):
+    """
+    Returns the file patches in a unified diff as (path, hunks) pairs, where each hunk
+    is (old_start, [(tag, line), ...]) with tag " ", "-" or "+". `a/` and `b/` prefixes
+    are dropped; a patch from /dev/null creates its file.
+    """
+    patches = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        old_match = DIFF_OLD_FILE.match(lines[i])
+        new_match = DIFF_NEW_FILE.match(lines[i + 1]) if old_match and i + 1 < len(lines) else None
+        if not new_match:
+            i += 1
+            continue
+        path = new_match.group(1)
+        if path == "/dev/null":
+            raise PatchError(f"Deleting {old_match.group(1)} is not supported.")
+        if path.startswith(("a/", "b/")):
+            path = path[2:]
+        i += 2
+        hunks = []
+        while i < len(lines) and not DIFF_OLD_FILE.match(lines[i]):
+            header = HUNK_HEADER.match(lines[i])
+            i += 1
+            if not header:
+                continue
+            body = []
+            while i < len(lines) and not HUNK_HEADER.match(lines[i]) and not lines[i].startswith("--- "):
+                line = lines[i]
+                if line.startswith("\\"): # "\ No newline at end of file"
+                    i += 1
+                    continue
+                if line.startswith("```"):
+                    break
+                tag = line[:1] if line[:1] in (" ", "-", "+") else " "
+                body.append((tag, line[1:] if line[:1] in (" ", "-", "+") else line))
+                i += 1
+            # Trailing blank context lines are usually formatting noise
+            while body and body[-1] == (" ", ""):
+                body.pop()
+            if not any(tag != " " for tag, _ in body):
+                raise PatchError(f"Hunk at line {header.group(1)} of {path} changes nothing.")
+            hunks.append((int(header.group(1)), body))
+        if not hunks:
+            raise PatchError(f"Diff for {path} has no hunks.")
+        patches.append((path, hunks))
+    return patches
+
+def apply_hunks(content, hunks, path):
+    """
+    Applies unified-diff hunks to a file's content. Each hunk's context and removed lines
+    must match: at the stated line if possible, else at the nearest place within
+    HUNK_SEARCH_WINDOW lines, else anywhere, as long as the match is unique.
+    """
+    lines = content.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    offset = 0
+    last_end = 0
+    for old_start, body in hunks:
+        old = [line for tag, line in body if tag != "+"]
+        new = [line + "\n" for tag, line in body if tag != "-"]
+        hint = max(old_start - 1 + offset, 0)
+        if not old:
+            # Pure insertion: the hunk's stated line is all there is to go on
+            position = min(hint, len(lines))
+        else:
+            matches = []
+            for compare in (None, str.rstrip):
+                matches = _find_lines(lines, old, hint, compare or (lambda line: line.rstrip("\n")))
+                if matches:
+                    break
+            near = [m for m in matches if abs(m - hint) <= HUNK_SEARCH_WINDOW]
+            if len(near) == 1 or (near and near[0] == hint):
+                position = near[0]
+            elif len(matches) == 1:
+                position = matches[0]
+            elif not matches:
+                preview = "".join(f"{tag}{line}\n" for tag, line in body)
+                raise PatchError(f"Hunk at line {old_start} does not match {path}:\n{preview}")
+            else:
+                raise PatchError(f"Hunk at line {old_start} matches {len(matches)} places in {path}.")
+        if position < last_end:
+            raise PatchError(f"Hunks overlap in {path} around line {old_start}.")
+        lines[position:position + len(old)] = new
+        last_end = position + len(new)
+        offset += len(new) - len(old)
+    return "".join(lines)
+
+def apply_edits(text, read_file, resolve_path=None):
+    """
+    Parses a reply in either edit format and applies it in memory. Returns {path: new
+    content} for every file it touches, or {} if the reply holds no edits at all.
+    `resolve_path` maps a file name from the reply to a real path (and may raise
+    PatchError); `read_file(path)` returns current content, or None for a new file.
+    """
+    resolve_path = resolve_path or (lambda path: path)
+    contents = {}
+
+    def current(path):
+        if path not in contents:
+            contents[path] = read_file(path)
+        return contents[path]
+
+    if SEARCH_MARKER in text:
+        for path, search, replace in parse_edit_blocks(text):
+            path = resolve_path(path)
+            if current(path) is None and search.strip():
+                raise PatchError(f"{path} does not exist.")
+            contents[path] = apply_block(current(path) or "", search, replace, path)
+        return contents
+
+    for path, hunks in parse_unified_diff(text):
+        path = resolve_path(path)
+        if current(path) is None and any(tag != "+" for _, body in hunks for tag, _ in body):
+            raise PatchError(f"{path} does not exist.")
+        contents[path] = apply_hunks(current(path) or "", hunks, path)
+    return contents
+
+def validate(contents):
+    """Raises PatchError if an edited Python file does not compile or still holds edit markers."""
+    for path, content in contents.items():
+        for marker in (SEARCH_MARKER, REPLACE_MARKER):
+            if marker in content:
+                raise PatchError(f"{path} still contains an edit marker ({marker}).")
+        if path.endswith(".py"):
+            try:
+                # compile, not ast.parse: it also reports errors such as `return` outside a function
+                compile(content, path, "exec", dont_inherit=True)
+            except SyntaxError as e:
+                raise PatchError(f"{path} would not parse: line {e.lineno}: {e.msg}")
+            except ValueError as e:
+                raise PatchError(f"{path} would not parse: {e}")
+
+def write_files_atomically(contents):
+    """
+    Writes several files so that either all of them change or none do: every file is
+    written to a temp file first, then the temp files are renamed into place. If a rename
+    fails, the files already replaced are restored.
+    """
+    staged = []
+    try:
+        for path, content in contents.items():
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".rde-", suffix=".tmp")
+            staged.append((path, temp_path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            if os.path.exists(path):
+                os.chmod(temp_path, os.stat(path).st_mode)
+
+        originals = {}
+        for path, _ in staged:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    originals[path] = f.read()
+        replaced = []
+        try:
+            for path, temp_path in staged:
+                os.replace(temp_path, path)
+                replaced.append(path)
+        except OSError:
+            for path in replaced:
+                if path in originals:
+                    write_file_atomically(path, originals[path])
+                else:
+                    os.remove(path)
+            raise
+    finally:
+        for _, temp_path in staged:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+def write_file_atomically(path, content):
+    """Writes `content` to a temp file next to `path` and renames it into place."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".rde-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,244 @@
+"""
+Fast import of an existing project into a directory.
+
+Git sources (http(s)/ssh/git@/file:// URLs and paths ending in .git) are cloned shallow
+and partial: `--depth`, `--filter=blob:none` and, when paths are given, a sparse
+checkout of only those paths. Local directories are copied in parallel, cloning each
+file with a reflink where the filesystem supports it (btrfs, XFS, ...) and copying it
+otherwise. Version control metadata, virtualenvs, node_modules, caches and build output
+are skipped (see IGNORE_PATTERNS, plus a `.rdeignore` file in the source root).
+
+The import goes into a staging directory next to the destination, which replaces the
+destination only once the import succeeded, so a failed import leaves the old project.
+"""
+import os
+import re
+import time
+import errno
+import shutil
+import fnmatch
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+# --- CONFIGURATION ---
+# Commits of history to clone (0 = full history)
+CLONE_DEPTH = int(os.environ.get("RDE_IMPORT_DEPTH", "1"))
+# Partial clone filter; empty to fetch every blob up front
+CLONE_FILTER = os.environ.get("RDE_IMPORT_FILTER", "blob:none")
+# How local files are copied: "auto" (reflink, else copy), "reflink", "hardlink" or "copy".
+# Hardlinks are opt-in: the engine replaces files atomically, but any tool that writes a
+# project file in place would change the source project as well.
+LINK_MODE = os.environ.get("RDE_IMPORT_LINK", "auto").lower()
+COPY_WORKERS = int(os.environ.get("RDE_IMPORT_WORKERS", str(min(32, (os.cpu_count() or 1) * 4))))
+COPY_BATCH = 64 # Files per copy task
+# Skipped when copying a directory. Patterns without a "/" match any file or directory
+# name; patterns with one match the path relative to the source root.
+IGNORE_PATTERNS = (
+    ".git", ".hg", ".svn",
+    ".venv", "venv", "node_modules", "bower_components",
+    "__pycache__", "*.py[cod]", ".pytest_cache", ".mypy_cache", ".ruff_cache", ".tox", ".nox",
+    "build", "dist", "*.egg-info", ".eggs", "target", ".gradle", ".next", ".DS_Store",
+)
+IGNORE_FILE = ".rdeignore"
+EXTRA_IGNORES = tuple(p.strip() for p in os.environ.get("RDE_IMPORT_IGNORE", "").split(",") if p.strip())
+
+FICLONE = 0x40049409 # Linux ioctl that makes dst share src's extents
+_NO_REFLINK_ERRORS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF)
+
+class ProjectImportError(Exception):
+    """Raised when a source cannot be imported."""
+
+def is_git_source(source):
+    return source.startswith(("http://", "https://", "ssh://", "git://", "file://", "git@")) or source.rstrip("/\\").endswith(".git")
+
+def load_ignore_patterns(source_dir):
+    """Returns the default patterns plus RDE_IMPORT_IGNORE and the source's .rdeignore."""
+    patterns = list(IGNORE_PATTERNS) + list(EXTRA_IGNORES)
+    try:
+        with open(os.path.join(source_dir, IGNORE_FILE), 'r', encoding='utf-8') as f:
+            patterns.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    except OSError:
+        pass
+    return patterns
+
+def compile_ignore(patterns):
+    """Compiles ignore patterns into one name regex and one path regex, checked per entry."""
+    names = [fnmatch.translate(p.rstrip("/")) for p in patterns if "/" not in p.rstrip("/")]
+    paths = [fnmatch.translate(p.rstrip("/").lstrip("/")) for p in patterns if "/" in p.rstrip("/")]
+    never = "(?!)"
+    return re.compile("|".join(names) or never), re.compile("|".join(paths) or never)
+
+def is_ignored(relative, name, compiled):
+    name_regex, path_regex = compiled
+    return bool(name_regex.match(name) or path_regex.match(relative.replace(os.sep, "/")))
+
+class _Copier:
+    """Copies single files by the configured mode, and stops trying reflinks once the filesystem refuses one."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.reflink = mode in ("auto", "reflink") and fcntl is not None and hasattr(fcntl, "ioctl")
+
+    def _try_reflink(self, src, dst):
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError as e:
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+            if e.errno in _NO_REFLINK_ERRORS:
+                self.reflink = False
+                return False
+            raise
+        shutil.copystat(src, dst)
+        return True
+
+    def copy(self, src, dst):
+        """Returns how the file was copied: "reflink", "hardlink" or "copy"."""
+        if self.mode == "hardlink":
+            try:
+                os.link(src, dst)
+                return "hardlink"
+            except OSError:
+                pass # Other filesystem, or links not allowed: copy instead
+        if self.reflink and self._try_reflink(src, dst):
+            return "reflink"
+        shutil.copy2(src, dst)
+        return "copy"
+
+def copy_files(source_dir, destination, files, mode=LINK_MODE, workers=COPY_WORKERS):
+    """
+    Copies the given relative paths from `source_dir` to `destination` with a thread pool.
+    Parent directories must exist and targets must not. Returns ({method: count}, bytes).
+    """
+    copier = _Copier(mode)
+    def copy_batch(batch):
+        counts, size = {}, 0
+        for relative in batch:
+            src = os.path.join(source_dir, relative)
+            method = copier.copy(src, os.path.join(destination, relative))
+            counts[method] = counts.get(method, 0) + 1
+            size += os.path.getsize(src)
+        return counts, size
+
+    # Files go to the pool in batches, so small files do not pay a task hand-off each
+    by_method, total_bytes = {}, 0
+    batches = [files[i:i + COPY_BATCH] for i in range(0, len(files), COPY_BATCH)]
+    if not batches:
+        return by_method, total_bytes
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as executor:
+        for counts, size in executor.map(copy_batch, batches):
+            for method, count in counts.items():
+                by_method[method] = by_method.get(method, 0) + count
+            total_bytes += size
+    return by_method, total_bytes
+
+def copy_tree(source_dir, destination, patterns=None, mode=LINK_MODE, workers=COPY_WORKERS):
+    """
+    Copies `source_dir` into `destination` (which must not exist yet), skipping ignored
+    paths and virtualenvs. Directories are created first, then files are copied by a
+    thread pool. Returns {"files", "bytes", "skipped", "by_method"}.
+    """
+    compiled = compile_ignore(load_ignore_patterns(source_dir) if patterns is None else patterns)
+    directories, files, links, skipped = [destination], [], [], 0
+    for root, dir_names, file_names in os.walk(source_dir):
+        relative_root = os.path.relpath(root, source_dir)
+        relative_root = "" if relative_root == "." else relative_root
+        kept = []
+        for name in dir_names:
+            relative = os.path.join(relative_root, name)
+            path = os.path.join(root, name)
+            if is_ignored(relative, name, compiled) or os.path.exists(os.path.join(path, "pyvenv.cfg")):
+                skipped += 1
+            elif os.path.islink(path):
+                links.append(relative) # Kept as a link, not followed
+            else:
+                kept.append(name)
+                directories.append(os.path.join(destination, relative))
+        dir_names[:] = kept
+        for name in file_names:
+            relative = os.path.join(relative_root, name)
+            if is_ignored(relative, name, compiled):
+                skipped += 1
+            elif os.path.islink(os.path.join(root, name)):
+                links.append(relative)
+            else:
+                files.append(relative)
+
+    for directory in directories:
+        os.makedirs(directory)
+    for relative in links:
+        os.symlink(os.readlink(os.path.join(source_dir, relative)), os.path.join(destination, relative))
+
+    by_method, total_bytes = copy_files(source_dir, destination, files, mode, workers)
+    return {"files": len(files) + len(links), "bytes": total_bytes, "skipped": skipped, "by_method": by_method}
+
+def clone(source, destination, depth=CLONE_DEPTH, sparse_paths=(), branch=None, clone_filter=CLONE_FILTER):
+    """
+    Clones `source` into `destination` shallow and partial. Local repositories are cloned
+    through file:// because git ignores --depth and --filter on plain local paths.
+    """
+    url = source
+    if not source.startswith(("http://", "https://", "ssh://", "git://", "file://", "git@")) and os.path.exists(source):
+        url = "file://" + os.path.abspath(source).replace(os.sep, "/")
+    command = ["git", "clone", "--quiet", "--single-branch"]
+    if depth:
+        command += ["--depth", str(depth)]
+    if clone_filter:
+        command += [f"--filter={clone_filter}"]
+    if sparse_paths:
+        command += ["--sparse"]
+    if branch:
+        command += ["--branch", branch]
+    subprocess.run(command + [url, destination], check=True, capture_output=True, text=True)
+    if sparse_paths:
+        subprocess.run(["git", "-C", destination, "sparse-checkout", "set", *sparse_paths], check=True, capture_output=True, text=True)
+
+def import_project(source, destination, depth=CLONE_DEPTH, sparse_paths=(), branch=None, mode=LINK_MODE):
+    """
+    Imports `source` (git URL/bare repository or local directory) into `destination`
+    through a staging directory, replacing `destination` only when the import succeeded.
+    Returns {"method", "files", "bytes", "skipped", "by_method", "seconds"}; raises
+    ProjectImportError when the source is unusable.
+    """
+    started = time.monotonic()
+    destination = os.path.abspath(destination)
+    parent = os.path.dirname(destination)
+    os.makedirs(parent, exist_ok=True)
+    staging = f"{destination}.importing-{os.getpid()}"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    try:
+        if is_git_source(source):
+            try:
+                clone(source, staging, depth, sparse_paths, branch)
+            except subprocess.CalledProcessError as e:
+                raise ProjectImportError(f"git clone failed: {(e.stderr or '').strip()}")
+            result = {"method": "clone", "files": None, "bytes": None, "skipped": 0, "by_method": {}}
+        elif os.path.isdir(source):
+            if os.path.abspath(source) == destination:
+                raise ProjectImportError("source and destination are the same directory")
+            result = dict(copy_tree(source, staging, mode=mode), method="copy")
+        else:
+            raise ProjectImportError(f"'{source}' is not a git URL, a .git repository or a local directory")
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Swap the staged project in; the old one is removed only after the swap
+    previous = None
+    if os.path.lexists(destination):
+        previous = f"{destination}.previous-{os.getpid()}"
+        os.replace(destination, previous)
+    os.replace(staging, destination)
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+    result["seconds"] = round(time.monotonic() - started, 3)
+    return result
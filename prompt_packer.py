@@ -0,0 +1,209 @@
+import os
+import re
+import math
+
+# --- CONFIGURATION ---
+# Rough characters-per-token ratios for each provider's tokenizer. These are
+# estimates, deliberately on the conservative side so packed prompts stay under the limit.
+CHARS_PER_TOKEN = {
+    "gemini": 4.0,
+    "openai": 3.8,
+    "claude": 3.5,
+    "openrouter": 3.5,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Prompt token budgets per provider, leaving headroom for the completion (4000 tokens).
+# AI_PROMPT_TOKEN_BUDGET overrides the budget for every provider.
+TOKEN_BUDGETS = {
+    "gemini": 26000,
+    "openai": 12000,
+    "claude": 150000,
+    "openrouter": 4000,
+}
+DEFAULT_TOKEN_BUDGET = 8000
+
+# Section priorities: lower numbers are kept first when the budget runs out
+PRIORITY_TASK = 0
+PRIORITY_TEST_OUTPUT = 1
+PRIORITY_CODE = 2
+PRIORITY_REFERENCE = 3
+PRIORITY_GUIDELINES = 4
+
+# pytest preamble lines that carry nothing the AI can act on
+PYTEST_NOISE = re.compile(
+    r"^(=+ test session starts =+|platform \w+ -- Python|cachedir: |rootdir: |configfile: |plugins: |collecting \.\.\.|collected \d+ items?)"
+)
+PYTEST_BLOCK_SEPARATOR = re.compile(r"^(_ )+_$")
+PYTHON_FRAME = re.compile(r'^\s*File "[^"]+", line \d+, in ')
+
+def get_token_budget(provider):
+    """Returns the prompt token budget for a provider."""
+    override = os.environ.get("AI_PROMPT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return TOKEN_BUDGETS.get(provider, DEFAULT_TOKEN_BUDGET)
+
+def estimate_tokens(text, provider):
+    """Estimates how many tokens `text` costs with the provider's tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN.get(provider, DEFAULT_CHARS_PER_TOKEN))
+
+def _collapse_python_frames(lines):
+    """Collapses consecutive identical Python traceback frames (header plus source line)."""
+    result = []
+    i = 0
+    while i < len(lines):
+        if PYTHON_FRAME.match(lines[i]):
+            frame = lines[i:i + 2]
+            repeats = 0
+            while lines[i + 2 * (repeats + 1):i + 2 * (repeats + 2)] == frame:
+                repeats += 1
+            result.extend(frame)
+            if repeats:
+                result.append(f"  [... previous frame repeated {repeats} more times ...]")
+            i += 2 * (repeats + 1)
+        else:
+            result.append(lines[i])
+            i += 1
+    return result
+
+def compact_test_output(output):
+    """
+    Removes what a fix prompt does not need from pytest output: the session preamble,
+    duplicate traceback blocks and frames, and runs of identical lines.
+    """
+    lines = [line for line in output.splitlines() if not PYTEST_NOISE.match(line)]
+
+    # pytest's long tracebacks separate frames with "_ _ _" lines; keep each distinct block once
+    blocks = [[]]
+    for line in lines:
+        if PYTEST_BLOCK_SEPARATOR.match(line.strip()):
+            blocks.append([line])
+        else:
+            blocks[-1].append(line)
+    seen = set()
+    deduplicated = []
+    omitted = 0
+    for block in blocks:
+        body = "\n".join(line for line in block if not PYTEST_BLOCK_SEPARATOR.match(line.strip()))
+        if body.strip() and body in seen:
+            omitted += 1
+            continue
+        seen.add(body)
+        deduplicated.extend(block)
+    if omitted:
+        deduplicated.append(f"[... {omitted} duplicate traceback frames omitted ...]")
+
+    lines = _collapse_python_frames(deduplicated)
+
+    compacted = []
+    for line in lines:
+        if compacted and line == compacted[-1] and line.strip():
+            continue
+        compacted.append(line)
+    return "\n".join(compacted).strip("\n")
+
+def trim_to_tokens(text, max_tokens, provider):
+    """
+    Trims `text` to about `max_tokens` by cutting lines from the middle. The head and
+    tail survive because that is where tracebacks put the first failure and the summary.
+    """
+    if estimate_tokens(text, provider) <= max_tokens:
+        return text
+    max_chars = int(max_tokens * CHARS_PER_TOKEN.get(provider, DEFAULT_CHARS_PER_TOKEN)) - 40
+    lines = text.splitlines()
+    head, tail = [], []
+    front, back = 0, len(lines) - 1
+    used = 0
+    while front <= back:
+        take_front = len(head) <= len(tail)
+        line = lines[front] if take_front else lines[back]
+        if used + len(line) + 1 > max_chars:
+            break
+        used += len(line) + 1
+        if take_front:
+            head.append(line)
+            front += 1
+        else:
+            tail.append(line)
+            back -= 1
+
+    if not head and not tail:
+        # A single enormous line; fall back to cutting characters
+        half = max(max_chars // 2, 0)
+        return f"{text[:half]}\n[... trimmed ...]\n{text[len(text) - half:]}"
+    tail.reverse()
+    return "\n".join(head + [f"[... {back - front + 1} lines trimmed ...]"] + tail)
+
+def make_section(name, text, priority, required=False, trimmable=True, max_share=None):
+    """
+    Describes one prompt section. Required sections are always included in full;
+    trimmable ones are cut from the middle, others are dropped whole when they do not
+    fit. `max_share` caps a section at that fraction of the budget.
+    """
+    return {
+        "name": name,
+        "text": text,
+        "priority": priority,
+        "required": required,
+        "trimmable": trimmable,
+        "max_share": max_share,
+    }
+
+def pack_prompt(provider, sections, budget=None):
+    """
+    Fits the sections into the provider's token budget, filling it in priority order,
+    and joins the survivors in their original order. Returns (prompt, report), where the
+    report lists each section's estimated tokens before and after packing.
+    """
+    budget = budget or get_token_budget(provider)
+    remaining = budget
+    packed = {}
+
+    for index, section in enumerate(sections):
+        if section["required"]:
+            packed[index] = section["text"]
+            remaining -= estimate_tokens(section["text"], provider)
+
+    ranked = sorted(
+        (i for i, s in enumerate(sections) if not s["required"]),
+        key=lambda i: (sections[i]["priority"], i),
+    )
+    for index in ranked:
+        section = sections[index]
+        allowance = remaining
+        if section["max_share"]:
+            allowance = min(allowance, int(budget * section["max_share"]))
+        tokens = estimate_tokens(section["text"], provider)
+        if tokens <= allowance:
+            packed[index] = section["text"]
+        elif section["trimmable"] and allowance > 50:
+            packed[index] = trim_to_tokens(section["text"], allowance, provider)
+        else:
+            continue
+        remaining -= estimate_tokens(packed[index], provider)
+
+    report = []
+    for index, section in enumerate(sections):
+        report.append({
+            "name": section["name"],
+            "tokens": estimate_tokens(section["text"], provider),
+            "packed_tokens": estimate_tokens(packed[index], provider) if index in packed else 0,
+        })
+    prompt = "".join(packed[index] for index in sorted(packed))
+    return prompt, report
+
+def format_report(report, provider, budget=None):
+    """Renders a packing report as one readable line per section."""
+    budget = budget or get_token_budget(provider)
+    total = sum(entry["packed_tokens"] for entry in report)
+    lines = [f"Prompt tokens (estimated for {provider}): {total} of {budget}"]
+    for entry in report:
+        if entry["packed_tokens"] == entry["tokens"]:
+            status = ""
+        elif entry["packed_tokens"] == 0:
+            status = " (dropped)"
+        else:
+            status = f" (trimmed from {entry['tokens']})"
+        lines.append(f"  {entry['name']}: {entry['packed_tokens']}{status}")
+    return "\n".join(lines)
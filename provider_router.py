@@ -0,0 +1,477 @@
+"""
+Routes completion requests across AI providers.
+
+Every provider gets a token bucket (requests per minute), a cap on concurrent requests
+and a circuit breaker. Retryable failures (429, 5xx, timeouts, dropped connections) are
+retried with exponential backoff and full jitter, waiting at least as long as the
+provider's Retry-After header asks. When the primary provider is slower than its own
+recent latency percentile, the request is hedged: the same prompt goes to the next
+provider in the route and the first answer wins. A provider whose circuit is open, or
+that fails for good, is skipped in favor of the next one.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import email.utils
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+import ai_client
+import tracing
+
+# --- CONFIGURATION ---
+# Providers tried after AI_MODEL_PROVIDER, in order, e.g. "openai,claude"
+FALLBACK_PROVIDERS = [p.strip().lower() for p in os.environ.get("AI_FALLBACK_PROVIDERS", "").split(",") if p.strip()]
+
+# Requests per minute allowed per provider; AI_RATE_LIMITS="gemini=60,openai=500" overrides
+RATE_LIMITS = {
+    "gemini": 60,
+    "openai": 60,
+    "claude": 50,
+    "openrouter": 20,
+}
+for _item in os.environ.get("AI_RATE_LIMITS", "").split(","):
+    if "=" in _item:
+        _name, _limit = _item.split("=", 1)
+        RATE_LIMITS[_name.strip().lower()] = float(_limit)
+DEFAULT_RATE_LIMIT = 60
+MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "4"))
+# SQLite file holding the token buckets, so that several engine processes (e.g. the jobs
+# of `orchestrator.py batch`) share one rate budget instead of each spending the full rate
+SHARED_RATE_DB = os.environ.get("AI_RATE_BUDGET_DB")
+
+MAX_ATTEMPTS = int(os.environ.get("AI_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRYABLE_STATUS = (408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529)
+
+# Hedge once the primary is slower than this percentile of its recent latencies (0 disables)
+HEDGE_PERCENTILE = float(os.environ.get("AI_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = 5
+LATENCY_WINDOW = 50
+
+# Consecutive failures that open a provider's circuit, and how long it stays open
+CIRCUIT_FAILURES = 5
+CIRCUIT_COOLDOWN = 30.0
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised when no provider in the route could produce a completion."""
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a provider is skipped because its circuit is open."""
+
+class CallCancelled(RuntimeError):
+    """Raised inside a hedged call that lost the race before it was sent."""
+
+class TokenBucket:
+    """Allows `rate_per_minute` requests per minute with bursts of up to `capacity`."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 10.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self):
+        """Takes a token if one is available. Returns 0, or the seconds until one will be."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return max(self.paused_until - now, (1 - self.tokens) / self.rate)
+
+    def acquire(self, cancel=None):
+        """Blocks until a request may be sent, or raises CallCancelled once `cancel` is set."""
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise CallCancelled()
+            wait_for = self._take()
+            if not wait_for:
+                return
+            time.sleep(min(wait_for, 0.5))
+
+    def pause(self, seconds):
+        """Holds every request back for `seconds`, e.g. after a 429 with Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A TokenBucket kept in an SQLite file instead of memory. Every process that opens the
+    same file draws from the same bucket, and a 429 pause holds all of them back.
+    """
+
+    def __init__(self, rate_per_minute, db_path, name, capacity=None):
+        super().__init__(rate_per_minute, capacity)
+        self.db_path = db_path
+        self.name = name
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, paused_until REAL NOT NULL)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _update(self, change):
+        """
+        Refills the stored bucket and applies `change(now, tokens, paused_until)`, which
+        returns (tokens, paused_until, result), in one locked transaction. Wall-clock time
+        is used because monotonic clocks are not comparable across processes.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            tokens, updated, paused_until = row or (self.capacity, now, 0.0)
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            tokens, paused_until, result = change(now, tokens, paused_until)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                (self.name, tokens, now, paused_until),
+            )
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def _take(self):
+        def change(now, tokens, paused_until):
+            if now >= paused_until and tokens >= 1:
+                return tokens - 1, paused_until, 0
+            return tokens, paused_until, max(paused_until - now, (1 - tokens) / self.rate)
+        return self._update(change)
+
+    def pause(self, seconds):
+        self._update(lambda now, tokens, paused_until: (0, max(paused_until, now + seconds), None))
+
+def make_bucket(provider):
+    """Returns the rate limiter for a provider: shared through SHARED_RATE_DB when it is set."""
+    rate = RATE_LIMITS.get(provider, DEFAULT_RATE_LIMIT)
+    if SHARED_RATE_DB:
+        return SharedTokenBucket(rate, SHARED_RATE_DB, provider)
+    return TokenBucket(rate)
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing provider for a while, then lets a single trial call through.
+    Only retryable failures (throttling, 5xx, network trouble) count toward opening it.
+    """
+
+    def __init__(self, failures=CIRCUIT_FAILURES, cooldown=CIRCUIT_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_running:
+                return False
+            self.trial_running = True # Half-open: this caller is the trial
+            return True
+
+    def release_trial(self):
+        """Ends a trial call that was abandoned before it could succeed or fail."""
+        with self.lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+class ProviderState:
+    """Rate limiter, concurrency slots, circuit breaker and latency history of one provider."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.bucket = make_bucket(provider)
+        self.slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def latency_percentile(self, percentile):
+        """Returns the given percentile of recent successful call latencies, or None if too few."""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+_states = {}
+_states_lock = threading.Lock()
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rde-hedge")
+
+def get_state(provider):
+    with _states_lock:
+        if provider not in _states:
+            _states[provider] = ProviderState(provider)
+        return _states[provider]
+
+def get_route(primary=None):
+    """Returns the providers to try, primary first, keeping only those with an API key."""
+    route = []
+    for provider in [primary or ai_client.AI_MODEL_PROVIDER] + FALLBACK_PROVIDERS:
+        if provider in ai_client.PROVIDERS and ai_client.API_KEYS.get(provider) and provider not in route:
+            route.append(provider)
+    return route
+
+# --- ERROR CLASSIFICATION ---
+def _status(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def is_retryable(error):
+    """True for failures that may succeed on a later attempt: throttling, 5xx, network trouble."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return _status(error) in RETRYABLE_STATUS
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        json.JSONDecodeError, # Truncated or malformed body in a 200 response
+    ))
+
+def retry_after(error):
+    """Returns the delay the provider asked for in a Retry-After header, in seconds, or None."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, error=None):
+    """Exponential backoff with full jitter, never shorter than the provider's Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    requested = retry_after(error) if error is not None else None
+    return max(delay, requested) if requested is not None else delay
+
+def _describe(error):
+    status = _status(error)
+    return f"HTTP {status}" if status else f"{type(error).__name__}: {error}"
+
+# --- CALLS ---
+@tracing.traced("ai.provider")
+def _call_provider(provider, prompt, model_name, temperature, cancel=None):
+    """
+    Calls one provider, retrying retryable failures. Raises the last error if all attempts
+    fail. Setting `cancel` stops a call that is still waiting to be sent.
+    """
+    state = get_state(provider)
+    tracing.annotate(provider=provider)
+    for attempt in range(MAX_ATTEMPTS):
+        # Wait for the rate limiter first: a call cancelled while queued must not hold the half-open trial
+        state.bucket.acquire(cancel)
+        if not state.breaker.allow():
+            raise CircuitOpenError(f"{provider} circuit is open after repeated failures.")
+        started = time.monotonic()
+        try:
+            with state.slots:
+                text = ai_client.request_completion(provider, prompt, model_name, temperature)
+        except Exception as e:
+            if not is_retryable(e):
+                # A client-side error (e.g. a 400 for an oversized prompt) says nothing about the provider's health
+                state.breaker.release_trial()
+                raise
+            state.breaker.record_failure()
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = backoff_delay(attempt, e)
+            if _status(e) == 429:
+                state.bucket.pause(delay) # Everyone sharing this provider backs off, not just this call
+            print(f"{provider} call failed ({_describe(e)}). Retrying in {delay:.1f}s.")
+            tracing.current_span().add("retries")
+            if cancel is not None and cancel.wait(delay):
+                raise CallCancelled()
+            if cancel is None:
+                time.sleep(delay)
+            continue
+        state.latencies.append(time.monotonic() - started)
+        state.breaker.record_success()
+        return text
+
+def _hedged_call(primary, secondary, prompt, model_name, temperature):
+    """
+    Calls the primary and, if it has not answered within its latency percentile, the
+    secondary too. Returns (provider, text) from the first to succeed. Raises the primary's
+    error if it failed unhedged, or ProviderUnavailableError if both were tried and failed.
+    """
+    hedge_after = get_state(primary).latency_percentile(HEDGE_PERCENTILE) if HEDGE_PERCENTILE else None
+    if hedge_after is None:
+        return primary, _call_provider(primary, prompt, model_name, temperature)
+
+    cancel = threading.Event()
+    primary_future = _hedge_pool.submit(tracing.in_context(_call_provider), primary, prompt, model_name, temperature, cancel)
+    done, _ = wait([primary_future], timeout=hedge_after)
+    if done and primary_future.exception() is None:
+        return primary, primary_future.result()
+    if not done:
+        print(f"--- {primary} is slower than its p{int(HEDGE_PERCENTILE * 100)} ({hedge_after:.1f}s); hedging with {secondary} ---")
+    tracing.annotate(hedged=True)
+    secondary_future = _hedge_pool.submit(tracing.in_context(_call_provider), secondary, prompt, None, temperature, cancel)
+    futures = {primary_future: primary, secondary_future: secondary}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # A loser still queued is never sent; one already in flight runs out and is discarded
+                cancel.set()
+                return futures[future], future.result()
+    raise ProviderUnavailableError("; ".join(
+        f"{name}: {_describe(future.exception())}" for future, name in futures.items()
+    ))
+
+def _cached(route, prompt, model_name, temperature):
+    """Returns the first cached answer from any provider in the route, or None."""
+    for position, provider in enumerate(route):
+        _, text = ai_client._cache_lookup(provider, prompt, model_name if position == 0 else None, temperature)
+        if text is not None:
+            return text
+    return None
+
+@tracing.traced("ai.call")
+def call(prompt, model_name=None, temperature=ai_client.AI_TEMPERATURE, use_cache=True, primary=None):
+    """
+    Returns a completion for `prompt` from the first provider in the route that can give
+    one. `model_name` applies to the primary provider only; fallbacks use their default
+    model. Raises ProviderUnavailableError if every provider fails.
+    """
+    route = get_route(primary)
+    if not route:
+        raise ProviderUnavailableError("No AI provider has an API key configured.")
+    tracing.annotate(bytes_in=len(prompt), cache_hit=False)
+    if use_cache:
+        text = _cached(route, prompt, model_name, temperature)
+        if text is not None:
+            tracing.annotate(cache_hit=True, bytes_out=len(text))
+            return text
+
+    errors = []
+    position = 0
+    while position < len(route):
+        provider = route[position]
+        model = model_name if position == 0 else None
+        secondary = route[position + 1] if position + 1 < len(route) else None
+        try:
+            if secondary:
+                provider, text = _hedged_call(provider, secondary, prompt, model, temperature)
+            else:
+                text = _call_provider(provider, prompt, model, temperature)
+        except ProviderUnavailableError as e:
+            # Hedged: both providers were tried
+            print(f"--- {provider} and {secondary} unavailable ({e}) ---")
+            errors.append(str(e))
+            position += 2
+            continue
+        except Exception as e:
+            print(f"--- {provider} unavailable ({_describe(e)}) ---")
+            errors.append(f"{provider}: {_describe(e)}")
+            position += 1
+            continue
+        if use_cache:
+            answered_model = model if provider == route[position] else None
+            ai_client._cache_store(ai_client.cache_key_for(provider, prompt, answered_model, temperature), text)
+        tracing.annotate(provider=provider, failovers=len(errors), bytes_out=len(text))
+        return text
+    raise ProviderUnavailableError("All AI providers failed: " + "; ".join(errors))
+
+def stream(prompt, model_name=None, temperature=ai_client.AI_TEMPERATURE, use_cache=True, primary=None):
+    """
+    Streams a completion as text chunks from the first provider that can give one. A
+    provider is retried or skipped only until its first chunk arrives; a stream that
+    breaks after that raises, since the text already handed out cannot be taken back.
+    """
+    route = get_route(primary)
+    if not route:
+        raise ProviderUnavailableError("No AI provider has an API key configured.")
+    if use_cache:
+        text = _cached(route, prompt, model_name, temperature)
+        if text is not None:
+            yield text
+            return
+
+    errors = []
+    for position, provider in enumerate(route):
+        state = get_state(provider)
+        model = model_name if position == 0 else None
+        for attempt in range(MAX_ATTEMPTS):
+            state.bucket.acquire()
+            if not state.breaker.allow():
+                errors.append(f"{provider}: circuit open")
+                break
+            received = []
+            # A generator cannot keep a span open across its yields, so each stream is recorded once it ends
+            started = time.perf_counter()
+            try:
+                with state.slots:
+                    for chunk in ai_client.stream_ai_api(provider, prompt, model, temperature, use_cache=False):
+                        received.append(chunk)
+                        yield chunk
+            except GeneratorExit:
+                # Closed by the consumer: the stream neither succeeded nor failed
+                state.breaker.release_trial()
+                tracing.record_span("ai.stream", started, "cancelled", provider=provider, bytes_out=sum(map(len, received)))
+                raise
+            except Exception as e:
+                tracing.record_span("ai.stream", started, "error", provider=provider, retries=attempt, error=_describe(e))
+                if is_retryable(e):
+                    state.breaker.record_failure()
+                else:
+                    state.breaker.release_trial()
+                if received:
+                    raise
+                if is_retryable(e) and attempt < MAX_ATTEMPTS - 1:
+                    delay = backoff_delay(attempt, e)
+                    if _status(e) == 429:
+                        state.bucket.pause(delay)
+                    print(f"{provider} stream failed ({_describe(e)}). Retrying in {delay:.1f}s.")
+                    time.sleep(delay)
+                    continue
+                print(f"--- {provider} unavailable ({_describe(e)}) ---")
+                errors.append(f"{provider}: {_describe(e)}")
+                break
+            state.breaker.record_success()
+            tracing.record_span("ai.stream", started, provider=provider, retries=attempt,
+                                bytes_in=len(prompt), bytes_out=sum(map(len, received)), chunks=len(received))
+            if use_cache:
+                ai_client._cache_store(ai_client.cache_key_for(provider, prompt, model, temperature), "".join(received))
+            return
+    raise ProviderUnavailableError("All AI providers failed: " + "; ".join(errors))
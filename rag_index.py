@@ -0,0 +1,273 @@
+"""
+Retrieval index over the documents in persistency/rag/.
+
+Documents are split into chunks of about CHUNK_CHARS characters (at markdown headings
+and blank lines where possible) and stored in an SQLite inverted index: one postings
+row per (term, chunk). The database is opened memory-mapped, and `update_index` only
+re-chunks files whose fingerprint changed, so keeping the index current is cheap even
+for a large corpus. `search` ranks chunks with BM25 by reading only the postings of
+the query's terms.
+
+Documents are keyed by absolute path, so one index database can serve several
+knowledge-base directories (e.g. batch workspaces): `update_index` only adds and prunes
+documents under the directory it scans, and `search` can be limited to one directory.
+"""
+import os
+import sys
+import heapq
+import sqlite3
+import hashlib
+from collections import Counter
+from operator import itemgetter
+import bm25
+from guideline_index import split_sections
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.abspath(os.environ.get("RDE_RAG_DIR", os.path.join(ENGINE_ROOT, "persistency", "rag")))
+RAG_INDEX_DB = os.environ.get("RDE_RAG_INDEX", os.path.join(ENGINE_ROOT, "persistency", "cache", "rag_index.db"))
+CHUNK_CHARS = 1500
+# Bytes of the index file SQLite may memory-map instead of reading through its page cache
+MMAP_BYTES = 256 * 1024 * 1024
+TEXT_EXTENSIONS = (".md", ".txt", ".rst", ".py", ".json", ".yaml", ".yml", ".toml", ".cfg", ".ini", ".html", ".csv")
+
+def _connect(db_path):
+    """Opens the index database memory-mapped, creating the schema on first use."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS documents ("
+        "id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime_ns INTEGER NOT NULL, "
+        "size INTEGER NOT NULL, content_hash TEXT NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS chunks ("
+        "id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL, position INTEGER NOT NULL, "
+        "heading TEXT NOT NULL, text TEXT NOT NULL, length INTEGER NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_id)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS postings ("
+        "term TEXT NOT NULL, chunk_id INTEGER NOT NULL, tf INTEGER NOT NULL, "
+        "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+    )
+    return conn
+
+# --- CHUNKING ---
+def _split_long(paragraph, max_chars):
+    """Splits a paragraph longer than `max_chars` at line breaks, or at `max_chars` as a last resort."""
+    pieces, current = [], ""
+    for line in paragraph.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_text(text, path, max_chars=CHUNK_CHARS):
+    """
+    Splits a document into (heading, text) chunks of at most about `max_chars`. Markdown
+    is split at headings first; within a section, paragraphs are packed together until
+    the next one would not fit. Each chunk keeps the heading it falls under.
+    """
+    if path.endswith(".md"):
+        sections = [(section["heading"], section["text"]) for section in split_sections(text)]
+    else:
+        sections = [("", text)]
+
+    chunks = []
+    for heading, body in sections:
+        current = ""
+        for paragraph in body.split("\n\n"):
+            if not paragraph.strip():
+                continue
+            for piece in _split_long(paragraph, max_chars):
+                if current and len(current) + len(piece) + 2 > max_chars:
+                    chunks.append((heading, current))
+                    current = ""
+                current = f"{current}\n\n{piece}" if current else piece
+        if current.strip():
+            chunks.append((heading, current))
+    return chunks
+
+# --- INDEXING ---
+def _iter_documents(rag_dir):
+    """Yields the paths of indexable documents under `rag_dir`, skipping hidden files."""
+    for root, dirs, files in os.walk(rag_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith(".") and name.lower().endswith(TEXT_EXTENSIONS):
+                yield os.path.join(root, name)
+
+def _index_document(conn, path, stat, content_hash, text, postings):
+    """Replaces the chunks of one document and appends its postings rows to `postings`."""
+    _remove_document(conn, path)
+    cursor = conn.execute(
+        "INSERT INTO documents (path, mtime_ns, size, content_hash) VALUES (?, ?, ?, ?)",
+        (path, stat.st_mtime_ns, stat.st_size, content_hash),
+    )
+    document_id = cursor.lastrowid
+    for position, (heading, chunk) in enumerate(chunk_text(text, path)):
+        terms = Counter(bm25.tokenize(f"{heading}\n{chunk}"))
+        cursor = conn.execute(
+            "INSERT INTO chunks (document_id, position, heading, text, length) VALUES (?, ?, ?, ?, ?)",
+            (document_id, position, heading, chunk, sum(terms.values())),
+        )
+        chunk_id = cursor.lastrowid
+        postings.extend((term, chunk_id, tf) for term, tf in terms.items())
+
+def _remove_document(conn, path):
+    """
+    Deletes a document with its chunks and postings, if it is indexed. Postings are found
+    by re-tokenizing the stored chunks, which spares the postings table a second index
+    by chunk that would slow down every insert.
+    """
+    row = conn.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        return
+    stale = []
+    for chunk_id, heading, chunk in conn.execute(
+        "SELECT id, heading, text FROM chunks WHERE document_id = ?", (row[0],)
+    ):
+        stale.extend((term, chunk_id) for term in set(bm25.tokenize(f"{heading}\n{chunk}")))
+    conn.executemany("DELETE FROM postings WHERE term = ? AND chunk_id = ?", stale)
+    conn.execute("DELETE FROM chunks WHERE document_id = ?", (row[0],))
+    conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+
+def update_index(rag_dir=RAG_DIR, db_path=RAG_INDEX_DB):
+    """
+    Brings the index in line with the files in `rag_dir`. Files whose (mtime, size)
+    fingerprint is unchanged are skipped without being read; changed files are re-read
+    and only re-chunked if their content hash changed. Documents indexed from other
+    directories are left alone. Returns a dict of counts.
+    """
+    counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+    prefix = os.path.join(os.path.abspath(rag_dir), "")
+    conn = _connect(db_path)
+    try:
+        with conn:
+            known = {}
+            for path, mtime_ns, size, content_hash in conn.execute("SELECT path, mtime_ns, size, content_hash FROM documents"):
+                # Relative keys come from indexes built before documents were keyed by absolute path
+                if path.startswith(prefix) or not os.path.isabs(path):
+                    known[path] = (mtime_ns, size, content_hash)
+            seen = set()
+            postings = []
+            for path in _iter_documents(rag_dir):
+                key = os.path.abspath(path)
+                seen.add(key)
+                try:
+                    stat = os.stat(path)
+                    previous = known.get(key)
+                    if previous and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+                        counts["unchanged"] += 1
+                        continue
+                    with open(path, 'r', encoding='utf-8') as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Skipping {path}: {e}")
+                    continue
+                content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if previous and previous[2] == content_hash:
+                    conn.execute(
+                        "UPDATE documents SET mtime_ns = ?, size = ? WHERE path = ?",
+                        (stat.st_mtime_ns, stat.st_size, key),
+                    )
+                    counts["unchanged"] += 1
+                    continue
+                _index_document(conn, key, stat, content_hash, text, postings)
+                counts["indexed"] += 1
+
+            for key in set(known) - seen:
+                _remove_document(conn, key)
+                counts["removed"] += 1
+
+            # Inserting in key order appends to the postings B-tree instead of splitting pages at random
+            postings.sort(key=itemgetter(0)) # Stable, so chunk ids stay ascending within a term
+            conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+    finally:
+        conn.close()
+    return counts
+
+# --- SEARCH ---
+def search(query, top_k=3, db_path=RAG_INDEX_DB, rag_dir=None):
+    """
+    Returns the `top_k` chunks that best match `query` as dicts with path, heading,
+    text and score, best first. Only the postings of the query's terms are read. Given
+    `rag_dir`, only its documents are searched and paths are relative to it.
+    """
+    query_counts = Counter(bm25.tokenize(query))
+    if not query_counts or top_k <= 0 or not os.path.exists(db_path):
+        return []
+    conn = _connect(db_path)
+    try:
+        chunk_count, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+        if not chunk_count:
+            return []
+        average_length = total_length / chunk_count
+        prefix = os.path.join(os.path.abspath(rag_dir), "") if rag_dir else None
+        allowed = None
+        if prefix:
+            allowed = {row[0] for row in conn.execute(
+                "SELECT id FROM documents WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            )}
+
+        scores = {}
+        for term, repeats in query_counts.items():
+            document_frequency = conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+            weight = repeats * bm25.idf(document_frequency, chunk_count)
+            if not weight:
+                continue
+            for chunk_id, tf, length, document_id in conn.execute(
+                "SELECT p.chunk_id, p.tf, c.length, c.document_id FROM postings p JOIN chunks c ON c.id = p.chunk_id WHERE p.term = ?",
+                (term,),
+            ):
+                if allowed is not None and document_id not in allowed:
+                    continue
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + bm25.term_score(tf, length, average_length, weight)
+
+        results = []
+        for chunk_id, score in heapq.nlargest(top_k, scores.items(), key=lambda pair: pair[1]):
+            path, heading, text = conn.execute(
+                "SELECT d.path, c.heading, c.text FROM chunks c JOIN documents d ON d.id = c.document_id WHERE c.id = ?",
+                (chunk_id,),
+            ).fetchone()
+            if prefix:
+                path = os.path.relpath(path, rag_dir)
+            results.append({"path": path, "heading": heading, "text": text, "score": score})
+        return results
+    finally:
+        conn.close()
+
+def retrieve(query, top_k=3, rag_dir=RAG_DIR, db_path=RAG_INDEX_DB):
+    """Updates the index and searches it; index errors are reported and yield no chunks."""
+    try:
+        update_index(rag_dir, db_path)
+        return search(query, top_k, db_path, rag_dir)
+    except sqlite3.Error as e:
+        print(f"RAG index unavailable: {e}")
+        return []
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "update"
+    if command == "update":
+        print(update_index())
+    elif command == "search" and len(sys.argv) > 2:
+        update_index()
+        for result in search(" ".join(sys.argv[2:]), top_k=5, rag_dir=RAG_DIR):
+            print(f"[{result['score']:.2f}] {result['path']} > {result['heading'] or '(top)'}")
+            print(result["text"][:300])
+            print()
+    else:
+        print("Usage: python rag_index.py update | search <query>")
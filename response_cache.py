@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import json
+import sqlite3
+import hashlib
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_DB = os.environ.get("AI_CACHE_DB", os.path.join(ENGINE_ROOT, "persistency", "cache", "responses.db"))
+
+# "deterministic" caches only temperature-0 calls, "all" also caches sampled ones (a retry
+# with the same prompt then replays the same answer), "off" disables the cache
+CACHE_MODE = os.environ.get("AI_CACHE_MODE", "deterministic").lower()
+CACHE_TTL_SECONDS = float(os.environ.get("AI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.environ.get("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def is_cacheable(temperature):
+    """Checks whether a call with this temperature should go through the cache."""
+    if CACHE_MODE == "off":
+        return False
+    if CACHE_MODE == "deterministic":
+        return temperature == 0
+    return True
+
+def make_cache_key(provider, model, temperature, prompt):
+    """Hashes the inputs that determine a completion into a cache key."""
+    material = json.dumps([provider, model, float(temperature), prompt], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _connect():
+    """Opens the cache database, creating it on first use."""
+    os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+        "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+    conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    return conn
+
+def _bump(conn, counter):
+    conn.execute(
+        "INSERT INTO stats (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (counter,),
+    )
+
+def get_cached_response(key):
+    """Returns the cached response for `key`, or None on a miss or expired entry."""
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - CACHE_TTL_SECONDS),
+            ).fetchone()
+            if row is None:
+                _bump(conn, "misses")
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            _bump(conn, "hits")
+            return row[0]
+    finally:
+        conn.close()
+
+def store_response(key, response):
+    """Stores a response and evicts expired and least recently used entries."""
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            _evict(conn, now)
+    finally:
+        conn.close()
+
+def _evict(conn, now):
+    """Drops expired entries, then the least recently used ones until under CACHE_MAX_BYTES."""
+    conn.execute("DELETE FROM responses WHERE created_at < ?", (now - CACHE_TTL_SECONDS,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+
+    excess = total - CACHE_MAX_BYTES
+    doomed = []
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+        doomed.append((key,))
+        excess -= size
+        if excess <= 0:
+            break
+    conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+    conn.execute(
+        "INSERT INTO stats (name, value) VALUES ('evictions', ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        (len(doomed),),
+    )
+
+def get_cache_stats():
+    """Returns hit/miss/eviction counters plus the current entry count and size."""
+    conn = _connect()
+    try:
+        stats = {"hits": 0, "misses": 0, "evictions": 0}
+        stats.update(dict(conn.execute("SELECT name, value FROM stats")))
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        stats["entries"] = entries
+        stats["bytes"] = size
+        return stats
+    finally:
+        conn.close()
+
+def clear_cache():
+    """Deletes every cached response and resets the counters."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM stats")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("stats", "clear"):
+        print("Usage: python response_cache.py <stats|clear>")
+        sys.exit(1)
+
+    if sys.argv[1] == "stats":
+        for name, value in get_cache_stats().items():
+            print(f"{name}: {value}")
+    else:
+        clear_cache()
+        print(f"Response cache at {CACHE_DB} cleared.")
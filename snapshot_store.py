@@ -0,0 +1,283 @@
+"""
+Content-addressed snapshots of the project under repair.
+
+A snapshot records the content hash of every project file; the contents themselves are
+stored once per hash in an object directory, so a snapshot costs only the files that
+changed since the last one. mcp.py takes a snapshot of every state it verifies, scores
+it by its test results, and rolls back to the best one when a fix makes things worse.
+Restoring rewrites only the files that differ from the snapshot and deletes the files
+it does not have.
+
+Files are hashed only when their size, mtime or inode changed since they were last
+seen, so checkpoints and rollbacks cost a stat per file plus the changed files.
+
+    python snapshot_store.py list                  snapshots of project/, newest first
+    python snapshot_store.py restore <snapshot id> roll project/ back to a snapshot
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.environ.get("RDE_SNAPSHOT_DIR", os.path.join(ENGINE_ROOT, "persistency", "cache", "snapshots"))
+SNAPSHOTS_ENABLED = os.environ.get("RDE_SNAPSHOTS", "1").lower() not in ("0", "false", "no")
+# Snapshots kept per project by prune(); objects no snapshot refers to are deleted with them
+MAX_SNAPSHOTS = int(os.environ.get("RDE_SNAPSHOT_KEEP", "30"))
+# Never snapshotted, restored or deleted: VCS metadata, caches and environments
+SKIPPED_DIRS = (".git", ".hg", ".svn", "__pycache__", ".pytest_cache", ".mypy_cache", ".ruff_cache", "node_modules", ".venv", "venv")
+SKIPPED_SUFFIXES = (".pyc", ".pyo")
+
+def store_path_for(project_dir):
+    """Returns the snapshot store directory for a project directory."""
+    project_dir = os.path.abspath(project_dir)
+    digest = hashlib.sha256(project_dir.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, digest)
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _stat_key(st):
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def _write_atomically(path, data):
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+class SnapshotStore:
+    """Snapshots of one project directory. Not safe for concurrent use on the same project."""
+
+    def __init__(self, project_dir, store_dir=None):
+        self.project_dir = project_dir
+        self.store_dir = store_dir or store_path_for(project_dir)
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        self.snapshots_dir = os.path.join(self.store_dir, "snapshots")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        # relative path -> (stat key, hash) of files as last seen on disk
+        self._seen = {}
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _snapshot_path(self, snapshot_id):
+        return os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+
+    def scan(self):
+        """Returns {relative path: hash} for the project as it is on disk."""
+        files = {}
+        for root, dir_names, file_names in os.walk(self.project_dir):
+            dir_names[:] = [
+                name for name in dir_names
+                if name not in SKIPPED_DIRS and not os.path.exists(os.path.join(root, name, "pyvenv.cfg"))
+            ]
+            for name in file_names:
+                if name.endswith(SKIPPED_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.project_dir).replace(os.sep, "/")
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue # Deleted while walking
+                key = _stat_key(st)
+                seen = self._seen.get(relative)
+                if seen and seen[0] == key:
+                    files[relative] = seen[1]
+                    continue
+                digest = _hash_file(path)
+                self._seen[relative] = (key, digest)
+                files[relative] = digest
+        return files
+
+    def checkpoint(self, label=""):
+        """
+        Snapshots the project and returns the snapshot id, which is derived from the
+        content, so an unchanged project gets the same id again.
+        """
+        files = self.scan()
+        for relative, digest in files.items():
+            object_path = self._object_path(digest)
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                with open(os.path.join(self.project_dir, relative), 'rb') as f:
+                    _write_atomically(object_path, f.read())
+        snapshot_id = hashlib.sha256(json.dumps(sorted(files.items())).encode("utf-8")).hexdigest()[:16]
+        previous = self.load(snapshot_id) or {}
+        snapshot = {
+            "id": snapshot_id,
+            "created": previous.get("created", time.time()),
+            "updated": time.time(),
+            "label": label or previous.get("label", ""),
+            "score": previous.get("score"),
+            "files": files,
+        }
+        _write_atomically(self._snapshot_path(snapshot_id), json.dumps(snapshot).encode("utf-8"))
+        return snapshot_id
+
+    def load(self, snapshot_id):
+        try:
+            with open(self._snapshot_path(snapshot_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set_score(self, snapshot_id, score):
+        """Records a snapshot's verification score (a dict with at least "passed" and "failed")."""
+        snapshot = self.load(snapshot_id)
+        if snapshot is not None:
+            snapshot["score"] = score
+            _write_atomically(self._snapshot_path(snapshot_id), json.dumps(snapshot).encode("utf-8"))
+
+    def restore(self, snapshot_id):
+        """
+        Makes the project match a snapshot: rewrites the files whose content differs and
+        deletes the files the snapshot does not have. Returns the changed relative paths.
+        """
+        snapshot = self.load(snapshot_id)
+        if snapshot is None:
+            raise KeyError(f"Unknown snapshot {snapshot_id}")
+        current = self.scan()
+        changed = []
+        for relative, digest in snapshot["files"].items():
+            if current.get(relative) == digest:
+                continue
+            path = os.path.join(self.project_dir, *relative.split("/"))
+            os.makedirs(os.path.dirname(path) or self.project_dir, exist_ok=True)
+            with open(self._object_path(digest), 'rb') as f:
+                _write_atomically(path, f.read())
+            self._seen[relative] = (_stat_key(os.stat(path)), digest)
+            changed.append(relative)
+        for relative in current:
+            if relative not in snapshot["files"]:
+                os.remove(os.path.join(self.project_dir, *relative.split("/")))
+                self._seen.pop(relative, None)
+                changed.append(relative)
+        return changed
+
+    def materialize(self, snapshot_id, destination):
+        """Writes a snapshot's files into `destination`, e.g. a scratch copy of the project."""
+        snapshot = self.load(snapshot_id)
+        if snapshot is None:
+            raise KeyError(f"Unknown snapshot {snapshot_id}")
+        for relative, digest in snapshot["files"].items():
+            path = os.path.join(destination, *relative.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(self._object_path(digest), path)
+        return len(snapshot["files"])
+
+    def list(self):
+        """Returns all snapshots of the project (without their file lists), newest first."""
+        snapshots = []
+        for name in os.listdir(self.snapshots_dir):
+            if name.endswith(".json"):
+                snapshot = self.load(name[:-5])
+                if snapshot:
+                    snapshot["files"] = len(snapshot["files"])
+                    snapshots.append(snapshot)
+        return sorted(snapshots, key=lambda s: s["updated"], reverse=True)
+
+    def prune(self, keep=MAX_SNAPSHOTS):
+        """Deletes all but the `keep` most recent snapshots, and the objects only they referenced."""
+        snapshots = sorted(
+            (s for s in (self.load(name[:-5]) for name in os.listdir(self.snapshots_dir) if name.endswith(".json")) if s),
+            key=lambda s: s["updated"], reverse=True,
+        )
+        if len(snapshots) <= keep:
+            return 0
+        for snapshot in snapshots[keep:]:
+            os.remove(self._snapshot_path(snapshot["id"]))
+        referenced = {digest for snapshot in snapshots[:keep] for digest in snapshot["files"].values()}
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if digest not in referenced:
+                    os.remove(os.path.join(prefix_dir, digest))
+        return len(snapshots) - keep
+
+# pytest's final summary, e.g. "==== 1 failed, 6 passed, 2 warnings in 0.12s ====" (or without the rules under -q)
+SUMMARY_LINE = re.compile(r"^=*\s*(\d+ \w+(?:, \d+ \w+)*) in [\d.]+s\b")
+
+def summary_counts(output):
+    """Returns {outcome: count} from the last pytest summary line in `output`, e.g. {"passed": 6, "failed": 1}."""
+    for line in reversed(output.splitlines()):
+        match = SUMMARY_LINE.match(line.strip())
+        if match:
+            counts = {}
+            for count, outcome in re.findall(r"(\d+) (\w+)", match.group(1)):
+                outcome = {"errors": "error", "warnings": "warning"}.get(outcome, outcome)
+                counts[outcome] = int(count)
+            return counts
+    return {}
+
+def score_result(result):
+    """
+    Scores a full pytest run: (passes, tests passed, -tests failed or errored). Higher is
+    better. Returns None for a verification an earlier stage decided (see
+    verification_gate.py): it ran a subset of the tests at most, so it cannot be ranked.
+    """
+    stages = getattr(result, "stages", None)
+    if stages and stages[-1]["stage"] != "full":
+        return None
+    counts = summary_counts(result.stdout or "")
+    return {
+        "passes": result.returncode == 0,
+        "passed": counts.get("passed", 0),
+        "failed": counts.get("failed", 0) + counts.get("error", 0),
+        "returncode": result.returncode,
+    }
+
+def is_better(score, other):
+    """True if `score` ranks above `other`: a passing run first, then more passed, then fewer failed."""
+    if other is None:
+        return True
+    key = lambda s: (s["passes"], s["passed"], -s["failed"])
+    return key(score) > key(other)
+
+def clear_directory(path, keep_files=(".gitkeep",)):
+    """
+    Empties `path` at once: the directory is renamed aside and recreated (with
+    `keep_files` carried over), and the old contents are deleted in a background thread.
+    The interpreter waits for that thread before exiting.
+    """
+    path = os.path.abspath(path)
+    trash = f"{path}.deleting-{os.getpid()}-{time.time_ns()}"
+    os.replace(path, trash)
+    os.makedirs(path)
+    for name in keep_files:
+        if os.path.exists(os.path.join(trash, name)):
+            shutil.copy2(os.path.join(trash, name), os.path.join(path, name))
+    thread = threading.Thread(target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True}, name="clear-directory")
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    store = SnapshotStore("project")
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "list":
+        for snapshot in store.list():
+            score = snapshot.get("score") or {}
+            result = f"{score.get('passed', '?')} passed, {score.get('failed', '?')} failed" if score else "not verified"
+            print(f"{snapshot['id']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['updated']))}  "
+                  f"{snapshot['files']:>4} files  {result:<24} {snapshot['label']}")
+    elif command == "restore" and len(sys.argv) == 3:
+        try:
+            changed = store.restore(sys.argv[2])
+        except KeyError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Restored snapshot {sys.argv[2]}: {len(changed)} file(s) changed.")
+    else:
+        print("Usage: python snapshot_store.py list | restore <snapshot id>")
+        sys.exit(1)
@@ -0,0 +1,221 @@
+"""
+Symbol index for the project under repair.
+
+Every Python file in the project is parsed with `ast` into its top-level and nested
+functions and classes, the names each of them references, and the modules the file
+imports. Entries are cached per file content hash in persistency/cache/symbols/, so a
+run only re-parses the files that changed. `relevant_files` combines the index with the
+frames of a failing traceback to pick the files a fix prompt should show.
+"""
+import os
+import re
+import ast
+import json
+import hashlib
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+SYMBOL_INDEX_DIR = os.environ.get("RDE_SYMBOL_INDEX_DIR", os.path.join(ENGINE_ROOT, "persistency", "cache", "symbols"))
+SKIPPED_DIRS = ("__pycache__", "node_modules", "venv", "env", "build", "dist")
+
+PYTHON_FRAME = re.compile(r'^\s*File "([^"]+)", line (\d+), in (\S+)')
+PYTEST_LOCATION = re.compile(r"^(\S+?\.py):(\d+):(?: in (\S+))?")
+SOURCE_DEF = re.compile(r"^\s*>?\s*(?:async\s+)?def (\w+)\(")
+
+def index_path_for(project_dir):
+    """Returns the index file for a project directory."""
+    project_dir = os.path.abspath(project_dir)
+    digest = hashlib.sha256(project_dir.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SYMBOL_INDEX_DIR, f"{digest}.json")
+
+def is_test_file(path):
+    name = os.path.basename(path)
+    return name.startswith("test_") or name.endswith("_test.py") or name == "conftest.py"
+
+def parse_source(source):
+    """
+    Returns {"symbols": [...], "imports": [...]} for one module. Each symbol records its
+    qualified name, kind, line range and the bare names it references.
+    """
+    tree = ast.parse(source)
+    symbols = []
+    imports = set()
+
+    def referenced_names(node):
+        names = set()
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                names.add(child.id)
+            elif isinstance(child, ast.Attribute):
+                names.add(child.attr)
+        return sorted(names)
+
+    def visit(body, prefix):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                symbols.append({
+                    "name": prefix + node.name,
+                    "kind": "class" if isinstance(node, ast.ClassDef) else "function",
+                    "line": node.lineno,
+                    "end_line": getattr(node, "end_lineno", node.lineno),
+                    "references": referenced_names(node),
+                })
+                visit(node.body, f"{prefix}{node.name}.")
+
+    visit(tree.body, "")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            imports.add("." * node.level + node.module)
+    return {"symbols": symbols, "imports": sorted(imports)}
+
+def _iter_python_files(project_dir):
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d not in SKIPPED_DIRS)
+        for name in sorted(files):
+            if name.endswith(".py"):
+                yield os.path.join(root, name)
+
+def build_index(project_dir):
+    """
+    Returns the symbol index for `project_dir`: {"files": {relative path: entry}}, where
+    each entry holds the file's content hash, symbols and imports. Files whose hash is
+    unchanged since the last run are not parsed again.
+    """
+    path = index_path_for(project_dir)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f).get("files", {})
+    except (OSError, ValueError):
+        cached = {}
+
+    files = {}
+    changed = False
+    for file_path in _iter_python_files(project_dir):
+        relative = os.path.relpath(file_path, project_dir)
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        digest = hashlib.sha1(data).hexdigest()
+        entry = cached.get(relative)
+        if entry is None or entry["hash"] != digest:
+            changed = True
+            try:
+                entry = dict(parse_source(data.decode("utf-8")), hash=digest)
+            except (SyntaxError, ValueError, UnicodeDecodeError):
+                # Still listed, so a broken file can be shown to the AI and repaired
+                entry = {"hash": digest, "symbols": [], "imports": [], "unparsable": True}
+        files[relative] = entry
+
+    index = {"project_dir": os.path.abspath(project_dir), "files": files}
+    if changed or set(files) != set(cached):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not save symbol index: {e}")
+    return index
+
+def find_definitions(index, name):
+    """Returns the files that define a function or class called `name` (bare or qualified)."""
+    found = []
+    for relative, entry in index["files"].items():
+        for symbol in entry["symbols"]:
+            if symbol["name"] == name or symbol["name"].endswith("." + name):
+                found.append(relative)
+                break
+    return found
+
+def _resolve(index, project_dir, path):
+    """Maps a path from a traceback to a file in the index, or None if it is not in the project."""
+    project_dir = os.path.abspath(project_dir)
+    candidates = [os.path.abspath(path), os.path.abspath(os.path.join(project_dir, path))]
+    for candidate in candidates:
+        if candidate.startswith(project_dir + os.sep):
+            relative = os.path.relpath(candidate, project_dir)
+            if relative in index["files"]:
+                return relative
+    # pytest prints paths relative to its rootdir, which may sit above the project
+    path = path.replace("\\", "/")
+    matches = [
+        relative for relative in index["files"]
+        if path == relative or path.endswith("/" + relative) or relative.endswith("/" + path)
+    ]
+    return matches[0] if len(matches) == 1 else None
+
+def traceback_frames(error_output, index, project_dir):
+    """
+    Returns the (file, function) frames of a traceback that fall inside the project, in
+    the order they appear (outermost first). Handles Python tracebacks and pytest's long
+    and short formats.
+    """
+    frames = []
+    block_function = None
+    for line in error_output.splitlines():
+        match = SOURCE_DEF.match(line)
+        if match and block_function is None:
+            block_function = match.group(1)
+            continue
+        match = PYTHON_FRAME.match(line) or PYTEST_LOCATION.match(line.strip())
+        if not match:
+            if line.startswith("_") and line.strip("_ ") == "":
+                block_function = None
+            continue
+        relative = _resolve(index, project_dir, match.group(1))
+        function = match.group(3) or block_function
+        block_function = None
+        if relative and (relative, function) not in frames:
+            frames.append((relative, function))
+    return frames
+
+def relevant_files(project_dir, error_output, task_description="", index=None, max_files=3):
+    """
+    Picks the project files a fix most likely needs, best first: files the task names,
+    non-test files in the traceback (innermost frame first), files defining the names the
+    failing tests reference, then the test files themselves. Returns relative paths.
+    """
+    index = index or build_index(project_dir)
+    files = index["files"]
+    ranked = []
+
+    def add(relative):
+        if relative and relative in files and relative not in ranked:
+            ranked.append(relative)
+
+    project_name = re.escape(os.path.basename(os.path.abspath(project_dir)))
+    for relative in files:
+        if re.search(rf"(?<![\w./])(?:{project_name}/)?{re.escape(relative)}(?!\w)", task_description):
+            add(relative)
+
+    frames = traceback_frames(error_output, index, project_dir)
+    for relative, _ in reversed(frames):
+        if not is_test_file(relative):
+            add(relative)
+
+    for relative, function in frames:
+        if not is_test_file(relative):
+            continue
+        symbols = {symbol["name"]: symbol for symbol in files[relative]["symbols"]}
+        symbol = symbols.get(function) or next(
+            (s for name, s in symbols.items() if name.endswith("." + (function or ""))), None
+        )
+        for name in (symbol["references"] if symbol else []):
+            for definition in find_definitions(index, name):
+                if not is_test_file(definition):
+                    add(definition)
+
+    for relative, _ in frames:
+        add(relative)
+
+    if not ranked:
+        # No usable traceback: fall back to the project's non-test modules
+        for relative in files:
+            if not is_test_file(relative):
+                add(relative)
+    return ranked[:max_files]
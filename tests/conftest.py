@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The engine's modules live at the repository root
+ENGINE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ENGINE_ROOT not in sys.path:
+    sys.path.insert(0, ENGINE_ROOT)
@@ -0,0 +1,86 @@
+import error_clusters
+from error_clusters import extract_signature, normalize_output, signature_of
+
+PYTEST_FAILURE = """\
+============================= test session starts ==============================
+platform linux -- Python 3.11.4, pytest-8.0.0, pluggy-1.4.0
+rootdir: /tmp/rde-work-1a2b/project
+collected 2 items
+
+test_main.py F.                                                          [100%]
+
+=================================== FAILURES ===================================
+__________________________________ test_total __________________________________
+
+    def test_total():
+>       assert total([1, 2]) == 3
+
+test_main.py:5: 
+_ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ 
+
+    def total(values):
+>       return sum(values) + offset
+E       NameError: name 'offset' is not defined
+
+main.py:{line}: NameError
+=========================== short test summary info ============================
+FAILED test_main.py::test_total - NameError: name 'offset' is not defined
+========================= 1 failed, 1 passed in {seconds}s =========================
+"""
+
+PYTHON_TRACEBACK = """\
+Traceback (most recent call last):
+  File "/home/user/project/main.py", line 12, in <module>
+    main()
+  File "/home/user/project/main.py", line 8, in main
+    load(path)
+  File "/home/user/project/loader.py", line 3, in load
+    return open(path).read()
+FileNotFoundError: [Errno 2] No such file or directory: 'data.csv'
+"""
+
+def test_pytest_signature_names_exception_and_frames():
+    exception, frames = extract_signature(PYTEST_FAILURE.format(line=2, seconds="0.03"))
+    assert exception == "NameError"
+    assert frames == ["test_main.py:test_total", "main.py:total"]
+
+def test_python_traceback_signature_keeps_innermost_frames():
+    exception, frames = extract_signature(PYTHON_TRACEBACK)
+    assert exception == "FileNotFoundError"
+    assert frames == ["main.py:<module>", "main.py:main", "loader.py:load"]
+
+def test_signature_keeps_at_most_the_configured_frames():
+    deep = "Traceback (most recent call last):\n" + "".join(
+        f'  File "/p/m{i}.py", line {i}, in f{i}\n    f{i + 1}()\n' for i in range(6)
+    ) + "RecursionError: too deep\n"
+    _, frames = extract_signature(deep)
+    assert frames == [f"m{i}.py:f{i}" for i in range(6)][-error_clusters.SIGNATURE_FRAMES:]
+
+def test_only_the_first_failure_shapes_the_signature():
+    second = "\n___ test_other ___\n\n>       assert False\nE       AssertionError\n\ntest_main.py:9: AssertionError\n"
+    output = PYTEST_FAILURE.format(line=2, seconds="0.03").replace("=========================== short", second + "=========================== short")
+    assert extract_signature(output)[0] == "NameError"
+
+def test_signature_is_stable_across_line_numbers_and_timings():
+    first = signature_of(PYTEST_FAILURE.format(line=2, seconds="0.03"))
+    moved = signature_of(PYTEST_FAILURE.format(line=40, seconds="1.27"))
+    assert first == moved
+
+def test_output_without_traceback_falls_back_to_normalized_text():
+    first, exception, frames = signature_of("Build took 3.2s at 2024-01-02 10:11:12 in /tmp/a/b/out.log")
+    again, _, _ = signature_of("Build took 3.2s at 2025-06-07 08:09:10 in /var/x/out.log")
+    assert exception is None and frames == []
+    assert first == again
+
+def test_normalize_output_strips_volatile_tokens():
+    text = normalize_output(
+        "platform linux -- Python 3.11.4\n"
+        "2024-05-01 12:00:00.123 object at 0x7f3a2b1c in /tmp/rde-9f/project/main.py\n"
+        "1 failed in 0.52s"
+    )
+    assert text == "<TIME> object at 0x<ADDR> in main.py\n1 failed in <DURATION>"
+
+def test_error_query_lists_exception_frames_and_error_lines():
+    query = error_clusters.error_query(PYTEST_FAILURE.format(line=2, seconds="0.03"))
+    assert query.startswith("NameError test_main.py:test_total main.py:total")
+    assert "name 'offset' is not defined" in query
@@ -0,0 +1,76 @@
+import os
+import pytest
+import export_project
+from export_project import sync_files
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    """A project with an exportable package and the engine's sample files, and an empty repository to export into."""
+    source = tmp_path / "project"
+    (source / "app").mkdir(parents=True)
+    (source / "app" / "core.py").write_text("VALUE = 1\n")
+    (source / "README.md").write_text("# App\n")
+    for name in ("main.py", "test_main.py", "requirements.txt", ".gitkeep"):
+        (source / name).write_text("sample\n")
+    (source / "__pycache__").mkdir()
+    (source / "__pycache__" / "core.cpython-311.pyc").write_text("junk")
+    destination = tmp_path / "export"
+    (destination / ".git").mkdir(parents=True)
+    (destination / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+    monkeypatch.setattr(export_project, "PROJECT_SOURCE_DIR", str(source))
+    monkeypatch.setattr(export_project, "EXPORT_LINK_MODE", "copy")
+    return source, destination
+
+def test_first_export_copies_only_exportable_files(export):
+    source, destination = export
+    entries, copied, removed, copied_bytes = sync_files(str(destination), {})
+    expected = sorted([os.path.join("app", "core.py"), "README.md"])
+    assert sorted(copied) == sorted(entries) == expected
+    assert removed == []
+    assert copied_bytes == len("VALUE = 1\n") + len("# App\n")
+    assert (destination / "app" / "core.py").read_text() == "VALUE = 1\n"
+    assert not (destination / "main.py").exists()
+
+def test_unchanged_project_copies_nothing(export):
+    _, destination = export
+    entries, _, _, _ = sync_files(str(destination), {})
+    entries, copied, removed, copied_bytes = sync_files(str(destination), entries)
+    assert (copied, removed, copied_bytes) == ([], [], 0)
+
+def test_changed_file_is_copied_again(export):
+    source, destination = export
+    entries, _, _, _ = sync_files(str(destination), {})
+    (source / "app" / "core.py").write_text("VALUE = 22\n")
+    _, copied, _, _ = sync_files(str(destination), entries)
+    assert copied == [os.path.join("app", "core.py")]
+    assert (destination / "app" / "core.py").read_text() == "VALUE = 22\n"
+
+def test_touched_export_copy_is_restored(export):
+    _, destination = export
+    entries, _, _, _ = sync_files(str(destination), {})
+    (destination / "README.md").write_text("edited by hand\n")
+    _, copied, _, _ = sync_files(str(destination), entries)
+    assert copied == ["README.md"]
+    assert (destination / "README.md").read_text() == "# App\n"
+
+def test_removed_file_is_deleted_with_its_empty_directory(export):
+    source, destination = export
+    entries, _, _, _ = sync_files(str(destination), {})
+    os.remove(source / "app" / "core.py")
+    entries, copied, removed, _ = sync_files(str(destination), entries)
+    assert removed == [os.path.join("app", "core.py")]
+    assert copied == []
+    assert not (destination / "app").exists()
+    assert list(entries) == ["README.md"]
+
+def test_version_control_directories_are_never_synced(export):
+    source, destination = export
+    (source / ".git").mkdir()
+    (source / ".git" / "HEAD").write_text("ref: refs/heads/imported\n")
+    # A manifest from before .git was ignored may still list it
+    previous = {os.path.join(".git", "config"): {"hash": "0", "size": 1, "mtime_ns": 1, "dest": None}}
+    (destination / ".git" / "config").write_text("[core]\n")
+    entries, copied, removed, _ = sync_files(str(destination), previous)
+    assert not any(path.startswith(".git") for path in list(entries) + copied + removed)
+    assert (destination / ".git" / "HEAD").read_text() == "ref: refs/heads/main\n"
+    assert (destination / ".git" / "config").exists()
@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import pytest
+import failure_log
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = str(tmp_path / "engine_log.db")
+    yield path
+    failure_log.clear_log(path)
+
+def tasks(log_file):
+    return [row["task"] for row in failure_log.iter_failures(log_file)]
+
+def test_rows_are_buffered_until_flushed(log_file):
+    failure_log.log_failure("t", 1, "boom", log_file=log_file)
+    assert not failure_log.has_failures(log_file)
+    failure_log.flush(log_file)
+    rows = list(failure_log.iter_failures(log_file))
+    assert [(row["task"], row["attempt"], row["error_output"]) for row in rows] == [("t", 1, "boom")]
+
+def test_full_batch_is_written_at_once(log_file):
+    for attempt in range(failure_log.BATCH_SIZE):
+        failure_log.log_failure("t", attempt, f"error {attempt}", log_file=log_file)
+    assert len(tasks(log_file)) == failure_log.BATCH_SIZE
+
+def test_identical_outputs_are_stored_once(log_file):
+    for attempt in range(3):
+        failure_log.log_failure("t", attempt, "same error", log_file=log_file)
+    failure_log.flush(log_file)
+    conn = sqlite3.connect(log_file)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+def test_failed_flush_keeps_rows_for_the_next_one(tmp_path):
+    # The log's directory does not exist yet, so the first flush cannot open the database
+    log_file = str(tmp_path / "later" / "engine_log.db")
+    failure_log.log_failure("first", 1, "error one", log_file=log_file)
+    failure_log.flush(log_file)
+    assert not os.path.exists(log_file)
+
+    failure_log.log_failure("second", 1, "error two", log_file=log_file)
+    os.makedirs(os.path.dirname(log_file))
+    failure_log.flush(log_file)
+    rows = list(failure_log.iter_failures(log_file))
+    assert [(row["task"], row["error_output"]) for row in rows] == [("first", "error one"), ("second", "error two")]
+
+    failure_log.flush(log_file)
+    assert tasks(log_file) == ["first", "second"]
+    failure_log.clear_log(log_file)
+
+def test_flush_without_a_file_writes_every_log(tmp_path):
+    logs = [str(tmp_path / f"log{i}.db") for i in range(2)]
+    for log_file in logs:
+        failure_log.log_failure(os.path.basename(log_file), 1, "boom", log_file=log_file)
+    failure_log.flush()
+    assert [tasks(log_file) for log_file in logs] == [["log0.db"], ["log1.db"]]
+    for log_file in logs:
+        failure_log.clear_log(log_file)
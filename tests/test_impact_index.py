@@ -0,0 +1,108 @@
+import os
+import pytest
+import impact_index
+from impact_index import changed_functions, select_tests
+
+BASE = '''\
+import os
+
+LIMIT = 10
+
+def helper(x):
+    return x + 1
+
+class Parser:
+    def parse(self, text):
+        return text.split()
+
+    def render(self, items):
+        return " ".join(items)
+'''
+
+def test_changed_function_body_is_reported_alone():
+    new = BASE.replace("return x + 1", "return x + 2")
+    assert changed_functions(BASE, new) == {"helper"}
+
+def test_methods_are_qualified_by_class():
+    new = BASE.replace("text.split()", "text.split(',')")
+    assert changed_functions(BASE, new) == {"Parser.parse"}
+
+def test_added_and_removed_functions_are_reported():
+    new = BASE.replace("def helper(x):\n    return x + 1\n", "def helper2(x):\n    return x + 1\n")
+    assert changed_functions(BASE, new) == {"helper", "helper2"}
+
+def test_formatting_and_comments_change_nothing():
+    new = BASE.replace("def helper(x):\n", "# adds one\ndef helper(x):\n\n")
+    assert changed_functions(BASE, new) == set()
+
+def test_module_level_change_affects_everything():
+    assert changed_functions(BASE, BASE.replace("LIMIT = 10", "LIMIT = 20")) is None
+    assert changed_functions(BASE, BASE.replace("import os", "import sys")) is None
+
+def test_class_attribute_or_base_change_affects_everything():
+    assert changed_functions(BASE, BASE.replace("class Parser:", "class Parser:\n    strict = True\n")) is None
+    assert changed_functions(BASE, BASE.replace("class Parser:", "class Parser(object):")) is None
+
+def test_unparsable_source_affects_everything():
+    assert changed_functions(BASE, "def broken(:\n") is None
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A project with two modules and two test files, plus an index recording who calls what."""
+    monkeypatch.setattr(impact_index, "IMPACT_INDEX_DIR", str(tmp_path / "index"))
+    root = tmp_path / "project"
+    root.mkdir()
+    for name in ("main.py", "util.py", "test_main.py", "test_util.py"):
+        (root / name).write_text("")
+    monkeypatch.chdir(root)
+    main, util = str(root / "main.py"), str(root / "util.py")
+    index = {
+        "project_dir": str(root),
+        "tests": {
+            f"{root / 'test_main.py'}::test_run": [main, f"{main}::run", util, f"{util}::clean"],
+            f"{root / 'test_util.py'}::test_clean": [util, f"{util}::clean"],
+            f"{root / 'test_util.py'}::test_fmt": [util, f"{util}::fmt"],
+        },
+        "failing": [],
+        "files": {},
+    }
+    impact_index._save_index(impact_index.index_path_for(str(root)), index)
+    return root, index
+
+def test_select_by_changed_file(project):
+    root, _ = project
+    assert select_tests(str(root), [str(root / "main.py")]) == ["test_main.py::test_run"]
+    assert select_tests(str(root), [str(root / "util.py")]) == [
+        "test_main.py::test_run", "test_util.py::test_clean", "test_util.py::test_fmt",
+    ]
+
+def test_select_by_changed_function(project):
+    root, _ = project
+    util = str(root / "util.py")
+    assert select_tests(str(root), [util], {util: {"fmt"}}) == ["test_util.py::test_fmt"]
+    assert select_tests(str(root), [util], {util: set()}) == []
+
+def test_previously_failing_tests_always_run(project):
+    root, index = project
+    index["failing"] = [f"{root / 'test_util.py'}::test_fmt"]
+    impact_index._save_index(impact_index.index_path_for(str(root)), index)
+    assert select_tests(str(root), [str(root / "main.py")]) == ["test_main.py::test_run", "test_util.py::test_fmt"]
+
+def test_changed_test_file_selects_its_tests(project):
+    root, _ = project
+    assert select_tests(str(root), [str(root / "test_util.py")]) == ["test_util.py::test_clean", "test_util.py::test_fmt"]
+
+def test_new_test_file_runs_whole(project):
+    root, _ = project
+    (root / "test_new.py").write_text("")
+    assert select_tests(str(root), [str(root / "test_new.py")]) == ["test_new.py"]
+
+def test_conftest_change_or_missing_index_runs_everything(project, tmp_path):
+    root, _ = project
+    assert select_tests(str(root), [str(root / "conftest.py")]) is None
+    assert select_tests(str(tmp_path / "elsewhere"), [str(root / "main.py")]) is None
+
+def test_tests_whose_file_is_gone_are_not_selected(project):
+    root, _ = project
+    os.remove(root / "test_util.py")
+    assert select_tests(str(root), [str(root / "util.py")]) == ["test_main.py::test_run"]
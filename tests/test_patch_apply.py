@@ -0,0 +1,119 @@
+import pytest
+import patch_apply
+from patch_apply import PatchError
+
+SOURCE = "def add(a, b):\n    return a + b\n\ndef sub(a, b):\n    return a - b\n"
+
+def edit(path, search, replace):
+    return f"{path}\n<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE\n"
+
+def reader(files):
+    return lambda path: files.get(path)
+
+def test_search_replace_exact_match():
+    text = edit("main.py", "    return a + b\n", "    return b + a\n")
+    contents = patch_apply.apply_edits(text, reader({"main.py": SOURCE}))
+    assert contents == {"main.py": SOURCE.replace("a + b", "b + a")}
+
+def test_search_replace_ignores_trailing_whitespace():
+    text = edit("main.py", "def add(a, b):   \n    return a + b\n", "def add(a, b):\n    return a + b + 0\n")
+    contents = patch_apply.apply_edits(text, reader({"main.py": SOURCE}))
+    assert "return a + b + 0\n" in contents["main.py"]
+    assert contents["main.py"].endswith("return a - b\n")
+
+def test_search_replace_reindents_when_indentation_differs():
+    source = "class Calc:\n    def add(self, a, b):\n        return a + b\n"
+    text = edit("calc.py", "def add(self, a, b):\n    return a + b\n", "def add(self, a, b):\n    return b + a\n")
+    contents = patch_apply.apply_edits(text, reader({"calc.py": source}))
+    assert contents["calc.py"] == "class Calc:\n    def add(self, a, b):\n        return b + a\n"
+
+def test_search_replace_ambiguous_match_is_rejected():
+    source = "x = 1\ny = 2\nx = 1\n"
+    with pytest.raises(PatchError, match="matches 2 places"):
+        patch_apply.apply_edits(edit("a.py", "x = 1\n", "x = 3\n"), reader({"a.py": source}))
+
+def test_search_replace_ambiguous_fuzzy_match_is_rejected():
+    source = "if a:\n    x = 1\nif b:\n        x = 1\n"
+    with pytest.raises(PatchError, match="matches 2 places"):
+        patch_apply.apply_edits(edit("a.py", "x = 1\n", "x = 3\n"), reader({"a.py": source}))
+
+def test_search_replace_missing_text_is_rejected():
+    with pytest.raises(PatchError, match="not found"):
+        patch_apply.apply_edits(edit("main.py", "return a * b\n", "return 0\n"), reader({"main.py": SOURCE}))
+
+def test_search_replace_creates_new_file():
+    contents = patch_apply.apply_edits(edit("new.py", "", "VALUE = 1\n"), reader({}))
+    assert contents == {"new.py": "VALUE = 1\n"}
+
+def test_search_replace_in_missing_file_is_rejected():
+    with pytest.raises(PatchError, match="does not exist"):
+        patch_apply.apply_edits(edit("gone.py", "x = 1\n", "x = 2\n"), reader({}))
+
+def test_blocks_for_several_files_apply_in_order():
+    text = edit("a.py", "x = 1\n", "x = 2\n") + edit("b.py", "y = 1\n", "y = 2\n") + edit("a.py", "x = 2\n", "x = 3\n")
+    contents = patch_apply.apply_edits(text, reader({"a.py": "x = 1\n", "b.py": "y = 1\n"}))
+    assert contents == {"a.py": "x = 3\n", "b.py": "y = 2\n"}
+
+def test_resolve_path_maps_reply_names():
+    text = edit("main.py", "    return a + b\n", "    return b + a\n")
+    contents = patch_apply.apply_edits(text, reader({"project/main.py": SOURCE}), lambda path: "project/" + path)
+    assert list(contents) == ["project/main.py"]
+
+def test_reply_without_edits_changes_nothing():
+    assert patch_apply.apply_edits("I could not find the bug.", reader({"main.py": SOURCE})) == {}
+
+def hunk(start, body):
+    return (start, [(line[0], line[1:]) for line in body])
+
+def test_hunk_applies_at_stated_line():
+    hunks = [hunk(4, [" def sub(a, b):", "-    return a - b", "+    return b - a"])]
+    assert patch_apply.apply_hunks(SOURCE, hunks, "main.py") == SOURCE.replace("a - b", "b - a")
+
+def test_hunk_is_found_when_the_file_has_shifted():
+    shifted = "import os\nimport sys\n\n" + SOURCE
+    hunks = [hunk(1, [" def add(a, b):", "-    return a + b", "+    return b + a"])]
+    result = patch_apply.apply_hunks(shifted, hunks, "main.py")
+    assert result == shifted.replace("a + b", "b + a")
+
+def test_hunk_prefers_the_match_nearest_its_stated_line():
+    source = "x = 1\n" + "pass\n" * 10 + "x = 1\n"
+    hunks = [hunk(12, ["-x = 1", "+x = 2"])]
+    assert patch_apply.apply_hunks(source, hunks, "a.py") == "x = 1\n" + "pass\n" * 10 + "x = 2\n"
+
+def test_hunk_ignores_trailing_whitespace():
+    hunks = [hunk(1, [" def add(a, b):  ", "-    return a + b", "+    return b + a"])]
+    assert "return b + a" in patch_apply.apply_hunks(SOURCE, hunks, "main.py")
+
+def test_hunk_ambiguous_match_is_rejected():
+    source = "x = 1\n" + "pass\n" * (patch_apply.HUNK_SEARCH_WINDOW + 10) + "x = 1\n"
+    hunks = [hunk(patch_apply.HUNK_SEARCH_WINDOW // 2, ["-x = 1", "+x = 2"])]
+    with pytest.raises(PatchError, match="matches 2 places"):
+        patch_apply.apply_hunks(source, hunks, "a.py")
+
+def test_hunk_that_does_not_match_is_rejected():
+    hunks = [hunk(1, ["-return a * b", "+return 0"])]
+    with pytest.raises(PatchError, match="does not match"):
+        patch_apply.apply_hunks(SOURCE, hunks, "main.py")
+
+def test_unified_diff_through_apply_edits():
+    diff = (
+        "--- a/main.py\n+++ b/main.py\n"
+        "@@ -1,2 +1,2 @@\n def add(a, b):\n-    return a + b\n+    return b + a\n"
+        "@@ -4,2 +4,2 @@\n def sub(a, b):\n-    return a - b\n+    return b - a\n"
+    )
+    contents = patch_apply.apply_edits(diff, reader({"main.py": SOURCE}))
+    assert contents["main.py"] == SOURCE.replace("a + b", "b + a").replace("a - b", "b - a")
+
+def test_unified_diff_from_dev_null_creates_file():
+    diff = "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1,1 @@\n+VALUE = 1\n"
+    assert patch_apply.apply_edits(diff, reader({})) == {"new.py": "VALUE = 1\n"}
+
+def test_validate_rejects_code_that_does_not_compile():
+    with pytest.raises(PatchError, match="would not parse"):
+        patch_apply.validate({"a.py": "def f(:\n"})
+    with pytest.raises(PatchError, match="would not parse"):
+        patch_apply.validate({"a.py": "return 1\n"})
+
+def test_validate_rejects_leftover_markers():
+    with pytest.raises(PatchError, match="edit marker"):
+        patch_apply.validate({"notes.txt": "<<<<<<< SEARCH\n"})
@@ -0,0 +1,74 @@
+import prompt_packer
+from prompt_packer import make_section, pack_prompt, estimate_tokens
+
+PROVIDER = "gemini"
+
+def tokens(count):
+    """Text that estimates to exactly `count` tokens for PROVIDER, one token per line."""
+    chars = int(prompt_packer.CHARS_PER_TOKEN[PROVIDER])
+    return "\n".join(["x" * (chars - 1)] * count) + "\n"
+
+def test_everything_fits_and_keeps_original_order():
+    sections = [
+        make_section("guidelines", "G\n", prompt_packer.PRIORITY_GUIDELINES),
+        make_section("task", "T\n", prompt_packer.PRIORITY_TASK, required=True),
+        make_section("code", "C\n", prompt_packer.PRIORITY_CODE),
+    ]
+    prompt, report = pack_prompt(PROVIDER, sections, budget=1000)
+    assert prompt == "G\nT\nC\n"
+    assert all(entry["packed_tokens"] == entry["tokens"] for entry in report)
+
+def test_lowest_priority_section_is_dropped_first():
+    sections = [
+        make_section("task", tokens(40), prompt_packer.PRIORITY_TASK, required=True),
+        make_section("code", tokens(40), prompt_packer.PRIORITY_CODE, trimmable=False),
+        make_section("guidelines", tokens(40), prompt_packer.PRIORITY_GUIDELINES, trimmable=False),
+    ]
+    prompt, report = pack_prompt(PROVIDER, sections, budget=100)
+    packed = {entry["name"]: entry["packed_tokens"] for entry in report}
+    assert packed["code"] == packed["task"] > 0
+    assert packed["guidelines"] == 0
+    assert estimate_tokens(prompt, PROVIDER) <= 100
+
+def test_required_section_is_kept_even_over_budget():
+    sections = [
+        make_section("task", tokens(200), prompt_packer.PRIORITY_TASK, required=True),
+        make_section("code", "C\n", prompt_packer.PRIORITY_CODE),
+    ]
+    prompt, report = pack_prompt(PROVIDER, sections, budget=100)
+    assert report[0]["packed_tokens"] == report[0]["tokens"]
+    assert report[1]["packed_tokens"] == 0
+    assert prompt == sections[0]["text"]
+
+def test_trimmable_section_is_cut_from_the_middle():
+    lines = [f"line {i:03d}" for i in range(400)]
+    sections = [make_section("output", "\n".join(lines), prompt_packer.PRIORITY_TEST_OUTPUT)]
+    prompt, report = pack_prompt(PROVIDER, sections, budget=200)
+    assert 0 < report[0]["packed_tokens"] <= 200
+    assert prompt.startswith("line 000\n")
+    assert prompt.endswith("line 399")
+    assert "lines trimmed ..." in prompt
+
+def test_max_share_caps_a_section():
+    sections = [make_section("reference", tokens(500), prompt_packer.PRIORITY_REFERENCE, max_share=0.25)]
+    _, report = pack_prompt(PROVIDER, sections, budget=1000)
+    assert 0 < report[0]["packed_tokens"] <= 250
+
+def test_budget_override_from_environment(monkeypatch):
+    monkeypatch.setenv("AI_PROMPT_TOKEN_BUDGET", "123")
+    assert prompt_packer.get_token_budget(PROVIDER) == 123
+    monkeypatch.delenv("AI_PROMPT_TOKEN_BUDGET")
+    assert prompt_packer.get_token_budget(PROVIDER) == prompt_packer.TOKEN_BUDGETS[PROVIDER]
+    assert prompt_packer.get_token_budget("unknown") == prompt_packer.DEFAULT_TOKEN_BUDGET
+
+def test_compact_test_output_drops_preamble_and_repeats():
+    output = "\n".join([
+        "============================= test session starts ==============================",
+        "platform linux -- Python 3.11.0, pytest-8.0.0",
+        "rootdir: /tmp/project",
+        "collected 3 items",
+        "E   AssertionError",
+        "E   AssertionError",
+        "1 failed in 0.01s",
+    ])
+    assert prompt_packer.compact_test_output(output) == "E   AssertionError\n1 failed in 0.01s"
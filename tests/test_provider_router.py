@@ -0,0 +1,91 @@
+import time
+import threading
+import pytest
+from provider_router import TokenBucket, SharedTokenBucket, CircuitBreaker, CallCancelled
+
+def test_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(60, capacity=2)
+    assert bucket._take() == 0
+    assert bucket._take() == 0
+    assert 0.9 < bucket._take() <= 1.0
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(6000, capacity=1)
+    assert bucket._take() == 0
+    assert bucket._take() > 0
+    time.sleep(0.02)
+    assert bucket._take() == 0
+
+def test_default_capacity_is_a_tenth_of_the_rate():
+    assert TokenBucket(600).capacity == 60
+    assert TokenBucket(5).capacity == 1
+
+def test_pause_holds_requests_back():
+    bucket = TokenBucket(6000, capacity=10)
+    bucket.pause(5)
+    assert 4.9 < bucket._take() <= 5
+
+def test_acquire_stops_once_cancelled():
+    bucket = TokenBucket(60, capacity=1)
+    bucket.acquire()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CallCancelled):
+        bucket.acquire(cancel)
+
+def test_shared_bucket_is_shared_across_instances(tmp_path):
+    db_path = str(tmp_path / "rates" / "budget.db")
+    first = SharedTokenBucket(60, db_path, "gemini", capacity=2)
+    second = SharedTokenBucket(60, db_path, "gemini", capacity=2)
+    other = SharedTokenBucket(60, db_path, "openai", capacity=2)
+    assert first._take() == 0
+    assert second._take() == 0
+    assert first._take() > 0
+    assert other._take() == 0
+
+def test_shared_bucket_pause_holds_every_instance_back(tmp_path):
+    db_path = str(tmp_path / "budget.db")
+    first = SharedTokenBucket(6000, db_path, "gemini", capacity=10)
+    second = SharedTokenBucket(6000, db_path, "gemini", capacity=10)
+    first.pause(5)
+    assert 4.9 < second._take() <= 5
+
+def test_breaker_opens_after_repeated_failures():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+def test_breaker_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+
+def test_breaker_lets_one_trial_through_after_the_cooldown():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow() # Only one trial at a time
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+def test_released_trial_lets_the_next_caller_try():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
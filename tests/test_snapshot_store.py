@@ -0,0 +1,101 @@
+import os
+import itertools
+import pytest
+import snapshot_store
+from snapshot_store import SnapshotStore, summary_counts
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Strictly increasing timestamps, so "newest" never depends on the clock's resolution
+    clock = itertools.count(1000)
+    monkeypatch.setattr(snapshot_store.time, "time", lambda: float(next(clock)))
+    project = tmp_path / "project"
+    (project / "pkg").mkdir(parents=True)
+    (project / "main.py").write_text("print('v1')\n")
+    (project / "pkg" / "util.py").write_text("X = 1\n")
+    return SnapshotStore(str(project), store_dir=str(tmp_path / "store"))
+
+def read(store, relative):
+    with open(os.path.join(store.project_dir, relative)) as f:
+        return f.read()
+
+def write(store, relative, content):
+    path = os.path.join(store.project_dir, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+def test_unchanged_project_gets_the_same_id(store):
+    assert store.checkpoint() == store.checkpoint()
+
+def test_restore_rewrites_changed_and_recreates_deleted_files(store):
+    first = store.checkpoint("v1")
+    write(store, "main.py", "print('v2')\n")
+    os.remove(os.path.join(store.project_dir, "pkg", "util.py"))
+    store.checkpoint("v2")
+
+    changed = store.restore(first)
+    assert sorted(changed) == ["main.py", "pkg/util.py"]
+    assert read(store, "main.py") == "print('v1')\n"
+    assert read(store, "pkg/util.py") == "X = 1\n"
+    assert store.checkpoint() == first
+
+def test_restore_deletes_files_the_snapshot_does_not_have(store):
+    first = store.checkpoint()
+    write(store, "pkg/extra.py", "Y = 2\n")
+    assert store.restore(first) == ["pkg/extra.py"]
+    assert not os.path.exists(os.path.join(store.project_dir, "pkg", "extra.py"))
+
+def test_restore_of_the_current_state_changes_nothing(store):
+    first = store.checkpoint()
+    assert store.restore(first) == []
+
+def test_restore_unknown_snapshot_raises(store):
+    with pytest.raises(KeyError):
+        store.restore("0" * 16)
+
+def test_caches_are_not_snapshotted(store):
+    write(store, "__pycache__/main.cpython-311.pyc", "junk")
+    write(store, ".git/HEAD", "ref: refs/heads/main\n")
+    assert sorted(store.scan()) == ["main.py", "pkg/util.py"]
+
+def test_prune_keeps_the_newest_snapshots_and_their_objects(store):
+    ids = []
+    for version in range(4):
+        write(store, "main.py", f"print('v{version}')\n")
+        ids.append(store.checkpoint())
+
+    assert store.prune(keep=2) == 2
+    assert [s["id"] for s in store.list()] == [ids[3], ids[2]]
+    objects = {name for _, _, names in os.walk(store.objects_dir) for name in names}
+    kept = {digest for snapshot_id in ids[2:] for digest in store.load(snapshot_id)["files"].values()}
+    assert objects == kept
+
+    store.restore(ids[2])
+    assert read(store, "main.py") == "print('v2')\n"
+    assert store.prune(keep=2) == 0
+
+def test_recheckpointing_an_old_state_makes_it_newest(store):
+    first = store.checkpoint()
+    write(store, "main.py", "print('v2')\n")
+    store.checkpoint()
+    store.restore(first)
+    store.checkpoint()
+    store.prune(keep=1)
+    assert [s["id"] for s in store.list()] == [first]
+
+def test_summary_counts_reads_the_last_summary_line():
+    output = (
+        "test_main.py F..\n"
+        "FAILED test_main.py::test_total - assert 1 == 2\n"
+        "==== 1 failed, 6 passed, 2 warnings, 1 error in 0.12s ====\n"
+    )
+    assert summary_counts(output) == {"failed": 1, "passed": 6, "warning": 2, "error": 1}
+
+def test_summary_counts_quiet_and_plural_forms():
+    assert summary_counts("..\n2 passed, 3 errors in 1.50s\n") == {"passed": 2, "error": 3}
+
+def test_summary_counts_ignores_lines_that_only_look_like_summaries():
+    output = "assert '1 passed in 0.1s' == ''\n"
+    assert summary_counts(output) == {}
+    assert summary_counts("collected 0 items\n") == {}
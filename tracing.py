@@ -0,0 +1,286 @@
+"""
+Span-based timing for the engine.
+
+Wrap a piece of work in `with tracing.span("name", key=value) as s:` (or decorate a
+function with `@tracing.traced("name")`) and, when it ends, one JSON line is appended to
+TRACE_FILE: its name, start, duration, outcome ("ok", "failed" or "error"), parent span
+and attributes such as bytes, tokens and retries. Spans nest within a thread through
+contextvars, and scripts started with `child_env()` join their parent's trace, so one
+`develop` or `batch` run is one trace even across processes.
+
+    python tracing.py summary [trace_id]            time per span name (default: last trace)
+    python tracing.py chrome <out.json> [trace_id]  write a Chrome trace (chrome://tracing, Perfetto)
+
+Set RDE_CHROME_TRACE=<path> to have the top-level process write the Chrome trace on exit.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import threading
+import functools
+import contextlib
+import contextvars
+
+# --- CONFIGURATION ---
+ENGINE_ROOT = os.path.dirname(os.path.abspath(__file__))
+TRACE_ENABLED = os.environ.get("RDE_TRACE", "1").lower() not in ("0", "false", "no")
+TRACE_FILE = os.environ.get("RDE_TRACE_FILE", os.path.join(ENGINE_ROOT, "persistency", "cache", "trace.jsonl"))
+CHROME_TRACE_FILE = os.environ.get("RDE_CHROME_TRACE")
+# The trace file is moved aside to TRACE_FILE.1 when a new trace starts and it is larger than this
+TRACE_MAX_BYTES = 20 * 1024 * 1024
+
+# Environment variables that carry the trace into child processes
+TRACE_ID_ENV = "RDE_TRACE_ID"
+PARENT_SPAN_ENV = "RDE_TRACE_PARENT"
+
+_current = contextvars.ContextVar("rde_trace_span", default=None)
+_write_lock = threading.Lock()
+_is_root = TRACE_ID_ENV not in os.environ
+_trace_id = os.environ.get(TRACE_ID_ENV) or uuid.uuid4().hex[:16]
+_remote_parent = os.environ.get(PARENT_SPAN_ENV)
+_rotated = False
+
+class Span:
+    """One timed piece of work. `set` records attributes, `add` increments counters."""
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.outcome = "ok"
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, amount=1):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def to_record(self, duration):
+        return {
+            "trace_id": _trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration": round(duration, 6),
+            "outcome": self.outcome,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "thread_id": threading.get_ident(),
+            "attributes": self.attributes,
+        }
+
+class _NullSpan:
+    """Stands in for a span when tracing is off."""
+    span_id = None
+    outcome = "ok"
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name, amount=1):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def _write(record):
+    """Appends one span to the trace file; a failing trace file disables tracing, never the run."""
+    global TRACE_ENABLED, _rotated
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(TRACE_FILE)), exist_ok=True)
+            if _is_root and not _rotated:
+                _rotated = True
+                if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_MAX_BYTES:
+                    os.replace(TRACE_FILE, TRACE_FILE + ".1")
+            # One write per line in append mode, so spans from concurrent processes do not interleave
+            with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            TRACE_ENABLED = False
+            print(f"Tracing disabled, could not write {TRACE_FILE}: {e}")
+
+def current_span():
+    """Returns the innermost active span of this thread, or a no-op span."""
+    return _current.get() or _NULL_SPAN
+
+def annotate(**attributes):
+    """Sets attributes on the innermost active span."""
+    current_span().set(**attributes)
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Times the enclosed block as a child of the current span. An exception marks the span
+    as "error" (and propagates); set `s.outcome = "failed"` for work that ran but failed.
+    """
+    if not TRACE_ENABLED:
+        yield _NULL_SPAN
+        return
+    parent = _current.get()
+    current = Span(name, parent.span_id if parent else _remote_parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.outcome = "error"
+        current.attributes.setdefault("error", f"{type(e).__name__}: {e}"[:300])
+        raise
+    finally:
+        _current.reset(token)
+        _write(current.to_record(time.perf_counter() - current._started))
+
+def traced(name=None, record=()):
+    """
+    Decorator form of `span`. If the function returns a dict, the keys in `record` are
+    copied onto the span, and a false "success" marks it as "failed".
+    """
+    def decorate(function):
+        span_name = name or f"{function.__module__}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name) as current:
+                result = function(*args, **kwargs)
+                if isinstance(result, dict):
+                    current.set(**{key: result[key] for key in record if key in result})
+                    if result.get("success") is False:
+                        current.outcome = "failed"
+                return result
+        return wrapper
+    return decorate
+
+def record_span(name, started, outcome="ok", **attributes):
+    """
+    Records work that already finished, timed from `started` (a time.perf_counter()
+    value), as a child of the current span. For work that cannot hold a `with` block
+    open, such as a generator that yields to its caller.
+    """
+    if not TRACE_ENABLED:
+        return
+    duration = time.perf_counter() - started
+    parent = _current.get()
+    finished = Span(name, parent.span_id if parent else _remote_parent, attributes)
+    finished.start = time.time() - duration
+    finished.outcome = outcome
+    _write(finished.to_record(duration))
+
+def in_context(function):
+    """Wraps `function` to run in a copy of the caller's context, so spans opened in a worker thread keep their parent."""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function)
+
+def child_env(env=None):
+    """Returns a copy of `env` (default: os.environ) that makes a child process join this trace."""
+    env = dict(os.environ if env is None else env)
+    if TRACE_ENABLED:
+        env[TRACE_ID_ENV] = _trace_id
+        parent = _current.get()
+        if parent is not None:
+            env[PARENT_SPAN_ENV] = parent.span_id
+    return env
+
+# --- READING TRACES ---
+def load_spans(trace_file=TRACE_FILE, trace_id=None):
+    """
+    Returns the spans of one trace from the trace file, in the order they ended. Without
+    `trace_id`, the trace of the last span written is used.
+    """
+    spans = []
+    try:
+        with open(trace_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue # A line cut short by a crash
+    except OSError:
+        return []
+    if not spans:
+        return []
+    trace_id = trace_id or spans[-1]["trace_id"]
+    return [s for s in spans if s["trace_id"] == trace_id]
+
+def summarize(spans):
+    """Aggregates spans by name: count, total/p50/p95/max seconds, errors and summed token and byte counts."""
+    by_name = {}
+    for s in spans:
+        by_name.setdefault(s["name"], []).append(s)
+    rows = []
+    for name, group in by_name.items():
+        durations = sorted(s["duration"] for s in group)
+        row = {
+            "name": name,
+            "count": len(group),
+            "total": sum(durations),
+            "p50": durations[len(durations) // 2],
+            "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            "max": durations[-1],
+            "not_ok": sum(1 for s in group if s["outcome"] != "ok"),
+        }
+        for key in ("tokens_in", "tokens_out", "bytes_in", "bytes_out", "retries"):
+            values = [s["attributes"][key] for s in group if isinstance(s["attributes"].get(key), (int, float))]
+            if values:
+                row[key] = sum(values)
+        rows.append(row)
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+def export_chrome_trace(output_path, trace_file=TRACE_FILE, trace_id=None):
+    """Writes one trace in the Chrome trace event format. Returns the number of spans written."""
+    spans = load_spans(trace_file, trace_id)
+    events = []
+    for s in spans:
+        events.append({
+            "name": s["name"],
+            "cat": s["name"].split(".")[0],
+            "ph": "X",
+            "ts": s["start"] * 1e6,
+            "dur": s["duration"] * 1e6,
+            "pid": s["pid"],
+            "tid": s["thread_id"],
+            "args": dict(s["attributes"], outcome=s["outcome"]),
+        })
+    threads = {(s["pid"], s["thread_id"]): s["thread"] for s in spans}
+    for (pid, thread_id), thread_name in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}})
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(spans)
+
+def _export_chrome_trace_at_exit():
+    if TRACE_ENABLED and CHROME_TRACE_FILE and _is_root:
+        try:
+            count = export_chrome_trace(CHROME_TRACE_FILE, TRACE_FILE, _trace_id)
+            if count:
+                print(f"Chrome trace with {count} spans written to {CHROME_TRACE_FILE}")
+        except OSError as e:
+            print(f"Could not write Chrome trace: {e}")
+
+atexit.register(_export_chrome_trace_at_exit)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "summary"
+    if command == "summary":
+        spans = load_spans(trace_id=sys.argv[2] if len(sys.argv) > 2 else None)
+        if not spans:
+            print(f"No spans in {TRACE_FILE}.")
+            sys.exit(0)
+        print(f"Trace {spans[0]['trace_id']}: {len(spans)} spans")
+        print(f"{'span':<32} {'count':>5} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'!ok':>4}  tokens in/out")
+        for row in summarize(spans):
+            tokens = f"{row.get('tokens_in', '-')}/{row.get('tokens_out', '-')}"
+            print(f"{row['name']:<32} {row['count']:>5} {row['total']:>9.3f} {row['p50']:>8.3f} "
+                  f"{row['p95']:>8.3f} {row['max']:>8.3f} {row['not_ok']:>4}  {tokens}")
+    elif command == "chrome" and len(sys.argv) > 2:
+        count = export_chrome_trace(sys.argv[2], trace_id=sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"Wrote {count} spans to {sys.argv[2]}")
+    else:
+        print("Usage: python tracing.py summary [trace_id] | chrome <output.json> [trace_id]")
@@ -0,0 +1,253 @@
+"""
+Fast pre-verification stages and resource limits for the self-healing loop.
+
+Most broken fixes can be recognized long before a test suite finishes. mcp.py checks
+the files an edit changed in cheap stages first and stops at the first one that fails:
+
+    compile   each changed Python file is compiled in-process (milliseconds)
+    import    the changed modules are imported in a child process (tens of milliseconds)
+    impact    the affected tests run with -x, stopping at the first failure
+    full      the whole suite
+
+Every child process runs in its own process group under a wall-clock timeout and
+resource limits (CPU seconds, memory, file size), so a fix that loops forever, eats
+memory or fills the disk is killed and reported like any other failure.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import importlib
+import traceback
+import subprocess
+try:
+    import resource
+except ImportError: # Not available on Windows; the limits are skipped there
+    resource = None
+
+# --- CONFIGURATION ---
+GATE_SCRIPT = os.path.abspath(__file__)
+# Import the changed modules before running any tests
+IMPORT_CHECK = os.environ.get("RDE_IMPORT_CHECK", "1").lower() not in ("0", "false", "no")
+# Wall-clock seconds per stage before its process group is killed
+STAGE_TIMEOUTS = {
+    "import": float(os.environ.get("RDE_IMPORT_TIMEOUT", "15")),
+    "impact": float(os.environ.get("RDE_IMPACT_TIMEOUT", "120")),
+    "full": float(os.environ.get("RDE_PYTEST_TIMEOUT", "600")),
+}
+# Resource limits for every verification process (0 disables a limit). The memory limit
+# is headroom on top of what the process has already mapped when the limits are applied,
+# so a warm worker with large preloaded dependencies is not penalized for them.
+CPU_SECONDS = int(os.environ.get("RDE_VERIFY_CPU_SECONDS", "600"))
+MEMORY_MB = int(os.environ.get("RDE_VERIFY_MEMORY_MB", "4096"))
+FILE_SIZE_MB = int(os.environ.get("RDE_VERIFY_FILE_MB", "1024"))
+# Exit status reported for a stage that ran out of time, as with coreutils' timeout
+TIMEOUT_RETURNCODE = 124
+
+class VerificationResult(subprocess.CompletedProcess):
+    """
+    The outcome of a staged verification: the returncode, stdout and stderr of the stage
+    that decided it (the first one that failed, else the last one), plus `stages`, one
+    record {"stage", "status", "seconds", "returncode"} per stage that ran.
+    """
+
+    def __init__(self, result, stages):
+        super().__init__(result.args, result.returncode, result.stdout, result.stderr)
+        self.stages = stages
+
+    @property
+    def failed_stage(self):
+        return next((stage["stage"] for stage in self.stages if stage["status"] != "passed"), None)
+
+def stage_record(stage, result, seconds):
+    """Summarizes one stage's CompletedProcess for VerificationResult.stages."""
+    if result.returncode == 0:
+        status = "passed"
+    elif result.returncode == TIMEOUT_RETURNCODE:
+        status = "timeout"
+    else:
+        status = "failed"
+    return {"stage": stage, "status": status, "seconds": round(seconds, 4), "returncode": result.returncode}
+
+def describe(stages):
+    """One line per verification run, e.g. "compile passed (0.002s), import failed (0.041s)"."""
+    return ", ".join(f"{stage['stage']} {stage['status']} ({stage['seconds']:.3f}s)" for stage in stages)
+
+# --- RESOURCE LIMITS ---
+def _mapped_bytes():
+    """Returns the process's current virtual memory size, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _lower_limit(kind, soft, hard=None):
+    """Lowers a resource limit; a limit can only be lowered, never raised above the current hard one."""
+    _, current_hard = resource.getrlimit(kind)
+    hard = soft if hard is None else hard
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    try:
+        resource.setrlimit(kind, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+def apply_limits():
+    """Applies the configured limits to the current process. Call it in the child, never in the engine."""
+    if resource is None:
+        return
+    if CPU_SECONDS > 0:
+        # SIGXCPU at the soft limit, SIGKILL a little later if that is ignored
+        _lower_limit(resource.RLIMIT_CPU, CPU_SECONDS, CPU_SECONDS + 5)
+    if MEMORY_MB > 0 and hasattr(resource, "RLIMIT_AS"):
+        _lower_limit(resource.RLIMIT_AS, _mapped_bytes() + MEMORY_MB * 1024 * 1024)
+    if FILE_SIZE_MB > 0:
+        _lower_limit(resource.RLIMIT_FSIZE, FILE_SIZE_MB * 1024 * 1024)
+
+def kill_group(pid):
+    """Kills a process and everything it started in its process group."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (OSError, AttributeError):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+def explain_exit(result, stage, timeout=None, timed_out=False):
+    """
+    Turns a timeout or a kill by signal into a failure the AI can act on: the stage's
+    output so far plus a note on what happened. Other results are returned unchanged.
+    """
+    if timed_out:
+        note = (f"\n[verification] The {stage} stage did not finish within {timeout:g}s and was killed. "
+                "The code probably loops forever or waits for something that never happens.\n")
+        return subprocess.CompletedProcess(result.args, TIMEOUT_RETURNCODE, (result.stdout or "") + note, result.stderr)
+    if result.returncode is not None and result.returncode < 0:
+        try:
+            name = signal.Signals(-result.returncode).name
+        except ValueError:
+            name = f"signal {-result.returncode}"
+        note = f"\n[verification] The {stage} stage was killed by {name}."
+        if name == "SIGXCPU":
+            note += f" It used more than {CPU_SECONDS} CPU seconds."
+        return subprocess.CompletedProcess(result.args, result.returncode, (result.stdout or "") + note + "\n", result.stderr)
+    return result
+
+def run_limited(command, stage, cwd=None, env=None, timeout=None, cancel_event=None):
+    """
+    Runs a command from this module's command line (see the bottom of the file) in a new
+    process group under the resource limits. The group is killed after `timeout` seconds
+    or once `cancel_event` is set. Returns the CompletedProcess, or None if cancelled.
+    """
+    process = subprocess.Popen(
+        command, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        start_new_session=hasattr(os, "setsid"),
+    )
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        wait = 0.1 if cancel_event is not None else None
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            wait = remaining if wait is None else min(wait, remaining)
+        try:
+            stdout, stderr = process.communicate(timeout=wait)
+            return explain_exit(subprocess.CompletedProcess(command, process.returncode, stdout, stderr), stage)
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                kill_group(process.pid)
+                process.communicate()
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                kill_group(process.pid)
+                stdout, stderr = process.communicate()
+                return explain_exit(subprocess.CompletedProcess(command, process.returncode, stdout, stderr), stage, timeout, timed_out=True)
+
+def limited_command(kind, arguments):
+    """The command line that runs `kind` ("pytest" or "import") under the resource limits."""
+    return [sys.executable, GATE_SCRIPT, kind] + list(arguments)
+
+# --- COMPILE STAGE ---
+def compile_files(paths):
+    """
+    Compiles each Python file in-process, which catches everything ast.parse does plus
+    the errors only the compiler reports (e.g. `return` outside a function). Returns a
+    CompletedProcess with returncode 2 and one located error per broken file on failure.
+    """
+    errors = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                compile(f.read(), path, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            errors.append(f"{path}:{e.lineno or 0}: {type(e).__name__}: {e.msg}")
+            if e.text:
+                errors.append(f"    {e.text.rstrip()}")
+        except (OSError, ValueError) as e:
+            errors.append(f"{path}: {e}")
+    stdout = "".join(line + "\n" for line in errors)
+    return subprocess.CompletedProcess(["compile"] + list(paths), 2 if errors else 0, stdout, "")
+
+# --- IMPORT STAGE ---
+def is_test_file(path):
+    name = os.path.basename(path)
+    return name.startswith("test_") or name.endswith("_test.py") or name == "conftest.py"
+
+def module_for(path):
+    """
+    Returns (sys.path entry, dotted module name) for a Python file, found the way pytest's
+    default import mode finds them: the first directory up without an __init__.py is the root.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    parts = [] if name == "__init__.py" else [name[:-3]]
+    while os.path.exists(os.path.join(directory, "__init__.py")):
+        directory, package = os.path.split(directory)
+        parts.insert(0, package)
+    return directory, ".".join(parts)
+
+def import_entries(paths):
+    """
+    The (root, module) pairs the import stage checks for a set of changed files. Test
+    files are left to pytest, which imports them with its own path setup.
+    """
+    entries = []
+    for path in paths:
+        if path.endswith(".py") and not is_test_file(path) and os.path.exists(path):
+            root, module = module_for(path)
+            if module and [root, module] not in entries:
+                entries.append([root, module])
+    return entries
+
+def import_modules(entries):
+    """
+    Child side of the import stage: imports every (root, module) entry and prints the
+    traceback of each one that fails. Returns the exit code.
+    """
+    failed = 0
+    for root, module in entries:
+        if root not in sys.path:
+            sys.path.insert(0, root)
+        try:
+            importlib.import_module(module)
+        except BaseException: # SystemExit and KeyboardInterrupt at import time are failures too
+            print(f"Importing {module} failed:")
+            traceback.print_exc(file=sys.stdout)
+            failed += 1
+    sys.stdout.flush()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    # Started by run_limited: behave like `python -m`, with the working directory on the path
+    sys.path[0] = os.getcwd()
+    apply_limits()
+    kind, arguments = sys.argv[1], sys.argv[2:]
+    if kind == "pytest":
+        import pytest
+        sys.argv = ["pytest"] + arguments
+        sys.exit(pytest.console_main())
+    elif kind == "import":
+        sys.exit(import_modules(json.loads(arguments[0])))
+    print(f"Unknown verification command: {kind}", file=sys.stderr)
+    sys.exit(2)
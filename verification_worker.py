@@ -0,0 +1,213 @@
+"""
+A long-lived pytest worker for the self-healing loop.
+
+The worker imports pytest, its plugins and the project's third-party dependencies
+once. For every verification request it forks a child from that warm parent. The
+child runs `pytest.main` and exits, so each run imports the project's own modules
+fresh, with no reload bookkeeping, while skipping interpreter start-up and plugin
+discovery. Requests and results travel as JSON lines over the worker's stdin/stdout.
+
+The child runs in its own process group under verification_gate's resource limits and
+is killed with its group when a request's timeout expires. The worker also serves the
+import stage: a child that only imports the changed modules.
+"""
+import os
+import sys
+import ast
+import json
+import atexit
+import tempfile
+import contextlib
+import importlib
+import subprocess
+import threading
+import verification_gate
+
+# --- CONFIGURATION ---
+WORKER_SCRIPT = os.path.abspath(__file__)
+# Import the project's third-party dependencies in the warm parent, not per run
+PRELOAD_PROJECT_IMPORTS = True
+
+def is_supported():
+    """The warm worker relies on fork(); elsewhere verification runs cold."""
+    return hasattr(os, "fork")
+
+# --- WORKER SIDE ---
+def _local_module_names(project_dir):
+    """Returns the top-level module and package names defined inside the project."""
+    names = set()
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != "__pycache__"]
+        names.update(d for d in dirs)
+        names.update(os.path.splitext(f)[0] for f in files if f.endswith(".py"))
+    return names
+
+def _project_dependencies(project_dir):
+    """Returns the top-level modules the project imports that live outside the project."""
+    local = _local_module_names(project_dir)
+    dependencies = set()
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != "__pycache__"]
+        for name in files:
+            if not name.endswith(".py"):
+                continue
+            try:
+                with open(os.path.join(root, name), 'r', encoding='utf-8') as f:
+                    tree = ast.parse(f.read())
+            except (OSError, SyntaxError, ValueError):
+                continue
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    dependencies.update(alias.name.split(".")[0] for alias in node.names)
+                elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                    dependencies.add(node.module.split(".")[0])
+    return dependencies - local
+
+def _preload(project_dir):
+    """Imports pytest, its entry-point plugins and the project's dependencies."""
+    import pytest
+    import _pytest.config # Builds the plugin manager and imports the built-in plugins
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group="pytest11"):
+        try:
+            entry_point.load()
+        except Exception:
+            pass
+
+    if PRELOAD_PROJECT_IMPORTS and os.path.isdir(project_dir):
+        for module_name in sorted(_project_dependencies(project_dir)):
+            try:
+                importlib.import_module(module_name)
+            except Exception:
+                pass # The test run reports missing or broken dependencies itself
+
+def _run_forked(function, cwd, timeout=None):
+    """
+    Runs `function()` in a forked child and returns (returncode, stdout, stderr, timed out).
+    The child's return value is its exit code.
+    """
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                os.setpgid(0, 0)
+                os.dup2(out.fileno(), 1)
+                os.dup2(err.fileno(), 2)
+                os.chdir(cwd)
+                verification_gate.apply_limits()
+                code = int(function())
+            except BaseException as e:
+                print(f"Verification worker child failed: {e!r}", file=sys.stderr)
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        try:
+            os.setpgid(pid, pid) # Also set here, so a kill right after the fork reaches the group
+        except OSError:
+            pass
+        expired = threading.Event()
+        timer = None
+        if timeout:
+            def expire():
+                expired.set()
+                verification_gate.kill_group(pid)
+            timer = threading.Timer(timeout, expire)
+            timer.start()
+        _, status = os.waitpid(pid, 0)
+        if timer is not None:
+            timer.cancel()
+            timer.join()
+        returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        return returncode, out.read().decode("utf-8", "replace"), err.read().decode("utf-8", "replace"), expired.is_set()
+
+def serve(project_dir):
+    """Worker main loop: one JSON request per stdin line, one JSON result per stdout line."""
+    # stdout is the reply channel, so keep import-time prints from corrupting it
+    with contextlib.redirect_stdout(sys.stderr):
+        _preload(project_dir)
+    import pytest
+    print(json.dumps({"ready": True}), flush=True)
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if request.get("kind") == "import":
+            function = lambda: verification_gate.import_modules(request["args"])
+        else:
+            function = lambda: pytest.main(list(request["args"]))
+        returncode, stdout, stderr, timed_out = _run_forked(function, request.get("cwd") or os.getcwd(), request.get("timeout"))
+        print(json.dumps({"returncode": returncode, "stdout": stdout, "stderr": stderr, "timed_out": timed_out}), flush=True)
+
+# --- CLIENT SIDE ---
+_worker = None
+_worker_lock = threading.Lock()
+
+def _start_worker(project_dir):
+    """Starts the worker process and waits until it has finished preloading."""
+    process = subprocess.Popen(
+        [sys.executable, WORKER_SCRIPT, project_dir],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        cwd=os.getcwd(),
+    )
+    ready = process.stdout.readline()
+    if not ready or not json.loads(ready).get("ready"):
+        process.kill()
+        raise RuntimeError("Verification worker failed to start.")
+    return process
+
+def run_in_worker(args, project_dir, cwd=None, timeout=None, kind="pytest", stage="full"):
+    """
+    Runs `pytest <args>` in the warm worker and returns a subprocess.CompletedProcess.
+    With `kind="import"`, `args` are verification_gate.import_entries to import instead.
+    The run is killed after `timeout` seconds. The worker is started on first use and
+    restarted if it has died.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or _worker.poll() is not None:
+            _worker = _start_worker(project_dir)
+        try:
+            request = {"kind": kind, "args": list(args), "cwd": cwd or os.getcwd(), "timeout": timeout}
+            _worker.stdin.write(json.dumps(request) + "\n")
+            _worker.stdin.flush()
+            reply = _worker.stdout.readline()
+            if not reply:
+                raise RuntimeError("Verification worker exited unexpectedly.")
+            result = json.loads(reply)
+        except (OSError, ValueError, RuntimeError):
+            _worker.kill()
+            _worker = None
+            raise
+    if kind == "import":
+        command = verification_gate.limited_command("import", [json.dumps(list(args))])
+    else:
+        command = [sys.executable, "-m", "pytest"] + list(args)
+    completed = subprocess.CompletedProcess(command, result["returncode"], result["stdout"], result["stderr"])
+    return verification_gate.explain_exit(completed, stage, timeout, result.get("timed_out", False))
+
+def stop_worker():
+    """Stops the worker process, if one is running."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            try:
+                _worker.stdin.close()
+                _worker.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                _worker.kill()
+            _worker = None
+
+atexit.register(stop_worker)
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else "project")